@@ -0,0 +1,234 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Measures how much batching requests by length (mozmlops.batching) helps
+on a workload of mostly short and some long text requests, compared with
+batching them in arrival order:
+
+- offline: the throughput of running all requests in batches, both as the
+  Ray Serve template's default handler does (each arrival-order batch run
+  through handle_bucketed, split at MAX_BATCH_TOKENS) and bucketing the
+  whole workload at once
+- online: the throughput and p50/p99 latency of AdaptiveBatcher serving
+  requests that arrive at a steady random rate
+
+The default model is a small NumPy encoder whose cost, like a transformer's,
+grows with the padded size of the batch. With transformers and torch
+installed, --model t5-small runs the translation pipeline of the Ray Serve
+template instead.
+
+Run it with `python benchmarks/bench_batching.py`; add --quick for a short
+run. Results are printed and, with --output, written as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mozmlops.batching import AdaptiveBatchController, AdaptiveBatcher, handle_bucketed
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while translators batch requests".split()
+)
+
+# The default max_batch_tokens of the Ray Serve template
+MAX_BATCH_TOKENS = 512
+
+SIZES = {
+    "full": {"requests": 1024, "batch_size": 16, "rate": 400, "online_requests": 2000},
+    "quick": {"requests": 256, "batch_size": 16, "rate": 400, "online_requests": 400},
+}
+
+
+class NumpyEncoder:
+    """
+    A two-layer encoder over padded token embeddings, mean-pooled:
+    a stand-in for a small transformer that runs anywhere.
+    """
+
+    def __init__(self, dim: int = 256, vocab: int = 1000, seed: int = 0):
+        generator = np.random.default_rng(seed)
+        self.vocab = vocab
+        self.embeddings = generator.standard_normal((vocab, dim), dtype=np.float32)
+        self.layers = [
+            generator.standard_normal((dim, dim), dtype=np.float32) / np.sqrt(dim)
+            for _ in range(2)
+        ]
+
+    def tokens(self, text: str) -> list[int]:
+        return [hash(word) % self.vocab for word in text.split()]
+
+    def __call__(self, texts: list[str]) -> list[float]:
+        tokenized = [self.tokens(text) for text in texts]
+        padded = np.zeros((len(texts), max(map(len, tokenized))), dtype=np.int64)
+        mask = np.zeros(padded.shape, dtype=np.float32)
+        for i, tokens in enumerate(tokenized):
+            padded[i, : len(tokens)] = tokens
+            mask[i, : len(tokens)] = 1
+        hidden = self.embeddings[padded]
+        for layer in self.layers:
+            hidden = np.tanh(hidden @ layer)
+        pooled = (hidden * mask[..., None]).sum(axis=1) / mask.sum(axis=1)[:, None]
+        return pooled[:, 0].tolist()
+
+    def length(self, text: str) -> int:
+        return len(text.split())
+
+
+class TranslationModel:
+    def __init__(self, model: str):
+        from transformers import pipeline
+
+        self.pipeline = pipeline("translation_en_to_fr", model=model)
+
+    def __call__(self, texts: list[str]) -> list[str]:
+        outputs = self.pipeline(texts, batch_size=len(texts))
+        return [output["translation_text"] for output in outputs]
+
+    def length(self, text: str) -> int:
+        return len(self.pipeline.tokenizer(text).input_ids)
+
+
+def make_workload(count: int, seed: int = 0) -> list[str]:
+    """
+    Mostly short requests, with one in five long enough to pad a batch
+    several times over.
+    """
+    generator = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        length = (
+            generator.randint(120, 200)
+            if generator.random() < 0.2
+            else generator.randint(4, 20)
+        )
+        texts.append(" ".join(generator.choice(WORDS) for _ in range(length)))
+    return texts
+
+
+def bench_offline(model, texts: list[str], batch_size: int) -> dict:
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        model(texts[i : i + batch_size])
+    arrival_order = time.perf_counter() - start
+
+    # What the Ray Serve template's default handler does with each batch
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i : i + batch_size]
+        handle_bucketed(
+            model,
+            batch,
+            model.length,
+            max_batch_size=len(batch),
+            max_batch_tokens=MAX_BATCH_TOKENS,
+        )
+    served = time.perf_counter() - start
+
+    start = time.perf_counter()
+    handle_bucketed(model, texts, model.length, max_batch_size=batch_size)
+    bucketed = time.perf_counter() - start
+
+    padded = sum(
+        max(map(model.length, texts[i : i + batch_size]))
+        * len(texts[i : i + batch_size])
+        for i in range(0, len(texts), batch_size)
+    )
+    return {
+        "offline_arrival_order_req_s": len(texts) / arrival_order,
+        "offline_served_req_s": len(texts) / served,
+        "offline_served_speedup": arrival_order / served,
+        "offline_bucketed_req_s": len(texts) / bucketed,
+        "offline_speedup": arrival_order / bucketed,
+        "arrival_order_padding_fraction": 1 - sum(map(model.length, texts)) / padded,
+    }
+
+
+async def _serve(batcher: AdaptiveBatcher, texts: list[str], rate: float) -> dict:
+    generator = random.Random(1)
+    latencies = []
+
+    async def request(text):
+        start = time.perf_counter()
+        await batcher.submit(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tasks = []
+    for text in texts:
+        tasks.append(asyncio.create_task(request(text)))
+        await asyncio.sleep(generator.expovariate(rate))
+    await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "req_s": len(texts) / seconds,
+        "p50_seconds": statistics.median(latencies),
+        "p99_seconds": latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+
+def bench_online(model, texts: list[str], batch_size: int, rate: float) -> dict:
+    results = {}
+    for name, length in (("arrival_order", None), ("bucketed", model.length)):
+        controller = AdaptiveBatchController(
+            target_p99_s=0.5, max_batch_size=batch_size, initial_batch_size=batch_size
+        )
+        batcher = AdaptiveBatcher(model, controller, length=length)
+        for metric, value in asyncio.run(_serve(batcher, texts, rate)).items():
+            results[f"online_{name}_{metric}"] = value
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", help="a translation model, e.g. t5-small")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = SIZES["quick" if args.quick else "full"]
+    model = TranslationModel(args.model) if args.model else NumpyEncoder()
+    # Warm up, so that the first measurements do not include lazy initialization.
+    model(make_workload(4, seed=2))
+
+    results = {
+        **bench_offline(model, make_workload(sizes["requests"]), sizes["batch_size"]),
+        **bench_online(
+            model,
+            make_workload(sizes["online_requests"], seed=3),
+            sizes["batch_size"],
+            sizes["rate"],
+        ),
+    }
+    for name, value in results.items():
+        print(f"{name:<40} {value:>12.4g}")
+    if args.output:
+        document = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "model": args.model or "numpy-encoder",
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
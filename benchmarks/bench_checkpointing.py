@@ -0,0 +1,187 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Measures what checkpointing costs a CPU training loop, with checkpoints
+stored in the background by mozmlops.checkpointing.CheckpointManager
+compared with storing them in the loop, and with not checkpointing at all.
+
+The model is a NumPy MLP trained with SGD on random data, so the
+benchmark needs no GPU or deep learning framework. Checkpoints go to one
+of the backends of bench_storage.py.
+
+Background checkpointing can only overlap with training given a spare
+core, or while the training thread waits on an accelerator; on a single
+core it can be no faster than storing in the loop. --device-seconds
+simulates the latter, by adding that much waiting to every step.
+
+Run it with `python benchmarks/bench_checkpointing.py`; add --quick for a
+short run. Results are printed and, with --output, written as JSON.
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+import uuid
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bench_storage import BACKENDS, storage_client
+from mozmlops.checkpointing import CheckpointManager
+
+SIZES = {
+    "full": {"width": 2048, "layers": 4, "batch": 512, "steps": 200, "every": 20},
+    "quick": {"width": 1024, "layers": 3, "batch": 256, "steps": 60, "every": 10},
+}
+
+
+class MLP:
+    """
+    A ReLU MLP with a squared error loss, trained with plain SGD.
+    """
+
+    def __init__(self, width: int, layers: int, seed: int = 0):
+        generator = np.random.default_rng(seed)
+        self.weights = [
+            generator.standard_normal((width, width), dtype=np.float32) / np.sqrt(width)
+            for _ in range(layers)
+        ]
+
+    def train_step(self, x, y, learning_rate: float = 1e-3):
+        activations = [x]
+        for weight in self.weights:
+            activations.append(np.maximum(activations[-1] @ weight, 0))
+        gradient = (activations[-1] - y) / len(x)
+        for i in reversed(range(len(self.weights))):
+            gradient = gradient * (activations[i + 1] > 0)
+            weight_gradient = activations[i].T @ gradient
+            gradient = gradient @ self.weights[i].T
+            self.weights[i] -= learning_rate * weight_gradient
+
+    def state(self) -> dict:
+        return {f"layer_{i}": weight for i, weight in enumerate(self.weights)}
+
+
+def snapshot(model: MLP) -> dict:
+    return {name: weight.copy() for name, weight in model.state().items()}
+
+
+def train(sizes: dict, checkpoint=None) -> tuple[float, float]:
+    """
+    Trains for sizes["steps"] steps. Returns the steps per second and the
+    longest step, including checkpointing, in seconds.
+    """
+    generator = np.random.default_rng(1)
+    model = MLP(sizes["width"], sizes["layers"])
+    x = generator.standard_normal((sizes["batch"], sizes["width"]), dtype=np.float32)
+    y = generator.standard_normal((sizes["batch"], sizes["width"]), dtype=np.float32)
+
+    longest = 0.0
+    start = time.perf_counter()
+    for step in range(sizes["steps"]):
+        step_start = time.perf_counter()
+        model.train_step(x, y)
+        # Stands in for the training thread waiting on an accelerator.
+        time.sleep(sizes["device_seconds"])
+        if checkpoint is not None:
+            checkpoint(step, model)
+        longest = max(longest, time.perf_counter() - step_start)
+    return sizes["steps"] / (time.perf_counter() - start), longest
+
+
+def bench_backend(backend: str, sizes: dict) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        with storage_client(backend, workdir) as client:
+            results["none_steps_s"], results["none_max_step_seconds"] = train(sizes)
+
+            prefix = uuid.uuid4().hex
+
+            def store_in_loop(step, model):
+                if (step + 1) % sizes["every"] == 0:
+                    buffer = io.BytesIO()
+                    pickle.dump(snapshot(model), buffer, pickle.HIGHEST_PROTOCOL)
+                    client.store(buffer.getvalue(), f"{prefix}/sync/step-{step}.ckpt")
+
+            (
+                results["in_loop_steps_s"],
+                results["in_loop_max_step_seconds"],
+            ) = train(sizes, store_in_loop)
+
+            manager = CheckpointManager(
+                client,
+                f"{prefix}/background",
+                every_steps=sizes["every"],
+                snapshot=snapshot,
+                local_directory=workdir,
+            )
+            (
+                results["background_steps_s"],
+                results["background_max_step_seconds"],
+            ) = train(sizes, manager.step)
+            manager.close()
+
+            results["checkpoint_mb"] = (
+                manager.stats.bytes / max(manager.stats.saved, 1) / 1e6
+            )
+            results["background_deferred_steps"] = manager.stats.deferred
+            results["background_blocking_seconds"] = manager.stats.blocking_seconds
+            results["in_loop_slowdown"] = (
+                1 - results["in_loop_steps_s"] / results["none_steps_s"]
+            )
+            results["background_slowdown"] = (
+                1 - results["background_steps_s"] / results["none_steps_s"]
+            )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=BACKENDS, action="append")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads")
+    parser.add_argument(
+        "--device-seconds",
+        type=float,
+        default=0.0,
+        help="add this much waiting on a simulated accelerator to every step",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = {
+        **SIZES["quick" if args.quick else "full"],
+        "device_seconds": args.device_seconds,
+    }
+    results = {
+        backend: bench_backend(backend, sizes) for backend in args.backend or ["local"]
+    }
+    for group, metrics in results.items():
+        for name, value in metrics.items():
+            print(f"{group:<10} {name:<30} {value:>12.4g}")
+    if args.output:
+        document = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "device_seconds": args.device_seconds,
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Compares the compression codecs in mozmlops.compression on data shaped
+like the artifacts our flows store.
+
+Run it with `python benchmarks/bench_compression.py`.
+Codecs whose packages are not installed are skipped.
+"""
+
+import time
+
+import numpy as np
+
+from mozmlops.compression import available_codecs, compress_chunks, get_codec
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def artifacts(rng) -> dict[str, bytes]:
+    """
+    Roughly 32 MB each of:
+    - dense float32 weights, as in a trained network's state dict
+    - weights after magnitude pruning, where most values are zero
+    - class predictions, like TemplateFlow's y_predictions
+    """
+    n = 8 * 1024 * 1024
+    weights = rng.normal(0, 0.05, n).astype(np.float32)
+    pruned = np.where(np.abs(weights) > 0.08, weights, 0).astype(np.float32)
+    predictions = rng.integers(0, 3, 4 * n).astype(np.uint8)
+    return {
+        "dense_weights": weights.tobytes(),
+        "pruned_weights": pruned.tobytes(),
+        "predictions": predictions.tobytes(),
+    }
+
+
+def measure(data: bytes, codec_name: str) -> dict:
+    codec = get_codec(codec_name)
+    chunks = (data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+
+    start = time.perf_counter()
+    compressed = b"".join(compress_chunks(chunks, codec))
+    compress_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decompressor = codec.decompressor()
+    restored = decompressor.decompress(compressed)
+    decompress_seconds = time.perf_counter() - start
+    assert restored == data
+
+    return {
+        "ratio": len(data) / len(compressed),
+        "compress_mb_s": len(data) / compress_seconds / 1e6,
+        "decompress_mb_s": len(data) / decompress_seconds / 1e6,
+    }
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(
+        f"{'artifact':<16} {'codec':<6} {'ratio':>7} "
+        f"{'compress MB/s':>14} {'decompress MB/s':>16}"
+    )
+    for artifact, data in artifacts(rng).items():
+        for codec_name in available_codecs():
+            result = measure(data, codec_name)
+            print(
+                f"{artifact:<16} {codec_name:<6} {result['ratio']:>7.2f} "
+                f"{result['compress_mb_s']:>14.1f} {result['decompress_mb_s']:>16.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
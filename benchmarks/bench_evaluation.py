@@ -0,0 +1,157 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Measures evaluating a classifier on a dataset streamed from storage with
+mozmlops.evaluation, compared with the image classifier example's loop of
+small batches and Python counters:
+
+- counters: batches of 4, accuracy counted in Python, in one process
+- vectorized: batches of 256 and ClassificationMetrics, in one process
+- parallel_N: the vectorized evaluation split into N shards, run by
+  evaluate_parallel() in N processes, as Metaflow foreach branches would
+
+The model is a NumPy MLP and the dataset a StreamingDataset in a local
+backend, so the benchmark needs no GPU, framework or GCS. Parallel
+evaluation only scales with the cores available: on one core, N
+processes take as long as one.
+
+Run it with `python benchmarks/bench_evaluation.py`; add --quick for a
+smaller dataset. Results are printed and, with --output, written as JSON.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.evaluation import batched, evaluate, evaluate_parallel
+from mozmlops.storage_backends import LocalFilesystemBackend
+from mozmlops.streaming_dataset import ShardWriter, StreamingDataset
+
+NUM_CLASSES = 10
+SIZES = {
+    "full": {"samples": 50_000, "features": 256, "width": 512},
+    "quick": {"samples": 10_000, "features": 256, "width": 256},
+}
+SHARD_COUNTS = (1, 2, 4)
+
+
+class MLP:
+    def __init__(self, features: int, width: int, seed: int = 0):
+        generator = np.random.default_rng(seed)
+        self.hidden = generator.standard_normal((features, width), dtype=np.float32)
+        self.output = generator.standard_normal((width, NUM_CLASSES), dtype=np.float32)
+
+    def __call__(self, inputs: np.ndarray) -> np.ndarray:
+        return np.maximum(inputs @ self.hidden, 0) @ self.output
+
+
+def write_dataset(storage_client: CloudStorageAPIClient, samples: int, features: int):
+    generator = np.random.default_rng(1)
+    with ShardWriter(storage_client, "eval", shard_bytes=1024 * 1024) as writer:
+        for _ in range(samples):
+            writer.write(
+                (
+                    generator.standard_normal(features, dtype=np.float32),
+                    int(generator.integers(NUM_CLASSES)),
+                )
+            )
+
+
+def _dataset(bucket: str, shard: int = 0, shards: int = 1) -> StreamingDataset:
+    return StreamingDataset(
+        CloudStorageAPIClient(backend=LocalFilesystemBackend(bucket)),
+        "eval",
+        rank=shard,
+        world_size=shards,
+    )
+
+
+def evaluate_shard(shard: int, shards: int, bucket: str, sizes: dict):
+    model = MLP(sizes["features"], sizes["width"])
+    return evaluate(batched(_dataset(bucket, shard, shards), 256), model, NUM_CLASSES)
+
+
+def evaluate_with_counters(bucket: str, sizes: dict) -> float:
+    model = MLP(sizes["features"], sizes["width"])
+    correct = 0
+    total = 0
+    for inputs, labels in batched(_dataset(bucket), 4):
+        predicted = model(inputs).argmax(axis=1)
+        for prediction, label in zip(predicted, labels):
+            total += 1
+            correct += int(prediction == label)
+    return correct / total
+
+
+def run(sizes: dict, workdir: str) -> dict:
+    bucket = os.path.join(workdir, "bucket")
+    write_dataset(
+        CloudStorageAPIClient(backend=LocalFilesystemBackend(bucket)),
+        sizes["samples"],
+        sizes["features"],
+    )
+
+    results = {}
+    start = time.perf_counter()
+    evaluate_with_counters(bucket, sizes)
+    results["counters_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evaluate_shard(0, 1, bucket, sizes)
+    results["vectorized_seconds"] = time.perf_counter() - start
+
+    for shards in SHARD_COUNTS:
+        start = time.perf_counter()
+        evaluate_parallel(
+            functools.partial(evaluate_shard, bucket=bucket, sizes=sizes),
+            shards=shards,
+            max_workers=shards,
+        )
+        results[f"parallel_{shards}_seconds"] = time.perf_counter() - start
+
+    results["vectorized_speedup"] = (
+        results["counters_seconds"] / results["vectorized_seconds"]
+    )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="a smaller dataset")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = SIZES["quick" if args.quick else "full"]
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(sizes, workdir)
+    for name, value in results.items():
+        print(f"{name:<40} {value:>12.4g}")
+    if args.output:
+        document = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Measures CloudStorageAPIClient throughput, latency, concurrency scaling,
+peak memory and import time without touching real GCS, against:
+
+- fake-gcs: the fake GCS server from tests/, in a separate process, which
+  exercises the whole HTTP path of GCSBackend over loopback
+- local: LocalFilesystemBackend in a temporary directory
+- memory: InMemoryBackend
+
+Run it with `python benchmarks/bench_storage.py`; add --quick for a short
+run. Results are printed and, with --output, written as JSON.
+
+To catch regressions, save a baseline on a quiet machine and compare
+later runs on the same machine against it:
+
+    python benchmarks/bench_storage.py --output baseline.json
+    python benchmarks/bench_storage.py --baseline baseline.json --tolerance 0.25
+
+The comparison exits with status 1 if any metric got worse than the
+baseline by more than the tolerance.
+
+Peak memory is measured with tracemalloc, so it covers memory allocated
+by Python code and not, for instance, buffers inside C extensions.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend, LocalFilesystemBackend
+
+BACKENDS = ("fake-gcs", "local", "memory")
+BUCKET_NAME = "bench-bucket"
+CONCURRENCY_LEVELS = (1, 2, 4, 8, 16)
+
+# Metrics with these suffixes are better when higher; all others when lower.
+HIGHER_IS_BETTER = ("_ops_s", "_mb_s")
+
+SIZES = {
+    "full": {
+        "small_count": 500,
+        "small_size": 1024,
+        "large_size": 256 * 1024 * 1024,
+        "concurrent_count": 256,
+        "concurrent_size": 64 * 1024,
+        "memory_size": 64 * 1024 * 1024,
+        "import_runs": 7,
+    },
+    "quick": {
+        "small_count": 50,
+        "small_size": 1024,
+        "large_size": 16 * 1024 * 1024,
+        "concurrent_count": 32,
+        "concurrent_size": 64 * 1024,
+        "memory_size": 16 * 1024 * 1024,
+        "import_runs": 3,
+    },
+}
+
+
+def _serve_fake_gcs(queue):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tests"))
+    from fake_gcs_server import FakeGCSServer
+
+    server = FakeGCSServer().start()
+    server.create_bucket(BUCKET_NAME)
+    queue.put(server.url)
+    # Serve until the parent terminates this process.
+    threading.Event().wait()
+
+
+@contextmanager
+def storage_client(backend: str, workdir: str):
+    """
+    Yields a client for one of BACKENDS, set up from scratch.
+    """
+    if backend == "local":
+        yield CloudStorageAPIClient(
+            backend=LocalFilesystemBackend(os.path.join(workdir, "bucket"))
+        )
+        return
+    if backend == "memory":
+        yield CloudStorageAPIClient(backend=InMemoryBackend())
+        return
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve_fake_gcs, args=(queue,))
+    server.start()
+    previous = os.environ.get("STORAGE_EMULATOR_HOST")
+    try:
+        os.environ["STORAGE_EMULATOR_HOST"] = queue.get(timeout=30)
+        yield CloudStorageAPIClient(
+            "bench-project", BUCKET_NAME, max_pool_size=max(CONCURRENCY_LEVELS)
+        )
+    finally:
+        if previous is None:
+            os.environ.pop("STORAGE_EMULATOR_HOST", None)
+        else:
+            os.environ["STORAGE_EMULATOR_HOST"] = previous
+        server.terminate()
+        server.join()
+
+
+def _write_file(path: str, size: int) -> str:
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(remaining, 8 * 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+
+def bench_small_objects(client, workdir: str, count: int, size: int) -> dict:
+    """
+    Sequential store() and fetch() of small objects: per-request overhead.
+    """
+    prefix = uuid.uuid4().hex
+    data = os.urandom(size)
+    store_latencies, fetch_latencies = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        client.store(data, f"{prefix}/{i}")
+        store_latencies.append(time.perf_counter() - start)
+    for i in range(count):
+        start = time.perf_counter()
+        client.fetch(f"{prefix}/{i}", os.path.join(workdir, "small"))
+        fetch_latencies.append(time.perf_counter() - start)
+    return {
+        "small_store_ops_s": count / sum(store_latencies),
+        "small_fetch_ops_s": count / sum(fetch_latencies),
+        "small_store_p50_seconds": statistics.median(store_latencies),
+        "small_fetch_p50_seconds": statistics.median(fetch_latencies),
+    }
+
+
+def bench_large_object(client, workdir: str, size: int) -> dict:
+    """
+    store_file() and fetch() of one large object: streaming throughput.
+    """
+    path = f"{uuid.uuid4().hex}/large"
+    local_path = _write_file(os.path.join(workdir, "large"), size)
+
+    start = time.perf_counter()
+    client.store_file(local_path, path)
+    store_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    client.fetch(path, os.path.join(workdir, "large.fetched"))
+    fetch_seconds = time.perf_counter() - start
+    return {
+        "large_store_mb_s": size / store_seconds / 1e6,
+        "large_fetch_mb_s": size / fetch_seconds / 1e6,
+    }
+
+
+def bench_concurrency(client, workdir: str, count: int, size: int) -> dict:
+    """
+    store_many() and fetch_many() at increasing concurrency: scaling curves.
+    """
+    results = {}
+    data = os.urandom(size)
+    for workers in CONCURRENCY_LEVELS:
+        prefix = uuid.uuid4().hex
+        items = [(data, f"{prefix}/{i}") for i in range(count)]
+        report = client.store_many(items, max_workers=workers)
+        results[f"store_many_w{workers}_ops_s"] = count / report.seconds
+
+        items = [
+            (f"{prefix}/{i}", os.path.join(workdir, "concurrent", prefix, str(i)))
+            for i in range(count)
+        ]
+        report = client.fetch_many(items, max_workers=workers)
+        results[f"fetch_many_w{workers}_ops_s"] = count / report.seconds
+    return results
+
+
+def bench_peak_memory(client, workdir: str, size: int) -> dict:
+    """
+    Peak Python memory while storing and fetching one object; streaming
+    transfers should stay near the chunk size, not the object size.
+    """
+    path = f"{uuid.uuid4().hex}/memory"
+    local_path = _write_file(os.path.join(workdir, "memory"), size)
+
+    def peak_mb(transfer) -> float:
+        tracemalloc.start()
+        try:
+            transfer()
+            return tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "store_file_peak_mb": peak_mb(lambda: client.store_file(local_path, path)),
+        "fetch_peak_mb": peak_mb(
+            lambda: client.fetch(path, os.path.join(workdir, "memory.fetched"))
+        ),
+    }
+
+
+def bench_import(runs: int) -> dict:
+    """
+    Time to import the client in a fresh interpreter: the cold start
+    cost every Metaflow task and Ray worker pays.
+    """
+    code = (
+        "import time; start = time.perf_counter(); "
+        "import mozmlops.cloud_storage_api_client; "
+        "print(time.perf_counter() - start)"
+    )
+    timings = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code], check=True, capture_output=True, text=True
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+    return {"import_seconds": statistics.median(timings)}
+
+
+def run(backends, sizes: dict) -> dict:
+    results = {"import": bench_import(sizes["import_runs"])}
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as workdir:
+            with storage_client(backend, workdir) as client:
+                # Connect before measuring, so that setup is not timed as a transfer.
+                client.store(b"", f"{uuid.uuid4().hex}/warm-up")
+                results[backend] = {
+                    **bench_small_objects(
+                        client, workdir, sizes["small_count"], sizes["small_size"]
+                    ),
+                    **bench_large_object(client, workdir, sizes["large_size"]),
+                    **bench_concurrency(
+                        client,
+                        workdir,
+                        sizes["concurrent_count"],
+                        sizes["concurrent_size"],
+                    ),
+                    **bench_peak_memory(client, workdir, sizes["memory_size"]),
+                }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Returns a description of every metric that is worse than in the
+    baseline by more than `tolerance`, a fraction of the baseline value.
+    """
+    regressions = []
+    for group, metrics in results.items():
+        for name, value in metrics.items():
+            expected = baseline.get(group, {}).get(name)
+            if not expected:
+                continue
+            if name.endswith(HIGHER_IS_BETTER):
+                change = (expected - value) / expected
+            else:
+                change = (value - expected) / expected
+            if change > tolerance:
+                regressions.append(
+                    f"{group}/{name}: {value:.4g} vs. {expected:.4g} in the baseline "
+                    f"({change:.0%} worse)"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=BACKENDS, action="append")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="how much worse than the baseline a metric may get (default: 0.2)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.backend or BACKENDS, SIZES["quick" if args.quick else "full"])
+    document = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+
+    for group, metrics in results.items():
+        for name, value in metrics.items():
+            print(f"{group:<10} {name:<28} {value:>12.4g}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Measures storing and loading model weights in the tensor format of
+mozmlops.tensor_format, compared with the torch.save() to BytesIO and
+torch.load() from BytesIO of the image classifier example:
+
+- save: the time, and the peak memory on top of the weights, to store
+  the weights
+- load: the time, and the peak memory, to load the stored weights from a
+  local file, and then to read every weight once
+
+Without torch installed, NumPy weights are pickled instead, which copies
+them the same way. Each measurement runs in a fresh process, so that
+peak memory (the ru_maxrss of the process) is its own. Files are read
+from the page cache; from a cold disk, the tensor format's load stays as
+fast, while reading the weights takes as long as the disk does.
+
+Run it with `python benchmarks/bench_tensor_format.py`; add --quick for
+smaller weights. Results are printed and, with --output, written as JSON.
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import LocalFilesystemBackend
+from mozmlops.tensor_format import load_tensors, store_tensors
+
+SIZES = {
+    "full": {"megabytes": 1024, "layers": 16},
+    "quick": {"megabytes": 128, "layers": 8},
+}
+FORMATS = ("baseline", "tensors")
+STORAGE_PATH = "model/weights"
+
+
+def _torch():
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+def make_weights(megabytes: int, layers: int) -> dict:
+    """
+    float32 weights of about `megabytes`, in `layers` square matrices,
+    as torch tensors if torch is installed and NumPy arrays if not.
+    """
+    width = int((megabytes * 1024 * 1024 / 4 / layers) ** 0.5)
+    generator = np.random.default_rng(0)
+    weights = {
+        f"layer{i}.weight": generator.standard_normal((width, width), dtype=np.float32)
+        for i in range(layers)
+    }
+    torch = _torch()
+    if torch is not None:
+        weights = {name: torch.from_numpy(array) for name, array in weights.items()}
+    return weights
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _read_all(weights: dict) -> float:
+    return float(sum(weight.sum() for weight in weights.values()))
+
+
+def measure_save(form: str, workdir: str, sizes: dict) -> dict:
+    storage_client = CloudStorageAPIClient(
+        backend=LocalFilesystemBackend(os.path.join(workdir, "bucket"))
+    )
+    weights = make_weights(**sizes)
+    torch = _torch()
+    before = _peak_rss_bytes()
+
+    start = time.perf_counter()
+    if form == "tensors":
+        store_tensors(storage_client, weights, STORAGE_PATH)
+    else:
+        buffer = io.BytesIO()
+        if torch is not None:
+            torch.save(weights, buffer)
+        else:
+            pickle.dump(weights, buffer, protocol=pickle.HIGHEST_PROTOCOL)
+        storage_client.store(buffer.getvalue(), STORAGE_PATH)
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "peak_rss_mb": (_peak_rss_bytes() - before) / 2**20}
+
+
+def measure_load(form: str, workdir: str, sizes: dict) -> dict:
+    storage_client = CloudStorageAPIClient(
+        backend=LocalFilesystemBackend(os.path.join(workdir, "bucket"))
+    )
+    local_path = storage_client.fetch(STORAGE_PATH, os.path.join(workdir, form))
+    torch = _torch()
+    before = _peak_rss_bytes()
+
+    start = time.perf_counter()
+    if form == "tensors":
+        weights = load_tensors(local_path, "torch" if torch is not None else "numpy")
+    else:
+        with open(local_path, "rb") as f:
+            buffer = io.BytesIO(f.read())
+        if torch is not None:
+            weights = torch.load(buffer, weights_only=True)
+        else:
+            weights = pickle.load(buffer)
+    load_seconds = time.perf_counter() - start
+    load_peak = _peak_rss_bytes() - before
+
+    start = time.perf_counter()
+    _read_all(weights)
+    read_seconds = time.perf_counter() - start
+
+    return {
+        "seconds": load_seconds,
+        "peak_rss_mb": load_peak / 2**20,
+        "then_read_seconds": load_seconds + read_seconds,
+        "then_read_peak_rss_mb": (_peak_rss_bytes() - before) / 2**20,
+    }
+
+
+def _in_fresh_process(operation: str, form: str, workdir: str, size: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", operation, form, workdir, size],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def run(size: str) -> dict:
+    results = {}
+    for form in FORMATS:
+        with tempfile.TemporaryDirectory() as workdir:
+            for operation in ("save", "load"):
+                measured = _in_fresh_process(operation, form, workdir, size)
+                for metric, value in measured.items():
+                    results[f"{form}_{operation}_{metric}"] = value
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="smaller weights")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        operation, form, workdir, size = args.child
+        measure = measure_save if operation == "save" else measure_load
+        print(json.dumps(measure(form, workdir, SIZES[size])))
+        return 0
+
+    size = "quick" if args.quick else "full"
+    results = run(size)
+    for name, value in results.items():
+        print(f"{name:<45} {value:>12.4g}")
+    if args.output:
+        document = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "baseline": "torch" if _torch() is not None else "pickle",
+                "weights_mb": SIZES[size]["megabytes"],
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
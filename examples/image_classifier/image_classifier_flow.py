@@ -13,6 +13,7 @@ from metaflow import (
     kubernetes,
     pypi,
     nvidia,
+    retry,
 )
 from metaflow.cards import Markdown
 
@@ -20,7 +21,25 @@ from metaflow.cards import Markdown
 GCS_PROJECT_NAME = "your-gcp-project-here"
 GCS_BUCKET_NAME = "your-gcs-bucket-here"
 # Model blob to be uploaded to GCS
-MODEL_STORAGE_PATH = "image_classifier/trained-model-bytes.pth"
+MODEL_STORAGE_PATH = "image_classifier/trained-model.tensors"
+# The test set is evaluated in this many parallel branches
+EVALUATION_SHARDS = 4
+
+
+def _normalize(sample):
+    """
+    Turns a stored (image, label) sample into a normalized image tensor and label.
+    """
+    import torchvision.transforms as transforms
+
+    image, label = sample
+    transform = transforms.Compose(
+        [
+            transforms.ToTensor(),
+            transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
+        ]
+    )
+    return transform(image), label
 
 
 class ImageClassifierFlow(FlowSpec):
@@ -32,30 +51,45 @@ class ImageClassifierFlow(FlowSpec):
         type=bool,
         default=True,
     )
+    autotune_dataloader = Parameter(
+        "autotune-dataloader",
+        help="Try DataLoader settings briefly before training, and train with the fastest",
+        type=bool,
+        default=False,
+    )
 
-    @pypi(python="3.11.9", packages={"torchvision": "0.19.1"})
+    @pypi(
+        python="3.11.9",
+        packages={"torchvision": "0.19.1", "mozmlops": "0.1.4"},
+    )
     @card(type="default")
     @kubernetes
     @step
     def start(self):
         import torchvision
-        import torchvision.transforms as transforms
-
-        # Download and normalize CIFAR10
-        print("start step: downloading and normalizing dataset")
-        transform = transforms.Compose(
-            [
-                transforms.ToTensor(),
-                transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
-            ]
-        )
+        from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        from mozmlops.streaming_dataset import ShardWriter
 
-        self.trainset = torchvision.datasets.CIFAR10(
-            root="./data", train=True, download=True, transform=transform
-        )
-        self.testset = torchvision.datasets.CIFAR10(
-            root="./data", train=False, download=True, transform=transform
+        # Download CIFAR10 and write it to GCS as shards, which the train and
+        # evaluate steps stream from, rather than passing the whole dataset
+        # between pods as an artifact.
+        print("start step: downloading dataset and writing shards")
+        storage_client = CloudStorageAPIClient(
+            project_name=GCS_PROJECT_NAME, bucket_name=GCS_BUCKET_NAME
         )
+        self.dataset_prefix = f"{current.flow_name}/{current.run_id}/cifar10"
+        for split in ("train", "test"):
+            dataset = torchvision.datasets.CIFAR10(
+                root="./data", train=split == "train", download=True
+            )
+            # Small shards, so that the test set splits between evaluate branches
+            with ShardWriter(
+                storage_client,
+                f"{self.dataset_prefix}/{split}",
+                shard_bytes=4 * 1024 * 1024,
+            ) as writer:
+                for image, label in zip(dataset.data, dataset.targets):
+                    writer.write((image, label))
         self.next(self.train)
 
     # Train the network
@@ -67,6 +101,8 @@ class ImageClassifierFlow(FlowSpec):
     @nvidia
     # @kubernetes
     @card
+    # A retry resumes from the last checkpoint the failed attempt stored
+    @retry(times=2)
     @environment(
         vars={
             "WANDB_API_KEY": os.getenv("WANDB_API_KEY"),
@@ -79,7 +115,12 @@ class ImageClassifierFlow(FlowSpec):
         import torch.nn as nn
         import torch.optim as optim
         from image_classifier_model import ImageClassifierModel
-        from io import BytesIO
+        from mozmlops.checkpointing import CheckpointManager
+        from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        from mozmlops.streaming_dataset import StreamingDataset, as_torch_dataset
+        from mozmlops.tensor_format import store_tensors
+        from mozmlops.training_profiler import TrainingProfiler, tune_dataloader
+        import copy
         import wandb
         import os
 
@@ -109,28 +150,98 @@ class ImageClassifierFlow(FlowSpec):
             image_classifier_model.parameters(), lr=0.001, momentum=0.9
         )
 
-        # Load train data
-        batch_size = 4
+        # Stream train data: training starts once the first shard is downloaded
+        loader_settings = {"batch_size": 4, "num_workers": 2}
+        storage_client = CloudStorageAPIClient(
+            project_name=GCS_PROJECT_NAME, bucket_name=GCS_BUCKET_NAME
+        )
+        trainset = StreamingDataset(
+            storage_client,
+            f"{self.dataset_prefix}/train",
+            shuffle=True,
+            cache_directory="./data/shards",
+            transform=_normalize,
+        )
+
+        if self.autotune_dataloader:
+            # Tune on a copy, so that the tuning steps do not train the model
+            tuning_model = copy.deepcopy(image_classifier_model)
+            tuning_optimizer = optim.SGD(
+                tuning_model.parameters(), lr=0.001, momentum=0.9
+            )
+
+            def tuning_step(data):
+                inputs, labels = data[0].to(device), data[1].to(device)
+                tuning_optimizer.zero_grad()
+                criterion(tuning_model(inputs), labels).backward()
+                tuning_optimizer.step()
+
+            tuning = tune_dataloader(
+                as_torch_dataset(trainset),
+                tuning_step,
+                num_workers=(2, 0, 4, 8),
+                batch_size=(loader_settings["batch_size"],),
+                pin_memory=(False, True) if device.type == "cuda" else (False,),
+                sync=torch.cuda.synchronize if device.type == "cuda" else None,
+            )
+            loader_settings = tuning.best
+            current.card.extend(tuning.metaflow_card_components())
+
         trainloader = torch.utils.data.DataLoader(
-            self.trainset, batch_size=batch_size, shuffle=True, num_workers=2
+            as_torch_dataset(trainset), **loader_settings
+        )
+
+        # Time the data loading, forward/backward and optimizer phases of each step
+        profiler = TrainingProfiler(
+            sync=torch.cuda.synchronize if device.type == "cuda" else None
+        )
+
+        # Store a checkpoint after every epoch in the background, while the
+        # next one trains. Only copying the weights to the CPU holds training up.
+        checkpoints = CheckpointManager(
+            storage_client,
+            f"{current.flow_name}/{current.run_id}/{current.step_name}/checkpoints",
+            every_steps=1,
+            serialize=torch.save,
+            deserialize=torch.load,
+            snapshot=lambda state: {
+                "model": {
+                    name: tensor.detach().to("cpu", copy=True)
+                    for name, tensor in state["model"].state_dict().items()
+                },
+                "optimizer": copy.deepcopy(state["optimizer"].state_dict()),
+            },
         )
+        first_epoch = 0
+        if current.retry_count > 0:
+            restored = checkpoints.restore()
+            if restored is not None:
+                image_classifier_model.load_state_dict(restored.state["model"])
+                optimizer.load_state_dict(restored.state["optimizer"])
+                first_epoch = restored.step + 1
+                print(f"Resuming training after epoch {restored.step + 1}")
 
         # Start training
         num_epochs = 2
-        for epoch in range(num_epochs):  # loop over the dataset multiple times
+        # loop over the dataset multiple times
+        for epoch in range(first_epoch, num_epochs):
+            trainset.set_epoch(epoch)
             running_loss = 0.0
-            for i, data in enumerate(trainloader, 0):
+            for i, data in enumerate(profiler.batches(trainloader), 0):
                 # get the inputs; data is a list of [inputs, labels]
-                inputs, labels = data[0].to(device), data[1].to(device)
+                with profiler.phase("to_device"):
+                    inputs, labels = data[0].to(device), data[1].to(device)
 
                 # zero the parameter gradients
                 optimizer.zero_grad()
 
                 # forward + backward + optimize
-                outputs = image_classifier_model(inputs)
-                loss = criterion(outputs, labels)
-                loss.backward()
-                optimizer.step()
+                with profiler.phase("forward_backward"):
+                    outputs = image_classifier_model(inputs)
+                    loss = criterion(outputs, labels)
+                    loss.backward()
+                with profiler.phase("optimizer"):
+                    optimizer.step()
 
                 # print statistics
                 running_loss += loss.item()
@@ -139,19 +250,28 @@ class ImageClassifierFlow(FlowSpec):
                     # log metrics to wandb
                     wandb.log({"mini-batches": {i + 1}, "loss": {running_loss / 2000}})
                     running_loss = 0.0
+            checkpoints.step(
+                epoch, {"model": image_classifier_model, "optimizer": optimizer}
+            )
 
+        checkpoints.close()
         print("Finished Training")
-        buffer = BytesIO()
-        torch.save(image_classifier_model.state_dict(), buffer)
-        self.model_state_dict_bytes = buffer.getvalue()
-        self.next(self.evaluate)
+        current.card.extend(profiler.metaflow_card_components())
+        # Stream the weights straight to GCS, rather than copying them into an artifact
+        self.model_path = f"{current.flow_name}/{current.run_id}/model.tensors"
+        store_tensors(
+            storage_client, image_classifier_model.state_dict(), self.model_path
+        )
+        self.evaluation_shards = list(range(EVALUATION_SHARDS))
+        self.next(self.evaluate, foreach="evaluation_shards")
 
-    # Test the model on the test data
+    # Test the model on one shard of the test data
     @pypi(
         python="3.11.9",
         packages={
             "torch": "2.4.1",
             "torchvision": "0.19.1",
+            "mozmlops": "0.1.4",
         },
     )
     # Check https://docs.metaflow.org/api/step-decorators/kubernetes for details on @kubernetes decorator
@@ -160,39 +280,61 @@ class ImageClassifierFlow(FlowSpec):
     def evaluate(self):
         import torch
         from image_classifier_model import ImageClassifierModel
-        from io import BytesIO
+        from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        from mozmlops.evaluation import evaluate as evaluate_batches
+        from mozmlops.model_loader import ModelLoader
+        from mozmlops.streaming_dataset import StreamingDataset, as_torch_dataset
+        from mozmlops.tensor_format import load_tensors
 
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f"Evaluating on: {device}")
 
+        storage_client = CloudStorageAPIClient(
+            project_name=GCS_PROJECT_NAME, bucket_name=GCS_BUCKET_NAME
+        )
         image_classifier_model = ImageClassifierModel().to(device)
-        buffer = BytesIO(self.model_state_dict_bytes)
+        # The weights are mapped from the downloaded file, not copied or unpickled
         image_classifier_model.load_state_dict(
-            torch.load(buffer, map_location=device, weights_only=True)
+            ModelLoader(storage_client)
+            .load(self.model_path, lambda path: load_tensors(path, "torch"))
+            .model
         )
 
-        correct = 0
-        total = 0
-
-        # load test data
-        batch_size = 4
+        # load this branch's shards of the test data
+        testset = StreamingDataset(
+            storage_client,
+            f"{self.dataset_prefix}/test",
+            rank=self.input,
+            world_size=len(self.evaluation_shards),
+            transform=_normalize,
+        )
         testloader = torch.utils.data.DataLoader(
-            self.testset, batch_size=batch_size, shuffle=False, num_workers=2
+            as_torch_dataset(testset), batch_size=256, num_workers=2
         )
         # since we're not training, we don't need to calculate the gradients for our outputs
+        image_classifier_model.eval()
         with torch.no_grad():
-            for data in testloader:
-                images, labels = data[0].to(device), data[1].to(device)
-                # calculate outputs by running images through the network
-                outputs = image_classifier_model(images)
-                # the class with the highest energy is what we choose as prediction
-                _, predicted = torch.max(outputs.data, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
+            # accumulate mergeable metrics, which the join step adds up
+            self.metrics = evaluate_batches(
+                ((images.to(device), labels) for images, labels in testloader),
+                image_classifier_model,
+                num_classes=10,
+            )
+        self.next(self.join_evaluation)
 
+    @pypi(python="3.11.9", packages={"mozmlops": "0.1.4"})
+    @kubernetes
+    @step
+    def join_evaluation(self, inputs):
+        from mozmlops.evaluation import merge_metrics
+
+        metrics = merge_metrics(branch.metrics for branch in inputs).result()
         print(
-            f"Accuracy of the network on the 10000 test images: {100 * correct // total} %"
+            f"Accuracy of the network on the {metrics['count']} test images: "
+            f"{100 * metrics['accuracy']:.0f} %"
         )
+        self.evaluation_metrics = metrics
+        self.merge_artifacts(inputs, exclude=["metrics"])
         self.next(self.upload_model_to_gcs)
 
     @pypi(python="3.11.9", packages={"mozmlops": "0.1.4"})
@@ -200,15 +342,16 @@ class ImageClassifierFlow(FlowSpec):
     @step
     def upload_model_to_gcs(self):
         from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        from mozmlops.model_loader import ModelLoader
 
         print("Uploading model to gcs")
         # init client
         storage_client = CloudStorageAPIClient(
             project_name=GCS_PROJECT_NAME, bucket_name=GCS_BUCKET_NAME
         )
-        storage_client.store(
-            data=self.model_state_dict_bytes, storage_path=MODEL_STORAGE_PATH
-        )
+        # Publish the evaluated weights, which train stored under this run
+        local_path = ModelLoader(storage_client).fetch(self.model_path).local_path
+        storage_client.store_file(local_path, MODEL_STORAGE_PATH)
         self.next(self.end)
 
     @kubernetes
@@ -11,10 +11,16 @@ from ray.serve import Application
 from fastapi import FastAPI
 from pydantic import BaseModel, Field
 from transformers import pipeline
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from mozmlops.batching import handle_bucketed
 
 app = FastAPI()
 
+# A batch is split so that, padded to its longest text, it holds at most this many
+# tokens, unless the user_config sets `max_batch_tokens`
+DEFAULT_MAX_BATCH_TOKENS = 512
+
 
 class BatchedTranslatorArgs(BaseModel):
     task: str = Field(
@@ -23,6 +29,17 @@ class BatchedTranslatorArgs(BaseModel):
     model: str = Field(
         description="The model parameter of the transformers.TranslationPipeline"
     )
+    model_storage_path: Optional[str] = Field(
+        default=None,
+        description="The GCS prefix of a model directory stored with mozmlops, "
+        "e.g. by a flow, to serve instead of downloading `model` from Hugging Face",
+    )
+    gcs_project_name: Optional[str] = Field(
+        default=None, description="The GCP project of model_storage_path"
+    )
+    gcs_bucket_name: Optional[str] = Field(
+        default=None, description="The GCS bucket of model_storage_path"
+    )
 
 
 class TranslateRequest(BaseModel):
@@ -32,9 +49,42 @@ class TranslateRequest(BaseModel):
 @serve.deployment()
 @serve.ingress(app)
 class BatchedTranslator:
-    def __init__(self, task: str, model: str):
-        # Load model
-        self.model = pipeline(task, model)
+    def __init__(
+        self,
+        task: str,
+        model: str,
+        model_storage_path: Optional[str] = None,
+        gcs_project_name: Optional[str] = None,
+        gcs_bucket_name: Optional[str] = None,
+    ):
+        # Set by reconfigure() when adaptive batching or response caching is turned on
+        self.batcher = None
+        self.cache = None
+        self.max_batch_tokens = DEFAULT_MAX_BATCH_TOKENS
+
+        if model_storage_path is None:
+            # Load model
+            self.model = pipeline(task, model)
+            self.model_version = model
+            return
+
+        # Load a model stored in GCS through the node's model cache: replicas
+        # on the same node share one download of it, and replicas started
+        # later find it on disk. Check out help(ModelLoader) for more details.
+        from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        from mozmlops.model_loader import ModelLoader
+
+        storage_client = CloudStorageAPIClient(
+            project_name=gcs_project_name, bucket_name=gcs_bucket_name
+        )
+        loaded = ModelLoader(storage_client).load(
+            model_storage_path.rstrip("/") + "/",
+            lambda directory: pipeline(task, model=directory),
+        )
+        print(f"Loaded {model_storage_path} in {loaded.seconds:.2f}s")
+        self.model = loaded.model
+        # Changes whenever any file of the stored model does
+        self.model_version = repr(sorted(loaded.generations.items()))
 
     # `batch_wait_timeout_s`: Controls how long Serve should wait for a batch once the first request arrives.
     # `max_batch_size`      : Controls the size of the batch. Once the first request arrives, @serve.batch decorator will wait for a
@@ -46,24 +96,59 @@ class BatchedTranslator:
     async def _batched_translate_handler(self, inputs: List[str]) -> List[str]:
         print("Our input array has length:", len(inputs), inputs)
 
-        # Run inference
-        model_outputs = self.model(inputs)
-        print("model_outputs:", model_outputs)
-
-        # Post-process output to return only the translation text
-        translations = [
-            model_output["translation_text"] for model_output in model_outputs
-        ]
+        # Run inference on texts of similar length together, so that one long
+        # text does not pad the whole batch, splitting the batch where it would
+        # hold more than `max_batch_tokens` padded tokens. The translations
+        # come back in the order of the inputs.
+        translations = handle_bucketed(
+            self._translate_batch,
+            inputs,
+            self._length,
+            max_batch_size=len(inputs),
+            max_batch_tokens=self.max_batch_tokens,
+        )
         print("translations:", translations)
 
         return translations
 
+    def _translate_batch(self, inputs: List[str]) -> List[str]:
+        # Run inference on the whole batch at once
+        model_outputs = self.model(inputs, batch_size=len(inputs))
+        # Post-process output to return only the translation text
+        return [model_output["translation_text"] for model_output in model_outputs]
+
+    def _length(self, text: str) -> int:
+        # The number of tokens the model sees
+        return len(self.model.tokenizer(text).input_ids)
+
     @app.post("/")
     async def translate(self, translate_request: TranslateRequest) -> str:
-        result = await self._batched_translate_handler(translate_request.text)
+        if self.batcher is not None:
+            translate = self.batcher.submit
+        else:
+            translate = self._batched_translate_handler
+        if self.cache is not None:
+            # Repeated texts are answered from the cache, without being batched
+            result = await self.cache.get_or_compute(translate_request.text, translate)
+        else:
+            result = await translate(translate_request.text)
         print("result:", result)
         return result
 
+    @app.get("/batching")
+    def batching(self) -> Dict[str, Any]:
+        # The batching parameters the adaptive batcher chose, and the estimates behind them
+        if self.batcher is None:
+            return {}
+        return self.batcher.controller.metrics()
+
+    @app.get("/cache")
+    def cache_metrics(self) -> Dict[str, Any]:
+        # Hits, misses and the hit rate of the response cache
+        if self.cache is None:
+            return {}
+        return self.cache.metrics()
+
     # This function allows dynamically changing parameters without restarting replicas
     # https://docs.ray.io/en/latest/serve/production-guide/config.html#dynamically-change-parameters-without-restarting-replicas-user-config
     def reconfigure(self, user_config: Dict[str, Any]):
@@ -73,11 +158,70 @@ class BatchedTranslator:
         self._batched_translate_handler.set_batch_wait_timeout_s(
             user_config["batch_wait_timeout_s"]
         )
+        self.max_batch_tokens = user_config.get(
+            "max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS
+        )
+
+        # With a target p99 latency, requests are batched by mozmlops'
+        # AdaptiveBatcher instead, which tunes the batch size (up to
+        # `max_batch_size`) and wait timeout to the traffic to meet it.
+        # Check out help(AdaptiveBatchController) for more details.
+        target_p99_s = user_config.get("target_p99_s")
+        if target_p99_s is None:
+            self.batcher = None
+        elif self.batcher is None:
+            from mozmlops.batching import AdaptiveBatchController, AdaptiveBatcher
+
+            self.batcher = AdaptiveBatcher(
+                self._translate_batch,
+                AdaptiveBatchController(
+                    target_p99_s=target_p99_s,
+                    max_batch_size=user_config["max_batch_size"],
+                ),
+                # Batch texts with others of a similar number of tokens, so
+                # that short texts are not padded to the length of long ones
+                length=self._length,
+                max_batch_tokens=self.max_batch_tokens,
+            )
+        else:
+            controller = self.batcher.controller
+            controller.target_p99_s = target_p99_s
+            controller.max_batch_size = user_config["max_batch_size"]
+            controller.batch_size = min(
+                controller.batch_size, controller.max_batch_size
+            )
+            self.batcher.max_batch_tokens = self.max_batch_tokens
+
+        # With `cache_size` set, responses to repeated texts are cached with
+        # mozmlops' ResponseCache, for `cache_ttl_s` seconds if set. Keying
+        # them on the model version keeps them from outliving the model. To
+        # share responses between replicas, pass shared=RedisTier(redis_client).
+        # Check out help(ResponseCache) for more details.
+        cache_size = user_config.get("cache_size")
+        if not cache_size:
+            self.cache = None
+        elif self.cache is None:
+            from mozmlops.response_cache import ResponseCache
+
+            self.cache = ResponseCache(
+                model_version=self.model_version,
+                max_entries=cache_size,
+                ttl_s=user_config.get("cache_ttl_s"),
+            )
+        else:
+            self.cache.max_entries = cache_size
+            self.cache.ttl_s = user_config.get("cache_ttl_s")
 
 
 # Ray Serve Application builder
 def batched_translator_app_builder(args: BatchedTranslatorArgs) -> Application:
-    return BatchedTranslator.bind(args.task, args.model)
+    return BatchedTranslator.bind(
+        args.task,
+        args.model,
+        args.model_storage_path,
+        args.gcs_project_name,
+        args.gcs_bucket_name,
+    )
 
 
 # IFF you want to auto-generate Serve config file (using `serve build` command) then uncomment the next statement, auto-generate the Serve config
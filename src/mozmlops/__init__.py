@@ -1,4 +1,9 @@
-# read version from installed package
-from importlib.metadata import version
+def __getattr__(name):
+    # Reading the installed package's metadata is slow, so only do it
+    # when the version is actually asked for.
+    if name == "__version__":
+        from importlib.metadata import version
 
-__version__ = version("mozmlops")
+        globals()["__version__"] = version("mozmlops")
+        return globals()["__version__"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,46 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Importing mozmlops has to stay cheap: every Metaflow task, Ray worker and
+serving replica pays for it when it starts. The Google SDK alone takes
+longer to import than the rest of the package, so it is only imported
+when it is first used, through a LazyModule.
+"""
+
+import importlib
+import threading
+
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stands in for a module that is imported on first attribute access and
+    kept from then on:
+
+        storage = LazyModule("google.cloud.storage")
+        ...
+        client = storage.Client()  # Imports google.cloud.storage here.
+
+    An ImportError, e.g. for a missing optional dependency, is raised at
+    that first access.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute: str):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attribute)
+
+    def __repr__(self) -> str:
+        state = "imported" if self._module is not None else "not imported yet"
+        return f"<LazyModule {self._name!r} ({state})>"
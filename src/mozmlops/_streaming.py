@@ -0,0 +1,175 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Helpers for moving data through bounded amounts of memory.
+"""
+
+import base64
+import hashlib
+import io
+import mmap
+import os
+
+from typing import Iterable
+
+from mozmlops._lazy import LazyModule
+
+google_crc32c = LazyModule("google_crc32c")
+
+# Streaming transfers move data in chunks of this many bytes.
+# GCS requires resumable upload chunks to be a multiple of 256 KiB.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    A read-only, non-seekable file-like view over an iterable of byte chunks,
+    so that generators can be streamed to storage without joining them in memory.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks)).cast("B")
+            except StopIteration:
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        self._position += n
+        return n
+
+
+class BufferWriter(io.RawIOBase):
+    """
+    A writable file-like object that fills a caller-provided buffer,
+    so downloads can land in it without an intermediate copy.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer).cast("B")
+        self.capacity = len(self._buffer)
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.written
+
+    def write(self, data) -> int:
+        data = memoryview(data).cast("B")
+        n = len(data)
+        if self.written + n > self.capacity:
+            raise ValueError("The data does not fit in the buffer")
+        self._buffer[self.written : self.written + n] = data
+        self.written += n
+        return n
+
+
+def chunk_stream(
+    chunks: Iterable[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> io.BufferedReader:
+    """
+    Returns a buffered file-like object that reads from `chunks`.
+    Its .read(n) returns exactly n bytes until the chunks run out.
+    """
+    return io.BufferedReader(ChunkReader(chunks), buffer_size=chunk_size)
+
+
+def read_fully(stream, size: int) -> bytes:
+    """
+    Reads `size` bytes from a stream, fewer only if it ends first.
+    A single .read() of a raw stream, such as a socket, may return less.
+    """
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining and (data := stream.read(remaining)):
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+
+def iter_file_range(
+    local_path: str, start: int, length: int, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterable[bytes]:
+    """
+    Yields `length` bytes of a file, beginning at `start`, in chunks.
+    """
+    with open(local_path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def map_file(local_path: str, copy: bool = False) -> memoryview:
+    """
+    Maps a file into memory and returns it as a memoryview, without reading
+    or copying it: pages are only loaded as they are used. The view is
+    read-only or, with copy, copy-on-write, so writing to it leaves the file
+    unchanged.
+    """
+    if os.path.getsize(local_path) == 0:
+        return memoryview(b"")
+    access = mmap.ACCESS_COPY if copy else mmap.ACCESS_READ
+    with open(local_path, "rb") as f:
+        # The mapping stays valid after the file is closed.
+        return memoryview(mmap.mmap(f.fileno(), 0, access=access))
+
+
+def encode_crc32c(checksum) -> str:
+    """
+    Encodes a google_crc32c.Checksum the way GCS reports it, in base64.
+    """
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+def bytes_crc32c(data: bytes) -> str:
+    """
+    Returns the CRC32C checksum of `data`, base64-encoded the way GCS reports it.
+    """
+    return encode_crc32c(google_crc32c.Checksum(data))
+
+
+def file_crc32c(local_path: str) -> str:
+    """
+    Returns the CRC32C checksum of a file, base64-encoded the way GCS reports it.
+    """
+    checksum = google_crc32c.Checksum()
+    for chunk in iter_file_range(local_path, 0, os.path.getsize(local_path)):
+        checksum.update(chunk)
+    return encode_crc32c(checksum)
+
+
+def digest_stream(stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[int, str, str]:
+    """
+    Reads a stream to its end in chunks and returns its size, its CRC32C
+    (base64-encoded, to compare with GCS) and its SHA-256 (hex-encoded).
+    """
+    size = 0
+    crc32c = google_crc32c.Checksum()
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        size += len(chunk)
+        crc32c.update(chunk)
+        sha256.update(chunk)
+    return size, encode_crc32c(crc32c), sha256.hexdigest()
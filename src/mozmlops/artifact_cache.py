@@ -0,0 +1,235 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# 10 GiB
+DEFAULT_CACHE_MAX_BYTES = 10 * 1024**3
+
+
+class ArtifactCache:
+    """
+    An on-disk cache of fetched objects that can be shared by every process
+    on a node, for example the replicas of a Ray Serve deployment or the
+    steps of a flow re-run on the same machine.
+
+    Arguments:
+
+    - directory (str): Where cached objects are kept
+    - max_bytes (int): The cache evicts least recently used objects
+      to stay under this many bytes
+
+    Entries are keyed by bucket, path, generation and CRC32C, so a new
+    version of an object is never served from a stale entry.
+    Processes coordinate through file locks in the cache directory.
+
+    Pass an instance to CloudStorageAPIClient(cache=...) to use it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._objects = self.directory / "objects"
+        self._locks = self.directory / "locks"
+        self._objects.mkdir(parents=True, exist_ok=True)
+        self._locks.mkdir(parents=True, exist_ok=True)
+        self._counter_lock = threading.Lock()
+
+    @staticmethod
+    def key(bucket: str, path: str, generation: int, crc32c: str) -> str:
+        """
+        Returns the cache key for one version of an object.
+        """
+        identity = f"{bucket}/{path}#{generation}:{crc32c}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    @property
+    def size(self) -> int:
+        """
+        The number of bytes currently held in the cache.
+        """
+        return sum(stat.st_size for _, stat in self._stat_entries())
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size}
+
+    def fetch(
+        self,
+        key: str,
+        download: Callable[[str], None],
+        local_path: str,
+        link: bool = False,
+    ) -> bool:
+        """
+        Arguments:
+        key (str): The cache key, see ArtifactCache.key().
+        download (Callable[[str], None]): Downloads the object to the path it is given.
+        local_path (str): Where to place a copy of the object.
+        link (bool): Hard-link local_path to the cached object instead of
+          copying it, which takes no time or space whatever the object's size.
+          The two then share their contents, so local_path must not be
+          modified. It stays valid after the object is evicted, and its
+          space is only freed once local_path is removed too.
+
+        Copies the cached object to local_path, downloading it into the cache
+        first if no process has done so yet. Returns whether it was a cache hit.
+        """
+        entry = self._objects / key
+
+        with self._lock(key):
+            hit = entry.exists()
+            if not hit:
+                partial = self._objects / f".{key}.{os.getpid()}.partial"
+                try:
+                    download(str(partial))
+                    os.replace(partial, entry)
+                finally:
+                    partial.unlink(missing_ok=True)
+
+            # The modification time doubles as the last access time for LRU eviction.
+            os.utime(entry)
+            if link:
+                _link_or_copy(entry, local_path)
+            else:
+                shutil.copyfile(entry, local_path)
+
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not hit:
+            self.evict()
+        return hit
+
+    def evict(self):
+        """
+        Removes least recently used objects until the cache fits in max_bytes.
+        Objects that another process is using are skipped.
+        """
+        with self._lock("evict"):
+            entries = sorted(self._stat_entries(), key=lambda item: item[1].st_mtime)
+            total = sum(stat.st_size for _, stat in entries)
+            for entry, stat in entries:
+                if total <= self.max_bytes:
+                    break
+                with self._lock(entry.name, blocking=False) as acquired:
+                    if not acquired:
+                        continue
+                    self._remove(entry)
+                    total -= stat.st_size
+                    logger.info(f"Evicted {entry.name} from the artifact cache")
+
+    def discard(self, local_paths: list[str]):
+        """
+        Removes the cached objects that local_paths are hard links to, from
+        fetch(link=True), e.g. when what was built from them is removed.
+        Objects that another process is using are skipped.
+        """
+        linked = set()
+        for local_path in local_paths:
+            stat = os.stat(local_path)
+            linked.add((stat.st_dev, stat.st_ino))
+        with self._lock("evict"):
+            for entry, stat in self._stat_entries():
+                if (stat.st_dev, stat.st_ino) not in linked:
+                    continue
+                with self._lock(entry.name, blocking=False) as acquired:
+                    if acquired:
+                        self._remove(entry)
+
+    def lock(self, name: str):
+        """
+        Returns a context manager that holds an exclusive lock, shared by
+        every process using this cache directory, on `name`, e.g. to build
+        something from cached objects only once per node.
+        """
+        return self._lock(name)
+
+    def _entries(self) -> list[Path]:
+        return [e for e in self._objects.iterdir() if not e.name.startswith(".")]
+
+    def _stat_entries(self) -> list[tuple[Path, os.stat_result]]:
+        """
+        Returns every entry with its stat, leaving out entries that another
+        process removes in the meantime.
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry, entry.stat()))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _remove(self, entry: Path):
+        """
+        Removes an entry and its lock file. Call with the entry's lock held.
+        """
+        entry.unlink(missing_ok=True)
+        (self._locks / entry.name).unlink(missing_ok=True)
+
+    @contextmanager
+    def _lock(self, name: str, blocking: bool = True):
+        """
+        Holds an exclusive lock, shared across processes, on `name`.
+        Yields whether the lock was acquired, which is always True when blocking.
+        """
+        import fcntl
+
+        path = self._locks / name
+        while True:
+            with open(path, "a") as lock_file:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                try:
+                    fcntl.flock(lock_file, flags)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    # The lock file may have been removed with its entry
+                    # while this process waited; then lock the new one.
+                    if not _is_current(lock_file, path):
+                        continue
+                    yield True
+                    return
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_current(lock_file, path: Path) -> bool:
+    """
+    Returns whether the open lock_file is still the file at path.
+    """
+    try:
+        return os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _link_or_copy(source: Path, target: str):
+    """
+    Hard-links target to source, replacing target if it exists, or copies
+    source if the two are on different filesystems.
+    """
+    partial = f"{target}.{os.getpid()}.{threading.get_ident()}.partial"
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
@@ -0,0 +1,141 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+import asyncio
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from mozmlops.cloud_storage_api_client import (
+    BulkTransferReport,
+    CloudStorageAPIClient,
+    TransferResult,
+)
+from mozmlops.retry import TransferStats, tracking
+
+
+class AsyncCloudStorageAPIClient:
+    """
+    An asyncio counterpart to CloudStorageAPIClient, for use inside async
+    code such as Ray Serve deployments, where a blocking call would stall
+    the event loop.
+
+    Arguments:
+
+    - project_name (str): The GCS Project name
+    - bucket_name (str): The GCS Bucket name
+    - max_concurrency (int): The maximum number of requests in flight at once
+    - **kwargs: Any other CloudStorageAPIClient argument, e.g. cache or backend
+
+    Transfers run on a dedicated thread pool over one shared
+    CloudStorageAPIClient, so they share its HTTP connection pool,
+    which is sized to max_concurrency.
+    """
+
+    def __init__(
+        self,
+        project_name: str | None = None,
+        bucket_name: str | None = None,
+        max_concurrency: int = 16,
+        **kwargs,
+    ):
+        kwargs.setdefault("max_pool_size", max_concurrency)
+        self.client = CloudStorageAPIClient(project_name, bucket_name, **kwargs)
+        self.max_concurrency = max_concurrency
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="mozmlops-storage"
+        )
+        # Created lazily so it binds to the event loop that first uses it.
+        self._semaphore = None
+
+    async def store(self, data: bytes, storage_path: str) -> str:
+        """
+        See CloudStorageAPIClient.store().
+        """
+        return await self._run(self.client.store, data, storage_path)
+
+    async def store_file(self, local_path: str, storage_path: str) -> str:
+        """
+        See CloudStorageAPIClient.store_file().
+        """
+        return await self._run(self.client.store_file, local_path, storage_path)
+
+    async def fetch(self, remote_path: str, local_path: str) -> str:
+        """
+        See CloudStorageAPIClient.fetch().
+        """
+        return await self._run(self.client.fetch, remote_path, local_path)
+
+    async def store_many(
+        self, items: Iterable[tuple[bytes, str]]
+    ) -> BulkTransferReport:
+        """
+        Stores many (data, storage_path) pairs concurrently,
+        at most max_concurrency at a time. See CloudStorageAPIClient.store_many().
+        """
+        return await self._run_many(
+            self.client.store, items, lambda item: item[1], lambda item: len(item[0])
+        )
+
+    async def fetch_many(self, items: Iterable[tuple[str, str]]) -> BulkTransferReport:
+        """
+        Fetches many (remote_path, local_path) pairs concurrently,
+        at most max_concurrency at a time. See CloudStorageAPIClient.fetch_many().
+        """
+        return await self._run_many(
+            self.client.fetch,
+            items,
+            lambda item: item[0],
+            lambda item: os.path.getsize(item[1]),
+        )
+
+    async def close(self):
+        """
+        Shuts down the thread pool once in-flight transfers are done.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, function, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, function, *args
+            )
+
+    async def _run_many(self, function, items, remote_path_of, size_of):
+        async def run_one(item) -> TransferResult:
+            result = TransferResult(path=remote_path_of(item))
+            stats = TransferStats()
+            start = time.perf_counter()
+            try:
+                await self._run(_call_tracked, stats, function, *item)
+                result.bytes_transferred = size_of(item)
+            except Exception as e:
+                result.error = e
+            result.seconds = time.perf_counter() - start
+            result.retries = stats.retries
+            result.bytes_resent = stats.bytes_resent
+            return result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_one(item) for item in items))
+        return BulkTransferReport(
+            results=list(results), seconds=time.perf_counter() - start
+        )
+
+
+def _call_tracked(stats: TransferStats, function, *args):
+    # Executor threads do not inherit the event loop's context,
+    # so the stats are tracked where the transfer actually runs.
+    with tracking(stats):
+        return function(*args)
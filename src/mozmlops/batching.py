@@ -0,0 +1,483 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Dynamic batching for inference servers, e.g. Ray Serve deployments.
+
+A fixed batch size and wait timeout only suit the traffic they were
+tuned for: under bursts a long wait adds to every request's latency,
+and in quiet periods large batches never fill. AdaptiveBatchController
+tunes both online from the queue depth, the time each batch takes and
+a target p99 latency. AdaptiveBatcher is an asyncio batcher driven by
+it; the controller can also drive a Ray Serve @serve.batch handler.
+
+    batcher = AdaptiveBatcher(self.model, AdaptiveBatchController(target_p99_s=0.2))
+    translation = await batcher.submit(text)
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+import math
+import time
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchingDecision:
+    """
+    One adjustment of the batching parameters.
+
+    - batch_size (int): The new largest batch size
+    - wait_timeout_s (float): The new longest wait for a batch to fill, in seconds
+    - reason (str): Why they changed
+    """
+
+    batch_size: int
+    wait_timeout_s: float
+    reason: str
+
+
+class AdaptiveBatchController:
+    """
+    Tunes a batcher's largest batch size and batch wait timeout to get
+    the most throughput that keeps the p99 latency of requests under a target.
+
+    Arguments:
+
+    - target_p99_s (float): The p99 latency to stay under, in seconds,
+      from a request entering the queue to its result
+    - min_batch_size (int): The smallest largest batch size to use
+    - max_batch_size (int): The largest batch size to use, e.g. as much
+      as fits in the accelerator's memory
+    - max_wait_timeout_s (float): The longest wait for a batch to fill
+    - initial_batch_size (int): The batch size to start with
+    - window (int): How many recent requests and batches the estimates use,
+      at most
+    - window_s (float): How many seconds back the p99 latency looks, so
+      that a burst of slow requests stops holding batches back soon after
+      it passes
+
+    After every batch, pass what was observed to .observe(). The controller:
+
+    - backs off, halving the wait and shrinking batches, while the p99
+      latency is over target;
+    - grows batches while requests are queueing up, up to the largest
+      batch whose predicted inference time fits in half the target;
+    - waits for a batch to fill only as long as requests are expected to
+      arrive in that time, and not at all when traffic is too light for
+      waiting to add requests to a batch.
+
+    Read the current parameters from .batch_size and .wait_timeout_s, and
+    what the controller decided and why from .metrics() and .decisions.
+    The instance is meant to be used from one event loop or thread.
+    """
+
+    def __init__(
+        self,
+        target_p99_s: float,
+        min_batch_size: int = 1,
+        max_batch_size: int = 64,
+        max_wait_timeout_s: float = 0.1,
+        initial_batch_size: int | None = None,
+        window: int = 1000,
+        window_s: float = 10.0,
+    ):
+        if not 1 <= min_batch_size <= max_batch_size:
+            raise ValueError("Expected 1 <= min_batch_size <= max_batch_size")
+        self.target_p99_s = target_p99_s
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_wait_timeout_s = max_wait_timeout_s
+        self.batch_size = initial_batch_size or min_batch_size
+        self.wait_timeout_s = 0.0
+        self.window_s = window_s
+        self.decisions: deque[BatchingDecision] = deque(maxlen=100)
+
+        # (time, latency) per request.
+        self._latencies: deque[tuple[float, float]] = deque(maxlen=window)
+        # (batch size, inference seconds) and (time, batch size) per batch.
+        self._batches: deque[tuple[int, float]] = deque(maxlen=max(window // 10, 10))
+        self._arrivals: deque[tuple[float, int]] = deque(maxlen=max(window // 10, 10))
+        self._last_queue_depth = 0
+
+    def observe(
+        self,
+        batch_size: int,
+        inference_seconds: float,
+        latencies: list[float],
+        queue_depth: int,
+        now: float | None = None,
+    ):
+        """
+        Arguments:
+        batch_size (int): How many requests the batch held.
+        inference_seconds (float): How long the model took on the batch.
+        latencies (list[float]): The latency of each request in the batch.
+        queue_depth (int): How many requests were left waiting after the batch
+          was taken from the queue.
+        now (float): When the batch was taken, on the time.monotonic() clock.
+
+        Records one batch and adjusts the batching parameters.
+        """
+        now = time.monotonic() if now is None else now
+        self._batches.append((batch_size, inference_seconds))
+        self._arrivals.append((now, batch_size))
+        self._latencies.extend((now, latency) for latency in latencies)
+        while self._latencies and self._latencies[0][0] < now - self.window_s:
+            self._latencies.popleft()
+        self._last_queue_depth = queue_depth
+        self._adjust(queue_depth)
+
+    def predicted_inference_seconds(self, batch_size: int) -> float:
+        """
+        Predicts how long a batch of batch_size requests takes, from a
+        least squares fit of a fixed cost plus a cost per request.
+        """
+        fixed, per_request = self._cost_model()
+        return fixed + per_request * batch_size
+
+    @property
+    def p99_seconds(self) -> float:
+        if not self._latencies:
+            return 0.0
+        latencies = sorted(latency for _, latency in self._latencies)
+        return latencies[min(len(latencies) - 1, math.ceil(0.99 * len(latencies)) - 1)]
+
+    @property
+    def arrival_rate(self) -> float:
+        """
+        Requests per second, over the recent batches.
+        """
+        if len(self._arrivals) < 2:
+            return 0.0
+        elapsed = self._arrivals[-1][0] - self._arrivals[0][0]
+        arrived = sum(size for _, size in list(self._arrivals)[1:])
+        return arrived / elapsed if elapsed > 0 else 0.0
+
+    def metrics(self) -> dict[str, float]:
+        """
+        Returns the current parameters and the estimates behind them.
+        """
+        fixed, per_request = self._cost_model()
+        return {
+            "batch_size": self.batch_size,
+            "wait_timeout_s": self.wait_timeout_s,
+            "p99_seconds": self.p99_seconds,
+            "target_p99_s": self.target_p99_s,
+            "arrival_rate": self.arrival_rate,
+            "queue_depth": self._last_queue_depth,
+            "fixed_inference_seconds": fixed,
+            "per_request_inference_seconds": per_request,
+            "adjustments": len(self.decisions),
+        }
+
+    def apply(self, handler):
+        """
+        Sets the current parameters on a Ray Serve @serve.batch handler,
+        e.g. after every batch from inside it:
+
+            controller.apply(self.translate_batch)
+        """
+        handler.set_max_batch_size(self.batch_size)
+        handler.set_batch_wait_timeout_s(self.wait_timeout_s)
+
+    def _adjust(self, queue_depth: int):
+        batch_size, wait_timeout_s = self.batch_size, self.wait_timeout_s
+
+        if self.p99_seconds > self.target_p99_s:
+            reason = "p99 latency over target"
+            batch_size = max(self.min_batch_size, math.floor(batch_size * 0.75))
+            wait_timeout_s = wait_timeout_s / 2
+        else:
+            reason = "requests queueing up" if queue_depth else "traffic changed"
+            if queue_depth >= batch_size:
+                batch_size = min(self._largest_batch_size(), batch_size * 2)
+            wait_timeout_s = self._fill_wait(batch_size)
+
+        batch_size = max(batch_size, self.min_batch_size)
+        if batch_size == self.batch_size and math.isclose(
+            wait_timeout_s, self.wait_timeout_s, rel_tol=0.1, abs_tol=1e-4
+        ):
+            return
+
+        self.batch_size, self.wait_timeout_s = batch_size, wait_timeout_s
+        decision = BatchingDecision(batch_size, wait_timeout_s, reason)
+        self.decisions.append(decision)
+        logger.debug(
+            f"Batching {batch_size} requests after at most "
+            f"{wait_timeout_s * 1000:.1f}ms: {reason}"
+        )
+
+    def _largest_batch_size(self) -> int:
+        """
+        Returns the largest batch size predicted to take at most half the
+        target latency, leaving the other half for queueing.
+        """
+        fixed, per_request = self._cost_model()
+        if per_request <= 0:
+            return self.max_batch_size
+        fitting = math.floor((self.target_p99_s / 2 - fixed) / per_request)
+        return max(self.min_batch_size, min(self.max_batch_size, fitting))
+
+    def _fill_wait(self, batch_size: int) -> float:
+        """
+        Returns how long to wait for a batch to fill: the time the rest of
+        the batch takes to arrive, within the latency budget left over by
+        inference, or nothing if waiting is unlikely to add a request.
+        """
+        rate = self.arrival_rate
+        if rate <= 0 or batch_size <= 1:
+            return 0.0
+        headroom = self.target_p99_s - self.predicted_inference_seconds(batch_size)
+        wait = min(self.max_wait_timeout_s, (batch_size - 1) / rate, headroom / 2)
+        if wait * rate < 1:
+            return 0.0
+        return wait
+
+    def _cost_model(self) -> tuple[float, float]:
+        if not self._batches:
+            return 0.0, 0.0
+        sizes = [size for size, _ in self._batches]
+        seconds = [seconds for _, seconds in self._batches]
+        mean_size = sum(sizes) / len(sizes)
+        mean_seconds = sum(seconds) / len(seconds)
+        variance = sum((size - mean_size) ** 2 for size in sizes)
+        if variance == 0:
+            # All batches had the same size; attribute all the time to requests.
+            return 0.0, mean_seconds / mean_size
+        covariance = sum(
+            (size - mean_size) * (s - mean_seconds) for size, s in zip(sizes, seconds)
+        )
+        per_request = max(covariance / variance, 0.0)
+        return max(mean_seconds - per_request * mean_size, 0.0), per_request
+
+
+class AdaptiveBatcher:
+    """
+    Collects concurrent requests into batches for a function that handles
+    a whole batch at once, with batch sizes and waits set by an
+    AdaptiveBatchController.
+
+    Arguments:
+
+    - handle_batch (Callable[[list], list]): Returns the result of each
+      request in a batch, in order. A coroutine function is awaited; any
+      other function runs on a worker thread, so that the event loop keeps
+      accepting requests in the meantime.
+    - controller (AdaptiveBatchController): Tunes the batching. Defaults
+      to one with a 1 second p99 target.
+    - length (Callable[[Any], int]): Returns the length of a request, e.g.
+      its number of tokens. If given, batches are made of requests of
+      similar length, so that short requests are not padded to the length
+      of a long one; see bucket_by_length().
+    - max_batch_tokens (int): With length, split batches so that each,
+      padded to its longest request, has at most this many tokens
+    - lookahead (int): With length, how many batches' worth of the oldest
+      queued requests are searched for requests of similar length
+
+    The oldest queued request always goes into the next batch, so
+    bucketing by length never starves a request.
+    If handle_batch raises, every request in the batch raises the same error.
+    """
+
+    def __init__(
+        self,
+        handle_batch: Callable[[list], list | Awaitable[list]],
+        controller: AdaptiveBatchController | None = None,
+        length: Callable[[Any], int] | None = None,
+        max_batch_tokens: int | None = None,
+        lookahead: int = 4,
+    ):
+        self.handle_batch = handle_batch
+        self.controller = controller or AdaptiveBatchController(target_p99_s=1.0)
+        self.length = length
+        self.max_batch_tokens = max_batch_tokens
+        self.lookahead = lookahead
+        self._queue: deque[_Queued] = deque()
+        self._arrived: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    async def submit(self, request) -> Any:
+        """
+        Queues one request and returns its result once its batch is handled.
+        """
+        if self._worker is None or self._worker.done():
+            self._arrived = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        queued = _Queued(
+            request=request,
+            queued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+            length=self.length(request) if self.length is not None else 0,
+        )
+        self._queue.append(queued)
+        self._arrived.set()
+        return await queued.future
+
+    async def _run(self):
+        while True:
+            await self._arrived.wait()
+            self._arrived.clear()
+            while self._queue:
+                await self._wait_for_batch()
+                await self._handle(self._take_batch())
+
+    async def _wait_for_batch(self):
+        """
+        Waits until a full batch is queued or the oldest request has
+        waited for the wait timeout.
+        """
+        deadline = self._queue[0].queued_at + self.controller.wait_timeout_s
+        while len(self._queue) < self.controller.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    def _take_batch(self) -> list["_Queued"]:
+        size = min(len(self._queue), self.controller.batch_size)
+        if self.length is None or len(self._queue) == size:
+            return [self._queue.popleft() for _ in range(size)]
+
+        # Take the oldest request and the queued requests closest to it in
+        # length, from a window of the oldest requests.
+        window = list(itertools.islice(self._queue, self.lookahead * size))
+        oldest = window[0].length
+        closest = sorted(
+            range(1, len(window)), key=lambda i: abs(window[i].length - oldest)
+        )
+        taken = {0, *closest[: size - 1]}
+        for _ in window:
+            self._queue.popleft()
+        self._queue.extendleft(
+            reversed([queued for i, queued in enumerate(window) if i not in taken])
+        )
+        return [window[i] for i in sorted(taken)]
+
+    async def _handle(self, batch: list["_Queued"]):
+        taken_at = time.monotonic()
+        queue_depth = len(self._queue)
+        if self.length is None:
+            buckets = [batch]
+        else:
+            buckets = [
+                [batch[i] for i in bucket]
+                for bucket in bucket_by_length(
+                    [queued.length for queued in batch],
+                    len(batch),
+                    self.max_batch_tokens,
+                )
+            ]
+
+        latencies = []
+        start = time.perf_counter()
+        for bucket in buckets:
+            await self._handle_bucket(bucket)
+            finished_at = time.monotonic()
+            latencies += [finished_at - queued.queued_at for queued in bucket]
+        self.controller.observe(
+            batch_size=len(batch),
+            inference_seconds=time.perf_counter() - start,
+            latencies=latencies,
+            queue_depth=queue_depth,
+            now=taken_at,
+        )
+
+    async def _handle_bucket(self, bucket: list["_Queued"]):
+        requests = [queued.request for queued in bucket]
+        try:
+            if inspect.iscoroutinefunction(self.handle_batch):
+                results = await self.handle_batch(requests)
+            else:
+                results = await asyncio.to_thread(self.handle_batch, requests)
+            if len(results) != len(requests):
+                raise ValueError(
+                    f"handle_batch returned {len(results)} results "
+                    f"for {len(requests)} requests"
+                )
+        except Exception as e:
+            for queued in bucket:
+                if not queued.future.done():
+                    queued.future.set_exception(e)
+            return
+
+        for queued, result in zip(bucket, results):
+            if not queued.future.done():
+                queued.future.set_result(result)
+
+
+@dataclass
+class _Queued:
+    request: Any
+    queued_at: float
+    future: asyncio.Future
+    length: int
+
+
+def bucket_by_length(
+    lengths: list[int], max_batch_size: int, max_batch_tokens: int | None = None
+) -> list[list[int]]:
+    """
+    Arguments:
+    lengths (list[int]): The length of each request, e.g. in tokens.
+    max_batch_size (int): The most requests to put in one batch.
+    max_batch_tokens (int): The most tokens to put in one batch, counting
+      each request as long as the batch's longest, as padding does.
+
+    Groups requests into batches of similar length, so that little of each
+    batch is padding. Returns the indices of the requests in each batch,
+    shortest requests first. A request longer than max_batch_tokens gets
+    a batch of its own.
+    """
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # In length order, the request being added is the batch's longest.
+        over_budget = (
+            max_batch_tokens is not None
+            and lengths[i] * (len(batch) + 1) > max_batch_tokens
+        )
+        if batch and (len(batch) == max_batch_size or over_budget):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def handle_bucketed(
+    handle_batch: Callable[[list], list],
+    requests: list,
+    length: Callable[[Any], int],
+    max_batch_size: int,
+    max_batch_tokens: int | None = None,
+) -> list:
+    """
+    Runs requests through handle_batch in batches of similar length (see
+    bucket_by_length()) and returns the results in the order of requests,
+    e.g. inside a Ray Serve @serve.batch handler:
+
+        return handle_bucketed(self._translate, texts, len, max_batch_size=16)
+    """
+    results = [None] * len(requests)
+    lengths = [length(request) for request in requests]
+    for batch in bucket_by_length(lengths, max_batch_size, max_batch_tokens):
+        for i, result in zip(batch, handle_batch([requests[i] for i in batch])):
+            results[i] = result
+    return results
@@ -0,0 +1,316 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Checkpointing training state to storage without stopping training.
+
+A CheckpointManager takes a snapshot of the training state when a
+checkpoint is due, every so many steps or seconds. Training continues
+while the snapshot is serialized and uploaded on a background thread.
+Only the last few checkpoints are kept, and an interrupted run resumes
+from the newest:
+
+    checkpoints = CheckpointManager(
+        storage_client,
+        f"{current.flow_name}/{current.run_id}/checkpoints",
+        every_steps=500,
+        serialize=torch.save,
+        deserialize=torch.load,
+        snapshot=lambda model: {
+            name: tensor.detach().to("cpu", copy=True)
+            for name, tensor in model.state_dict().items()
+        },
+    )
+    restored = checkpoints.restore()
+    first_step = restored.step + 1 if restored else 0
+    for step in range(first_step, steps):
+        train_one_step()
+        checkpoints.step(step, model)
+    checkpoints.close()
+"""
+
+import copy
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.retry import propagating
+
+logger = logging.getLogger(__name__)
+
+_CHECKPOINT_NAME = re.compile(r"step-(\d+)\.ckpt$")
+
+
+def _pickle(state, f: BinaryIO):
+    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+@dataclass
+class Checkpoint:
+    """
+    A stored checkpoint.
+
+    - step (int): The training step it was taken after
+    - path (str): Where it is stored
+    - state: The restored training state, once restored
+    """
+
+    step: int
+    path: str
+    state: Any = None
+
+
+@dataclass
+class CheckpointStats:
+    """
+    What checkpointing has cost so far.
+
+    - saved (int): Checkpoints stored
+    - deferred (int): Steps at which a due checkpoint was put off because
+      the previous one was still being stored
+    - failed (int): Checkpoints that could not be stored
+    - bytes (int): Bytes stored
+    - blocking_seconds (float): Time training spent waiting, taking snapshots
+    - background_seconds (float): Time spent serializing and uploading
+      while training continued
+    """
+
+    saved: int = 0
+    deferred: int = 0
+    failed: int = 0
+    bytes: int = 0
+    blocking_seconds: float = 0.0
+    background_seconds: float = 0.0
+
+
+class CheckpointManager:
+    """
+    Stores checkpoints of training state in the background.
+
+    Arguments:
+
+    - storage_client (CloudStorageAPIClient): Where checkpoints are stored
+    - prefix (str): The storage path under which this run's checkpoints are kept
+    - every_steps (int): Take a checkpoint every this many steps
+    - every_seconds (float): Take a checkpoint when this many seconds have
+      passed since the last one. With both set, whichever comes first.
+    - keep (int): How many of the newest checkpoints to keep; older ones
+      are deleted once a new one is stored. None keeps them all.
+    - serialize (Callable[[Any, BinaryIO], None]): Writes a snapshot to a
+      file, e.g. torch.save. Defaults to pickle.
+    - deserialize (Callable[[BinaryIO], Any]): Reads a snapshot back,
+      e.g. torch.load. Defaults to pickle.
+    - snapshot (Callable[[Any], Any]): Copies the training state at the
+      step, before training moves on and changes it, e.g. by copying a
+      model's tensors to the CPU. This is the only part of a checkpoint
+      that training waits for. Defaults to copy.deepcopy.
+    - local_directory (str): Where snapshots are serialized to before
+      they are uploaded. Defaults to the system's temporary directory.
+
+    Only one checkpoint is uploaded at a time. If the next checkpoint is
+    due before the previous one is stored, it is taken at the first step
+    after that, rather than making training wait.
+
+    A checkpoint that fails to be stored is logged and counted in .stats;
+    .wait() and .close() raise its error.
+    """
+
+    def __init__(
+        self,
+        storage_client: CloudStorageAPIClient,
+        prefix: str,
+        every_steps: int | None = None,
+        every_seconds: float | None = None,
+        keep: int | None = 3,
+        serialize: Callable[[Any, BinaryIO], None] = _pickle,
+        deserialize: Callable[[BinaryIO], Any] = pickle.load,
+        snapshot: Callable[[Any], Any] = copy.deepcopy,
+        local_directory: str | None = None,
+    ):
+        if every_steps is None and every_seconds is None:
+            raise ValueError("Set every_steps, every_seconds or both")
+        self.storage_client = storage_client
+        self.prefix = prefix.rstrip("/")
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.keep = keep
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.snapshot = snapshot
+        self.local_directory = local_directory
+        self.stats = CheckpointStats()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mozmlops-checkpoint"
+        )
+        self._pending: Future | None = None
+        self._error: BaseException | None = None
+        self._last_step: int | None = None
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def path(self, step: int) -> str:
+        """
+        Returns where the checkpoint of a step is stored. Steps are
+        zero-padded, so that checkpoints list in step order.
+        """
+        return f"{self.prefix}/step-{step:012d}.ckpt"
+
+    def due(self, step: int) -> bool:
+        """
+        Returns whether a checkpoint is due after this step.
+        """
+        if self.every_steps is not None and (
+            step - (self._last_step if self._last_step is not None else -1)
+            >= self.every_steps
+        ):
+            return True
+        return (
+            self.every_seconds is not None
+            and time.monotonic() - self._last_time >= self.every_seconds
+        )
+
+    def step(self, step: int, state) -> bool:
+        """
+        Arguments:
+        step (int): The training step that just finished.
+        state: The training state, e.g. a model, as it is after that step.
+
+        Call after every training step. Takes a checkpoint if one is due and
+        the previous one has been stored. Returns whether it took one.
+        """
+        if not self.due(step):
+            return False
+        if self._pending is not None and not self._pending.done():
+            with self._lock:
+                self.stats.deferred += 1
+            return False
+        self.save(step, state)
+        return True
+
+    def save(self, step: int, state) -> Future:
+        """
+        Takes a checkpoint of `state` after `step` now, waiting for the
+        previous one to be stored first if need be. Returns a Future that
+        completes once it is stored.
+        """
+        start = time.perf_counter()
+        if self._pending is not None:
+            self._pending.exception()
+        snapshot = self.snapshot(state)
+        with self._lock:
+            self.stats.blocking_seconds += time.perf_counter() - start
+
+        self._last_step = step
+        self._last_time = time.monotonic()
+        self._pending = self._executor.submit(propagating(self._store), step, snapshot)
+        return self._pending
+
+    def wait(self):
+        """
+        Waits until the checkpoint being stored, if any, is stored.
+        Raises the error of any checkpoint that failed since the last call.
+        """
+        if self._pending is not None:
+            self._pending.exception()
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """
+        Waits for the last checkpoint to be stored and stops the background
+        thread. Raises the error of any checkpoint that failed.
+        """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self) -> "CheckpointManager":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def checkpoints(self) -> list[Checkpoint]:
+        """
+        Returns the stored checkpoints, oldest first.
+        """
+        found = []
+        for info in self.storage_client.list(f"{self.prefix}/"):
+            match = _CHECKPOINT_NAME.search(info.path)
+            if match is not None and info.path == self.path(int(match.group(1))):
+                found.append(Checkpoint(step=int(match.group(1)), path=info.path))
+        return sorted(found, key=lambda checkpoint: checkpoint.step)
+
+    def restore(self) -> Checkpoint | None:
+        """
+        Returns the newest stored checkpoint, with its state, or None if
+        there is none. Training should resume at the step after its .step.
+        """
+        stored = self.checkpoints()
+        if not stored:
+            return None
+        latest = stored[-1]
+        local_path = self._local_path(latest.step)
+        try:
+            self.storage_client.fetch(latest.path, local_path)
+            with open(local_path, "rb") as f:
+                latest.state = self.deserialize(f)
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+        self._last_step = latest.step
+        self._last_time = time.monotonic()
+        logger.info(f"Restored the checkpoint of step {latest.step}")
+        return latest
+
+    def _store(self, step: int, snapshot):
+        start = time.perf_counter()
+        local_path = self._local_path(step)
+        try:
+            with open(local_path, "wb") as f:
+                self.serialize(snapshot, f)
+            size = os.path.getsize(local_path)
+            self.storage_client.store_file(local_path, self.path(step))
+            self._prune()
+        except BaseException as e:
+            logger.warning(f"Could not store the checkpoint of step {step}: {e}")
+            with self._lock:
+                self.stats.failed += 1
+                self.stats.background_seconds += time.perf_counter() - start
+                self._error = e
+            return
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+        with self._lock:
+            self.stats.saved += 1
+            self.stats.bytes += size
+            self.stats.background_seconds += time.perf_counter() - start
+
+    def _prune(self):
+        if self.keep is None:
+            return
+        stored = self.checkpoints()
+        for checkpoint in stored[: max(len(stored) - self.keep, 0)]:
+            self.storage_client.backend.delete(checkpoint.path)
+            logger.info(f"Deleted the old checkpoint {checkpoint.path}")
+
+    def _local_path(self, step: int) -> str:
+        directory = self.local_directory or tempfile.gettempdir()
+        return os.path.join(
+            directory, f"mozmlops-checkpoint-{os.getpid()}-{id(self)}-{step}.ckpt"
+        )
@@ -2,12 +2,123 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 import io
+import json
 import logging
-import sys
+import os
+import tempfile
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator
 
-logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+from mozmlops import compression as codecs
+from mozmlops._streaming import (
+    DEFAULT_CHUNK_SIZE,
+    chunk_stream,
+    digest_stream,
+    file_crc32c,
+    map_file,
+)
+from mozmlops.artifact_cache import ArtifactCache
+from mozmlops.instrumentation import Instrumentation, Measurement, measure
+from mozmlops.retry import RetryPolicy, TransferStats, propagating, tracking
+from mozmlops.storage_backends import (
+    GCSBackend,
+    ObjectAlreadyExistsError,
+    ObjectInfo,
+    StorageBackend,
+)
+
+logger = logging.getLogger(__name__)
+
+# The object metadata key that records the CRC32C of an object's content
+# before compression, so identical content can be recognized either way.
+CONTENT_CRC32C_METADATA_KEY = "mozmlops-content-crc32c"
+
+
+@dataclass
+class TransferResult:
+    """
+    The outcome of one object transfer within a bulk operation.
+
+    - path (str): The remote path of the object
+    - bytes_transferred (int): How many bytes were moved
+    - seconds (float): Wall time spent on this object
+    - error (Exception): The exception raised, if the transfer failed
+    - retries (int): How many requests had to be retried
+    - bytes_resent (int): How many bytes had to be moved again
+    """
+
+    path: str
+    bytes_transferred: int = 0
+    seconds: float = 0.0
+    error: Exception | None = None
+    retries: int = 0
+    bytes_resent: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BulkTransferReport:
+    """
+    Per-item results, in input order, and totals for a bulk operation.
+    """
+
+    results: list[TransferResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> list[TransferResult]:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> list[TransferResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def bytes_transferred(self) -> int:
+        return sum(r.bytes_transferred for r in self.results)
+
+    @property
+    def retries(self) -> int:
+        return sum(r.retries for r in self.results)
+
+    @property
+    def bytes_resent(self) -> int:
+        return sum(r.bytes_resent for r in self.results)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Overall throughput in bytes per second.
+        """
+        return self.bytes_transferred / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class SyncReport:
+    """
+    What a directory sync found and did.
+
+    - to_transfer (list[str]): Relative paths of the files that differ or are missing
+    - to_delete (list[str]): Relative paths of the extra files to delete
+    - unchanged (list[str]): Relative paths of the files that are already in sync
+    - bytes_to_transfer (int): The size of the files in to_transfer
+    - transfer (BulkTransferReport): The results of the transfers,
+      or None for a dry run
+    """
+
+    to_transfer: list[str] = field(default_factory=list)
+    to_delete: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    bytes_to_transfer: int = 0
+    transfer: BulkTransferReport | None = None
 
 
 class CloudStorageAPIClient:
@@ -17,52 +128,376 @@ class CloudStorageAPIClient:
     Arguments:
 
     - project_name (str): The GCS Project name
-    - bucket_name (str): The GCS Bucket name
+    - bucket_name (str): The GCS Bucket name to which that instance will
+      upload, and from which that instance will fetch
+    - max_pool_size (int): The maximum number of pooled HTTP connections to GCS
+    - chunk_size (int): How many bytes streaming uploads send per request;
+      must be a multiple of 256 KiB
+    - parallel_upload_threshold (int): Files of at least this many bytes are
+      uploaded by .store_file() as parallel parts composed on the server.
+      None (the default) turns this off.
+    - parallel_download_threshold (int): Objects of at least this many bytes
+      are downloaded by .fetch() as parallel byte ranges.
+      None (the default) turns this off.
+    - parallel_parts (int): How many parts large transfers are split into
+    - cache (ArtifactCache): An optional on-disk cache for .fetch(); when set,
+      .fetch() checks the object's metadata and skips the download if the
+      same version is already in the cache
+    - compression (str): Compresses everything this client stores with the
+      named codec: "gzip", "zstd" or "lz4" (see mozmlops.compression).
+      .fetch() decompresses compressed objects whatever this is set to.
+    - backend (StorageBackend): Where objects are actually stored. Defaults to
+      a GCSBackend built from the arguments above; pass a
+      LocalFilesystemBackend or InMemoryBackend (see mozmlops.storage_backends)
+      to work offline, in which case project_name and bucket_name are not needed.
+    - retry (RetryPolicy): How GCS transfers that fail transiently, e.g. with
+      a 429, a 503 or a dropped connection, are retried (see mozmlops.retry).
+      Interrupted transfers resume where they stopped.
+    - instrumentation (Instrumentation): Records how long each phase of
+      each operation takes, how many bytes it moves and how often it fails
+      (see mozmlops.instrumentation). None (the default) records nothing.
+
+    Retries, resent bytes and time spent on this client's transfers are
+    added up in its transfer_stats (a mozmlops.retry.TransferStats);
+    bulk operations also report them per object.
 
-    to which that instance will upload, and from which that instance will fetch.
+    The instance can be shared between threads.
     """
 
-    def __init__(self, project_name: str, bucket_name: str):
+    def __init__(
+        self,
+        project_name: str | None = None,
+        bucket_name: str | None = None,
+        max_pool_size: int = 10,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        parallel_upload_threshold: int | None = None,
+        parallel_download_threshold: int | None = None,
+        parallel_parts: int = 8,
+        cache: ArtifactCache | None = None,
+        compression: str | None = None,
+        backend: StorageBackend | None = None,
+        retry: RetryPolicy | None = None,
+        instrumentation: Instrumentation | None = None,
+    ):
+        if backend is None:
+            backend = GCSBackend(
+                project_name,
+                bucket_name,
+                max_pool_size=max_pool_size,
+                chunk_size=chunk_size,
+                parallel_upload_threshold=parallel_upload_threshold,
+                parallel_download_threshold=parallel_download_threshold,
+                parallel_parts=parallel_parts,
+                retry=retry,
+                instrumentation=instrumentation,
+            )
         self.gcs_project_name = project_name
         self.gcs_bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.compression = compression
+        self.backend = backend
+        self.transfer_stats = TransferStats()
+        self.instrumentation = instrumentation
+
+        # Fail early on a misspelled codec or a missing codec package.
+        self._codec = codecs.get_codec(compression) if compression else None
 
-    def store(self, data: bytes, storage_path: str) -> str:
+    def store(
+        self, data: bytes, storage_path: str, skip_if_identical: bool = False
+    ) -> str:
         """
         Arguments:
         data (bytes): The data to be stored in the cloud.
         storage_path (str): The filepath where the data will be stored.
+        skip_if_identical (bool): If an object with exactly this content is
+          already at storage_path, succeed without uploading it again.
 
         Places a blob of data, represented in bytes,
         at a specific filepath within the GCS project and bucket specified
         when the CloudStorageAPIClient was initialized.
+
+        Raises ObjectAlreadyExistsError if there already is an object at storage_path
+        (with different content, if skip_if_identical is set).
+
+        For data that should not be held in memory all at once, see
+        .store_file(), .store_stream() and .store_chunks().
         """
-        from google.cloud import storage
-        from google.cloud.exceptions import GoogleCloudError
 
-        client = storage.Client(project=self.gcs_project_name)
+        def upload(metadata=None):
+            with io.BytesIO(data) as f:
+                self._upload(f, storage_path, size=len(data), metadata=metadata)
 
-        # Raises an exception if the bucket name cannot be found
-        bucket = client.get_bucket(self.gcs_bucket_name)
+        if skip_if_identical:
+            with io.BytesIO(data) as f:
+                size, crc32c, _ = self._digest(f)
+            return self._store_unless_identical(storage_path, size, crc32c, upload)
 
-        blob = bucket.blob(storage_path)
+        upload()
+        return self._stored(storage_path)
 
-        with io.BytesIO(data) as f:
-            # TODO: Catch exceptions and report back.
+    def store_file(
+        self,
+        local_path: str,
+        storage_path: str,
+        chunk_size: int | None = None,
+        skip_if_identical: bool = False,
+    ) -> str:
+        """
+        Arguments:
+        local_path (str): The local file to be stored in the cloud.
+        storage_path (str): The filepath where the data will be stored.
+        chunk_size (int): Overrides the client's chunk_size for this upload.
+        skip_if_identical (bool): If an object with exactly this content is
+          already at storage_path, succeed without uploading it again.
 
-            # Google recommends setting `if_generation_match=0` if the
-            # object is expected to be new. We don't expect collisions,
-            # so setting this to 0 seems good.
-            try:
-                blob.upload_from_file(f, if_generation_match=0)
-                log_line = f"The model is stored at {storage_path}"
-                logging.info(log_line)
-            except GoogleCloudError as e:
-                if e.code == 412:
-                    raise Exception(
-                        "The object you tried to upload is already in the GCS bucket. Currently, the .store() function's implementation dictates this behavior."
-                    ).with_traceback(e.__traceback__)
-                raise e
+        Streams a local file to GCS without reading it into memory.
+        Files over the client's parallel_upload_threshold are uploaded
+        as parallel parts and composed into one object on the server.
+        """
+        if skip_if_identical:
+            with open(local_path, "rb") as f:
+                size, crc32c, _ = self._digest(f, chunk_size)
+            return self._store_file_unless_identical(
+                local_path, storage_path, size, crc32c, chunk_size
+            )
+
+        self._upload_file(local_path, storage_path, chunk_size)
+        return self._stored(storage_path)
+
+    def _upload_file(
+        self,
+        local_path: str,
+        storage_path: str,
+        chunk_size: int | None = None,
+        metadata: dict | None = None,
+        if_generation_match: int = 0,
+    ):
+        chunk_size = chunk_size or self.chunk_size
+        if self._codec is not None:
+            with open(local_path, "rb") as f:
+                self._upload(
+                    f,
+                    storage_path,
+                    chunk_size=chunk_size,
+                    metadata=metadata,
+                    if_generation_match=if_generation_match,
+                )
+        else:
+            with self._transfer("store") as transfer:
+                self.backend.upload_file(
+                    local_path,
+                    storage_path,
+                    chunk_size=chunk_size,
+                    metadata=metadata,
+                    if_generation_match=if_generation_match,
+                )
+                transfer.bytes = os.path.getsize(local_path)
+
+    def _store_file_unless_identical(
+        self,
+        local_path: str,
+        storage_path: str,
+        size: int,
+        crc32c: str,
+        chunk_size: int | None = None,
+    ) -> str:
+        return self._store_unless_identical(
+            storage_path,
+            size,
+            crc32c,
+            lambda metadata: self._upload_file(
+                local_path, storage_path, chunk_size, metadata
+            ),
+        )
+
+    def _store_unless_identical(
+        self,
+        storage_path: str,
+        size: int,
+        crc32c: str,
+        upload: Callable[[dict], None],
+    ) -> str:
+        """
+        Calls upload(metadata) unless storage_path already holds content
+        with this size and CRC32C.
+        """
+        if self._holds_content(storage_path, size, crc32c):
+            logger.info(f"Identical content is already at {storage_path}; skipped")
+            return storage_path
+
+        try:
+            upload({CONTENT_CRC32C_METADATA_KEY: crc32c})
+        except ObjectAlreadyExistsError:
+            # Someone else may have stored the same content in the meantime.
+            if not self._holds_content(storage_path, size, crc32c):
+                raise
+        return self._stored(storage_path)
+
+    def _holds_content(self, storage_path: str, size: int, crc32c: str) -> bool:
+        with self._measure("store", "metadata"):
+            info = self.backend.stat(storage_path)
+        if info is None:
+            return False
+        if CONTENT_CRC32C_METADATA_KEY in info.metadata:
+            return info.metadata[CONTENT_CRC32C_METADATA_KEY] == crc32c
+        if codecs.METADATA_KEY in info.metadata:
+            # Compressed without a record of the original content.
+            return False
+        return info.size == size and info.crc32c == crc32c
+
+    def store_content_addressed(
+        self,
+        files: dict[str, str],
+        prefix: str,
+        manifest_path: str | None = None,
+        max_workers: int = 8,
+    ) -> dict:
+        """
+        Arguments:
+        files (dict[str, str]): Maps a name of your choosing to a local file.
+        prefix (str): The remote directory to keep the content under.
+        manifest_path (str): Where to store the manifest, if anywhere.
+        max_workers (int): How many files are stored at the same time.
 
+        Stores each file at prefix/<SHA-256 of its content>, skipping content
+        that is already there, and returns a manifest that maps each name to
+        where its content lives:
+
+            {"files": {name: {"path": ..., "size": ..., "crc32c": ..., "sha256": ...}}}
+
+        Re-running a flow with unchanged files therefore uploads nothing.
+        Fetch the files back with .fetch_manifest().
+        """
+
+        def store_one(item) -> tuple[str, dict]:
+            name, local_path = item
+            with open(local_path, "rb") as f:
+                size, crc32c, sha256 = self._digest(f)
+            path = f"{prefix.rstrip('/')}/{sha256}"
+            self._store_file_unless_identical(local_path, path, size, crc32c)
+            return name, {
+                "path": path,
+                "size": size,
+                "crc32c": crc32c,
+                "sha256": sha256,
+            }
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            manifest = {"files": dict(executor.map(store_one, files.items()))}
+
+        if manifest_path is not None:
+            self.store(
+                json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+                manifest_path,
+                skip_if_identical=True,
+            )
+        return manifest
+
+    def fetch_manifest(
+        self, manifest_path: str, local_directory: str, max_workers: int = 8
+    ) -> BulkTransferReport:
+        """
+        Arguments:
+        manifest_path (str): A manifest stored by .store_content_addressed().
+        local_directory (str): Where to place the files, under their manifest names.
+        max_workers (int): How many files are fetched at the same time.
+
+        Fetches every file listed in a manifest.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            local_manifest = self.fetch(manifest_path, f"{directory}/manifest.json")
+            with open(local_manifest) as f:
+                manifest = json.load(f)
+
+        return self.fetch_many(
+            [
+                (entry["path"], os.path.join(local_directory, name))
+                for name, entry in manifest["files"].items()
+            ],
+            max_workers=max_workers,
+        )
+
+    def store_stream(
+        self, stream: BinaryIO, storage_path: str, chunk_size: int | None = None
+    ) -> str:
+        """
+        Arguments:
+        stream (BinaryIO): A readable binary file-like object, positioned at its start.
+        storage_path (str): The filepath where the data will be stored.
+        chunk_size (int): Overrides the client's chunk_size for this upload.
+
+        Streams the contents of a file-like object to GCS with a resumable upload,
+        holding at most one chunk in memory at a time.
+        """
+        self._upload(stream, storage_path, chunk_size=chunk_size)
+        return self._stored(storage_path)
+
+    def store_chunks(
+        self,
+        chunks: Iterable[bytes],
+        storage_path: str,
+        chunk_size: int | None = None,
+    ) -> str:
+        """
+        Arguments:
+        chunks (Iterable[bytes]): The data to be stored, as an iterable of byte strings.
+        storage_path (str): The filepath where the data will be stored.
+        chunk_size (int): Overrides the client's chunk_size for this upload.
+
+        Streams data produced piece by piece, for example by a generator,
+        to GCS without joining it in memory first.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        with chunk_stream(chunks, chunk_size) as f:
+            return self.store_stream(f, storage_path, chunk_size=chunk_size)
+
+    def _upload(
+        self,
+        stream: BinaryIO,
+        storage_path: str,
+        size: int | None = None,
+        chunk_size: int | None = None,
+        metadata: dict | None = None,
+        if_generation_match: int = 0,
+    ):
+        """
+        Uploads a stream through the backend, compressing it on the way
+        if the client has a compression codec.
+        """
+        with self._transfer("store") as transfer:
+            chunk_size = chunk_size or self.chunk_size
+            if self._codec is None:
+                self.backend.upload(
+                    stream,
+                    storage_path,
+                    size=size,
+                    chunk_size=chunk_size,
+                    metadata=metadata,
+                    if_generation_match=if_generation_match,
+                )
+                transfer.bytes = size if size is not None else _tell(stream)
+                return
+
+            chunks = iter(lambda: stream.read(chunk_size), b"")
+            with chunk_stream(
+                codecs.compress_chunks(chunks, self._codec), chunk_size
+            ) as f:
+                self.backend.upload(
+                    f,
+                    storage_path,
+                    chunk_size=chunk_size,
+                    metadata={
+                        **(metadata or {}),
+                        codecs.METADATA_KEY: self._codec.name,
+                    },
+                    if_generation_match=if_generation_match,
+                )
+                transfer.bytes = f.tell()
+
+    def _stored(self, storage_path: str) -> str:
+        log_line = f"The model is stored at {storage_path}"
+        logger.info(log_line)
         return storage_path
 
     def fetch(self, remote_path: str, local_path: str) -> str:
@@ -74,19 +509,472 @@ class CloudStorageAPIClient:
         Fetches a file
         at a specific remote_path within the GCS project and bucket specified
         and stores it at a location specified by local_path.
-        """
-        from google.cloud import storage
-
-        client = storage.Client(project=self.gcs_project_name)
-        bucket = client.get_bucket(self.gcs_bucket_name)
-
-        blob = bucket.blob(remote_path)
 
+        Objects over the client's parallel_download_threshold are downloaded
+        as parallel byte ranges into a preallocated file.
+        If the client has a cache, unchanged objects are copied from it instead.
+        Objects stored with compression are decompressed.
+        Transient failures are retried; an interrupted download resumes
+        from the last byte received.
+        """
         # Create any directory that's needed.
         p = Path(local_path)
         p.parent.mkdir(parents=True, exist_ok=True)
 
-        blob.download_to_filename(local_path)
+        info = None
+        if self.cache is not None:
+            # The cache key needs the generation and CRC32C up front.
+            with self._measure("fetch", "metadata"):
+                info = self.backend.stat(remote_path)
+
+        with self._transfer("fetch") as transfer:
+            if info is None:
+                self.backend.download(remote_path, local_path)
+            else:
+                key = ArtifactCache.key(
+                    self.backend.name, remote_path, info.generation, info.crc32c
+                )
+                self.cache.fetch(
+                    key,
+                    lambda path: self.backend.download(remote_path, path, info),
+                    local_path,
+                )
+            transfer.bytes = os.path.getsize(local_path)
+
+        self._decompress_if_needed(remote_path, local_path, info)
+        return local_path
+
+    def _decompress_if_needed(self, remote_path: str, local_path: str, info):
+        """
+        Decompresses a fetched file in place if it was stored compressed.
+        Only files that start like compressed data cost a metadata lookup.
+        """
+        with open(local_path, "rb") as f:
+            if not codecs.sniff(f.read(codecs.MAGIC_LENGTH)):
+                return
+
+        if info is None:
+            with self._measure("fetch", "metadata"):
+                info = self.backend.stat(remote_path)
+        codec_name = info.metadata.get(codecs.METADATA_KEY) if info else None
+        if codec_name is None:
+            return
+
+        compressed_path = f"{local_path}.compressed"
+        os.replace(local_path, compressed_path)
+        try:
+            with self._measure("fetch", "local_write") as local_write:
+                codecs.decompress_file(
+                    compressed_path, local_path, codecs.get_codec(codec_name)
+                )
+                local_write.bytes = os.path.getsize(local_path)
+        finally:
+            os.remove(compressed_path)
+
+    def read_range(self, remote_path: str, offset: int, length: int) -> bytes:
+        """
+        Arguments:
+        remote_path (str): The filepath on GCS from which to read.
+        offset (int): The first byte to read.
+        length (int): How many bytes to read.
+
+        Reads part of an object without downloading the rest of it.
+        Returns fewer than `length` bytes if the object ends first.
+        Objects stored with compression are read as stored, i.e. compressed.
+        """
+        buffer = bytearray(length)
+        n = self.read_range_into(remote_path, offset, buffer)
+        del buffer[n:]
+        return bytes(buffer)
+
+    def read_range_into(self, remote_path: str, offset: int, buffer) -> int:
+        """
+        Arguments:
+        remote_path (str): The filepath on GCS from which to read.
+        offset (int): The first byte to read.
+        buffer: A writable buffer, e.g. a bytearray or a NumPy array, to fill.
+
+        Reads part of an object straight into a caller-provided buffer,
+        as many bytes as fit. Returns the number of bytes read.
+        """
+        with self._transfer("read_range") as transfer:
+            transfer.bytes = self.backend.read_range_into(remote_path, offset, buffer)
+        return transfer.bytes
+
+    def read_ranges(
+        self,
+        remote_path: str,
+        ranges: Iterable[tuple[int, int]],
+        max_workers: int = 8,
+    ) -> list[bytes]:
+        """
+        Arguments:
+        remote_path (str): The filepath on GCS from which to read.
+        ranges (Iterable[tuple[int, int]]): (offset, length) pairs to read.
+        max_workers (int): How many ranges are read at the same time.
+
+        Reads several parts of one object concurrently, all from the same
+        version of it, and returns them in the order they were asked for.
+        """
+        with self._measure("read_range", "metadata"):
+            info = self.backend.stat(remote_path)
+        if info is None:
+            raise FileNotFoundError(f"No such object: {remote_path}")
+
+        def read_one(byte_range) -> bytes:
+            offset, length = byte_range
+            buffer = bytearray(length)
+            with self._transfer("read_range") as transfer:
+                transfer.bytes = self.backend.read_range_into(
+                    remote_path, offset, buffer, generation=info.generation
+                )
+            del buffer[transfer.bytes :]
+            return bytes(buffer)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(propagating(read_one), ranges))
+
+    def fetch_mmap(
+        self,
+        remote_path: str,
+        local_path: str,
+        dtype=None,
+        shape: tuple | None = None,
+        offset: int = 0,
+    ):
+        """
+        Arguments:
+        remote_path (str): The filepath on GCS from which to fetch the data.
+        local_path (str): The local filepath in which to store the data.
+        dtype: If given, a NumPy dtype to view the data as.
+        shape (tuple): The shape of the NumPy array; by default, one dimension.
+        offset (int): Where in the file the NumPy array starts.
+
+        Fetches a file (through the cache, if the client has one) and maps it
+        into memory read-only, so its pages are only loaded as they are used.
+        Returns a read-only memoryview, or a read-only NumPy array if dtype is
+        given. Neither copies the file's contents.
+        """
+        self.fetch(remote_path=remote_path, local_path=local_path)
+
+        if dtype is not None:
+            import numpy as np
+
+            return np.memmap(
+                local_path, mode="r", dtype=dtype, shape=shape, offset=offset
+            )
+
+        return map_file(local_path)
+
+    def list(
+        self,
+        prefix: str = "",
+        delimiter: str | None = None,
+        page_size: int | None = None,
+    ) -> Iterator[ObjectInfo | str]:
+        """
+        Arguments:
+        prefix (str): Only list objects whose path starts with this.
+        delimiter (str): Group objects below the next occurrence of this,
+          e.g. "/", into one entry per "subdirectory".
+        page_size (int): How many entries to request from GCS at a time.
+
+        Yields an ObjectInfo (see mozmlops.storage_backends) for each object
+        and, with a delimiter, the path of each subdirectory as a str ending
+        in the delimiter. Pages are requested lazily, so stopping early
+        saves the requests for the rest.
+
+        For repeated lookups over a large bucket, see mozmlops.metadata_index.
+        """
+        return self.backend.list_objects(prefix, delimiter, page_size)
+
+    def store_many(
+        self,
+        items: Iterable[tuple[bytes, str]],
+        max_workers: int = 8,
+        skip_if_identical: bool = False,
+    ) -> BulkTransferReport:
+        """
+        Arguments:
+        items (Iterable[tuple[bytes, str]]): (data, storage_path) pairs to store.
+        max_workers (int): How many uploads run at the same time.
+        skip_if_identical (bool): See .store().
+
+        Stores many blobs concurrently on a bounded thread pool.
+        A failed upload does not stop the others: check the returned report's
+        `failed` list for the per-item errors.
+        """
+
+        def store_one(item) -> int:
+            data, storage_path = item
+            self.store(
+                data=data,
+                storage_path=storage_path,
+                skip_if_identical=skip_if_identical,
+            )
+            return len(data)
+
+        return self._run_many(store_one, items, lambda item: item[1], max_workers)
+
+    def fetch_many(
+        self, items: Iterable[tuple[str, str]], max_workers: int = 8
+    ) -> BulkTransferReport:
+        """
+        Arguments:
+        items (Iterable[tuple[str, str]]): (remote_path, local_path) pairs to fetch.
+        max_workers (int): How many downloads run at the same time.
+
+        Fetches many files concurrently on a bounded thread pool.
+        A failed download does not stop the others: check the returned report's
+        `failed` list for the per-item errors.
+        """
+
+        def fetch_one(item) -> int:
+            remote_path, local_path = item
+            self.fetch(remote_path=remote_path, local_path=local_path)
+            return os.path.getsize(local_path)
+
+        return self._run_many(fetch_one, items, lambda item: item[0], max_workers)
+
+    def upload_dir(
+        self,
+        local_directory: str,
+        prefix: str,
+        delete: bool = False,
+        dry_run: bool = False,
+        checksum: bool = True,
+        max_workers: int = 8,
+    ) -> SyncReport:
+        """
+        Arguments:
+        local_directory (str): The directory to mirror.
+        prefix (str): The remote directory to mirror it to.
+        delete (bool): Also delete remote objects under prefix that have
+          no counterpart in local_directory.
+        dry_run (bool): Only report what would be transferred and deleted.
+        checksum (bool): Compare files by CRC32C. If False, a file counts as
+          changed when its size differs or it was modified after the remote
+          object was stored, which avoids reading every local file.
+        max_workers (int): How many files are transferred at the same time.
+
+        Uploads the files of a local directory that are missing or differ
+        under prefix, like `rsync -r`, listing the remote objects only once.
+        Changed objects are replaced only if nobody else replaced them since
+        they were listed.
+        """
+        prefix = _directory_prefix(prefix)
+        remote = self._list_relative(prefix)
+        local = _list_local_files(local_directory)
+
+        report = SyncReport()
+        for name, local_path in local.items():
+            info = remote.get(name)
+            if info is not None and self._in_sync(local_path, info, checksum, True):
+                report.unchanged.append(name)
+            else:
+                report.to_transfer.append(name)
+                report.bytes_to_transfer += os.path.getsize(local_path)
+        if delete:
+            report.to_delete = sorted(set(remote) - set(local))
+
+        logger.info(
+            f"Uploading {len(report.to_transfer)} files ({report.bytes_to_transfer} "
+            f"bytes) to {prefix}, deleting {len(report.to_delete)}"
+        )
+        if dry_run:
+            return report
+
+        def upload_one(name: str) -> int:
+            info = remote.get(name)
+            self._upload_file(
+                local[name],
+                prefix + name,
+                metadata={CONTENT_CRC32C_METADATA_KEY: file_crc32c(local[name])},
+                if_generation_match=info.generation if info else 0,
+            )
+            return os.path.getsize(local[name])
+
+        report.transfer = self._run_many(
+            upload_one, report.to_transfer, lambda name: prefix + name, max_workers
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(
+                executor.map(
+                    lambda name: self.backend.delete(prefix + name), report.to_delete
+                )
+            )
+        return report
+
+    def download_dir(
+        self,
+        prefix: str,
+        local_directory: str,
+        delete: bool = False,
+        dry_run: bool = False,
+        checksum: bool = True,
+        max_workers: int = 8,
+    ) -> SyncReport:
+        """
+        Arguments:
+        prefix (str): The remote directory to mirror.
+        local_directory (str): The directory to mirror it to.
+        delete (bool): Also delete local files that have no counterpart under prefix.
+        dry_run (bool): Only report what would be transferred and deleted.
+        checksum (bool): Compare files by CRC32C. If False, a file counts as
+          changed when its size differs or it is older than the remote object.
+        max_workers (int): How many files are transferred at the same time.
+
+        Fetches the objects under prefix that are missing from or differ in
+        a local directory, like `rsync -r`, listing the remote objects only once.
+        Fetched files get the remote object's modification time, so that
+        later syncs with checksum=False recognize them.
+        """
+        prefix = _directory_prefix(prefix)
+        remote = self._list_relative(prefix)
+        local = _list_local_files(local_directory)
+
+        report = SyncReport()
+        for name, info in remote.items():
+            local_path = local.get(name)
+            if local_path is not None and self._in_sync(
+                local_path, info, checksum, False
+            ):
+                report.unchanged.append(name)
+            else:
+                report.to_transfer.append(name)
+                report.bytes_to_transfer += info.size
+        if delete:
+            report.to_delete = sorted(set(local) - set(remote))
+
+        logger.info(
+            f"Downloading {len(report.to_transfer)} files ({report.bytes_to_transfer} "
+            f"bytes) from {prefix}, deleting {len(report.to_delete)}"
+        )
+        if dry_run:
+            return report
+
+        def download_one(name: str) -> int:
+            local_path = _local_path_within(local_directory, name)
+            self.fetch(prefix + name, local_path)
+            updated = remote[name].updated
+            if updated is not None:
+                os.utime(local_path, (updated.timestamp(), updated.timestamp()))
+            return os.path.getsize(local_path)
+
+        report.transfer = self._run_many(
+            download_one, report.to_transfer, lambda name: prefix + name, max_workers
+        )
+        for name in report.to_delete:
+            os.remove(local[name])
+        return report
+
+    def _list_relative(self, prefix: str) -> dict[str, ObjectInfo]:
+        """
+        Lists the objects under prefix, keyed by their path relative to it.
+        """
+        with self._measure("sync", "metadata"):
+            return {
+                info.path[len(prefix) :]: info
+                for info in self.backend.list_objects(prefix)
+            }
+
+    def _in_sync(
+        self, local_path: str, info: ObjectInfo, checksum: bool, uploading: bool
+    ) -> bool:
+        """
+        Returns whether a local file and a remote object hold the same content,
+        judging by CRC32C, or by size and modification time if not checksum.
+        """
+        compressed = codecs.METADATA_KEY in info.metadata
+        if checksum:
+            remote_crc32c = info.metadata.get(CONTENT_CRC32C_METADATA_KEY)
+            if remote_crc32c is None and not compressed:
+                remote_crc32c = info.crc32c or self._stored_crc32c(info.path)
+            return remote_crc32c is not None and remote_crc32c == file_crc32c(
+                local_path
+            )
+
+        # The stored size of a compressed object says nothing about its content.
+        if not compressed and info.size != os.path.getsize(local_path):
+            return False
+        if info.updated is None:
+            return False
+        local_mtime = os.path.getmtime(local_path)
+        remote_mtime = info.updated.timestamp()
+        if uploading:
+            return local_mtime <= remote_mtime
+        return local_mtime >= remote_mtime
+
+    def _stored_crc32c(self, storage_path: str) -> str | None:
+        """
+        Returns the CRC32C of a stored object, for backends that leave it
+        out of listings.
+        """
+        with self._measure("sync", "metadata"):
+            info = self.backend.stat(storage_path)
+        return None if info is None else info.crc32c
+
+    def _digest(self, stream, chunk_size: int | None = None) -> tuple[int, str, str]:
+        with self._measure("store", "checksum") as checksum:
+            size, crc32c, sha256 = digest_stream(stream, chunk_size or self.chunk_size)
+            checksum.bytes = size
+        return size, crc32c, sha256
+
+    def _measure(self, operation: str, phase: str):
+        return measure(self.instrumentation, operation, phase)
+
+    @contextmanager
+    def _transfer(self, operation: str) -> Iterator[Measurement]:
+        """
+        Counts the with block as a transfer in transfer_stats, and times it
+        as the "transfer" phase of `operation`. Set .bytes on the Measurement
+        it yields.
+        """
+        with (
+            tracking(self.transfer_stats),
+            self._measure(operation, "transfer") as transfer,
+        ):
+            yield transfer
+
+    def _run_many(
+        self,
+        transfer: Callable[[tuple], int],
+        items: Iterable[tuple],
+        remote_path_of: Callable[[tuple], str],
+        max_workers: int,
+    ) -> BulkTransferReport:
+        """
+        Runs `transfer`, which returns the number of bytes it moved,
+        over every item on a thread pool and collects the results.
+        """
+
+        def run_one(item) -> TransferResult:
+            result = TransferResult(path=remote_path_of(item))
+            start = time.perf_counter()
+            with tracking(TransferStats()) as stats:
+                try:
+                    result.bytes_transferred = transfer(item)
+                except Exception as e:
+                    result.error = e
+                    logger.warning(f"Transfer of {result.path} failed: {e}")
+            result.seconds = time.perf_counter() - start
+            result.retries = stats.retries
+            result.bytes_resent = stats.bytes_resent
+            return result
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(propagating(run_one), items))
+        report = BulkTransferReport(
+            results=results, seconds=time.perf_counter() - start
+        )
+
+        logger.info(
+            f"Transferred {report.bytes_transferred} bytes in {len(report.succeeded)} "
+            f"objects ({len(report.failed)} failed, {report.retries} retries) at "
+            f"{report.throughput / 1e6:.2f} MB/s"
+        )
+        return report
 
     def __delete(self, remote_path: str) -> str:
         """
@@ -98,11 +986,49 @@ class CloudStorageAPIClient:
         Deletes a file
         at a specific remote_path within the GCS project and bucket specified.
         """
-        from google.cloud import storage
+        self.backend.delete(remote_path)
 
-        client = storage.Client(project=self.gcs_project_name)
-        bucket = client.get_bucket(self.gcs_bucket_name)
 
-        blob = bucket.blob(remote_path)
+def _tell(stream) -> int:
+    """
+    Returns how far a stream has been read, or 0 if it cannot tell.
+    """
+    try:
+        return stream.tell()
+    except (AttributeError, OSError):
+        return 0
 
-        blob.delete()
+
+def _directory_prefix(prefix: str) -> str:
+    """
+    Normalizes a remote directory to "" or a path ending in "/".
+    """
+    prefix = prefix.strip("/")
+    return f"{prefix}/" if prefix else ""
+
+
+def _local_path_within(local_directory: str, name: str) -> str:
+    """
+    Returns the local path of the "/"-separated relative path `name` under
+    local_directory. Raises ValueError if it would lie outside it, e.g. for
+    an object named "../x" or "/etc/x".
+    """
+    root = os.path.realpath(local_directory)
+    local_path = os.path.realpath(os.path.join(root, *name.split("/")))
+    if os.path.commonpath([root, local_path]) != root or local_path == root:
+        raise ValueError(f"{name!r} would be stored outside {local_directory}")
+    return local_path
+
+
+def _list_local_files(local_directory: str) -> dict[str, str]:
+    """
+    Maps the relative, "/"-separated path of every file under local_directory
+    to its local path.
+    """
+    files = {}
+    for dirpath, _, filenames in os.walk(local_directory):
+        for filename in filenames:
+            local_path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(local_path, local_directory)
+            files[Path(relative).as_posix()] = local_path
+    return files
@@ -0,0 +1,202 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Streaming compression codecs for stored artifacts.
+
+gzip is always available. zstd needs the `zstandard` package
+and lz4 needs the `lz4` package.
+
+CloudStorageAPIClient(compression="zstd") compresses everything it stores
+and records the codec in the object's metadata under METADATA_KEY;
+.fetch() decompresses such objects automatically.
+"""
+
+import gzip
+import shutil
+import zlib
+
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterable, Iterator
+
+# The object metadata key that records which codec compressed an object.
+METADATA_KEY = "mozmlops-compression"
+
+
+class Codec(ABC):
+    """
+    A streaming compression format.
+
+    - name (str): The name recorded in object metadata
+    - magic (bytes): The bytes every compressed stream starts with
+    """
+
+    name: str
+    magic: bytes
+
+    @abstractmethod
+    def compressor(self):
+        """
+        Returns an object with .compress(bytes) -> bytes and .flush() -> bytes.
+        """
+
+    @abstractmethod
+    def decompressor(self):
+        """
+        Returns an object with .decompress(bytes) -> bytes.
+        """
+
+    @abstractmethod
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        """
+        Returns a file-like object whose .read(size) decompresses `stream`
+        a bounded amount at a time.
+        """
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    magic = b"\x1f\x8b"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compressor(self):
+        # wbits=31 selects the gzip container.
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def decompressor(self):
+        return zlib.decompressobj(31)
+
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    magic = b"\x28\xb5\x2f\xfd"
+
+    def __init__(self, level: int = 3):
+        import zstandard
+
+        self.level = level
+        self._zstandard = zstandard
+
+    def compressor(self):
+        return self._zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return self._zstandard.ZstdDecompressor().decompressobj()
+
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        return self._zstandard.ZstdDecompressor().stream_reader(
+            stream, read_across_frames=True
+        )
+
+
+class _LZ4Compressor:
+    def __init__(self, lz4_frame):
+        self._compressor = lz4_frame.LZ4FrameCompressor()
+        self._header = self._compressor.begin()
+
+    def compress(self, data: bytes) -> bytes:
+        header, self._header = self._header, b""
+        return header + self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        header, self._header = self._header, b""
+        return header + self._compressor.flush()
+
+
+class LZ4Codec(Codec):
+    name = "lz4"
+    magic = b"\x04\x22\x4d\x18"
+
+    def __init__(self):
+        import lz4.frame
+
+        self._lz4_frame = lz4.frame
+
+    def compressor(self):
+        return _LZ4Compressor(self._lz4_frame)
+
+    def decompressor(self):
+        return self._lz4_frame.LZ4FrameDecompressor()
+
+    def reader(self, stream: BinaryIO) -> BinaryIO:
+        return self._lz4_frame.LZ4FrameFile(stream, mode="rb")
+
+
+_CODECS = {"gzip": GzipCodec, "zstd": ZstdCodec, "lz4": LZ4Codec}
+
+# The longest magic number, i.e. how many bytes sniff() needs.
+MAGIC_LENGTH = 4
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Returns the codec called `name`.
+    Raises ValueError for an unknown name, and ImportError if the codec's
+    package is not installed.
+    """
+    if name not in _CODECS:
+        raise ValueError(f"Unknown compression {name!r}; choose from {list(_CODECS)}")
+    try:
+        return _CODECS[name]()
+    except ImportError as e:
+        raise ImportError(
+            f"The {name} codec needs an extra package: {e.name}. Try `pip install {e.name}`."
+        ) from e
+
+
+def available_codecs() -> list[str]:
+    """
+    Returns the names of the codecs whose packages are installed.
+    """
+    available = []
+    for name in _CODECS:
+        try:
+            get_codec(name)
+            available.append(name)
+        except ImportError:
+            pass
+    return available
+
+
+def sniff(header: bytes) -> bool:
+    """
+    Returns whether `header`, the first bytes of a stream,
+    looks like the start of any codec's output.
+    """
+    return any(header.startswith(codec.magic) for codec in _CODECS.values())
+
+
+def compress_chunks(chunks: Iterable[bytes], codec: Codec) -> Iterator[bytes]:
+    """
+    Compresses a stream of chunks, yielding compressed chunks.
+    """
+    compressor = codec.compressor()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def decompress_file(
+    source_path: str,
+    destination_path: str,
+    codec: Codec,
+    chunk_size: int = 64 * 1024,
+):
+    """
+    Decompresses one file into another, writing at most chunk_size
+    decompressed bytes at a time, however much each compressed byte
+    expands, so that memory stays bounded.
+    """
+    with (
+        open(source_path, "rb") as source,
+        codec.reader(source) as reader,
+        open(destination_path, "wb") as destination,
+    ):
+        shutil.copyfileobj(reader, destination, chunk_size)
@@ -0,0 +1,246 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Evaluating classifiers in parallel, shard by shard.
+
+ClassificationMetrics accumulates the confusion matrix, top-k hits and
+calibration bins of a classifier's predictions with NumPy, batch by
+batch, in a state of fixed size whatever the size of the dataset.
+States computed on separate shards of a dataset merge into the state of
+the whole, so evaluation fans out across Metaflow foreach branches, or
+the processes of evaluate_parallel(), and a join reduces the results:
+
+    @step
+    def start(self):
+        self.shards = list(range(8))
+        self.next(self.evaluate, foreach="shards")
+
+    @step
+    def evaluate(self):
+        testset = StreamingDataset(storage_client, "cifar10/test", rank=self.input, world_size=8)
+        self.metrics = evaluate(batched(testset, 256), model.predict, num_classes=10)
+        self.next(self.join)
+
+    @step
+    def join(self, inputs):
+        print(merge_metrics(branch.metrics for branch in inputs).result())
+"""
+
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+
+
+class ClassificationMetrics:
+    """
+    Mergeable metrics of a classifier.
+
+    Arguments:
+
+    - num_classes (int): How many classes there are
+    - top_k (Iterable[int]): The k of each top-k accuracy to compute
+    - calibration_bins (int): How many equal-width confidence bins the
+      expected calibration error is estimated over
+
+    Feed it batches of scores and labels with .update(), combine states
+    of different shards with .merge(), and read the metrics with .result().
+    """
+
+    def __init__(
+        self,
+        num_classes: int,
+        top_k: Iterable[int] = (1, 5),
+        calibration_bins: int = 15,
+    ):
+        self.num_classes = num_classes
+        self.top_k = tuple(top_k)
+        self.calibration_bins = calibration_bins
+        # Rows are labels, columns predictions.
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_hits = np.zeros(len(self.top_k), dtype=np.int64)
+        self.bin_counts = np.zeros(calibration_bins, dtype=np.int64)
+        self.bin_hits = np.zeros(calibration_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(calibration_bins, dtype=np.float64)
+
+    @property
+    def count(self) -> int:
+        return int(self.confusion.sum())
+
+    def update(self, scores, labels, from_logits: bool = True):
+        """
+        Arguments:
+        scores: A (batch, num_classes) array, or CPU or GPU tensor, of the
+          model's scores for each class.
+        labels: The batch's labels, as class indices.
+        from_logits (bool): Whether scores are logits, to be turned into
+          probabilities with a softmax, or already probabilities.
+        """
+        scores = _to_numpy(scores).astype(np.float64, copy=False)
+        labels = _to_numpy(labels).astype(np.int64, copy=False).reshape(-1)
+        if scores.shape != (len(labels), self.num_classes):
+            raise ValueError(
+                f"Expected scores of shape ({len(labels)}, {self.num_classes}), "
+                f"got {scores.shape}"
+            )
+        if len(labels) == 0:
+            return
+        if labels.min() < 0 or labels.max() >= self.num_classes:
+            raise ValueError(f"Labels must be in [0, {self.num_classes})")
+
+        probabilities = _softmax(scores) if from_logits else scores
+        predictions = probabilities.argmax(axis=1)
+        self.confusion += np.bincount(
+            labels * self.num_classes + predictions,
+            minlength=self.num_classes**2,
+        ).reshape(self.num_classes, self.num_classes)
+
+        label_scores = probabilities[np.arange(len(labels)), labels]
+        # A label is in the top k if fewer than k classes score higher.
+        higher = (probabilities > label_scores[:, None]).sum(axis=1)
+        for i, k in enumerate(self.top_k):
+            self.top_k_hits[i] += int((higher < k).sum())
+
+        confidence = probabilities.max(axis=1)
+        bins = np.minimum(
+            (confidence * self.calibration_bins).astype(np.int64),
+            self.calibration_bins - 1,
+        )
+        self.bin_counts += np.bincount(bins, minlength=self.calibration_bins)
+        self.bin_hits += np.bincount(
+            bins, weights=predictions == labels, minlength=self.calibration_bins
+        ).astype(np.int64)
+        self.bin_confidence += np.bincount(
+            bins, weights=confidence, minlength=self.calibration_bins
+        )
+
+    def merge(self, other: "ClassificationMetrics") -> "ClassificationMetrics":
+        """
+        Adds the state of another shard to this one, and returns this one.
+        Raises ValueError if the two track different metrics.
+        """
+        if (other.num_classes, other.top_k, other.calibration_bins) != (
+            self.num_classes,
+            self.top_k,
+            self.calibration_bins,
+        ):
+            raise ValueError("Cannot merge metrics with different settings")
+        self.confusion += other.confusion
+        self.top_k_hits += other.top_k_hits
+        self.bin_counts += other.bin_counts
+        self.bin_hits += other.bin_hits
+        self.bin_confidence += other.bin_confidence
+        return self
+
+    def result(self) -> dict[str, Any]:
+        """
+        Returns the count of examples, accuracy, each top-k accuracy,
+        the expected calibration error and per-class precision and recall.
+        """
+        count = self.count
+        correct = np.diag(self.confusion)
+        predicted = self.confusion.sum(axis=0)
+        actual = self.confusion.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, correct / predicted, 0.0)
+            recall = np.where(actual > 0, correct / actual, 0.0)
+        calibration_gap = np.abs(self.bin_hits - self.bin_confidence).sum()
+
+        return {
+            "count": count,
+            "accuracy": correct.sum() / count if count else 0.0,
+            **{
+                f"top_{k}_accuracy": hits / count if count else 0.0
+                for k, hits in zip(self.top_k, self.top_k_hits.tolist())
+            },
+            "expected_calibration_error": calibration_gap / count if count else 0.0,
+            "precision": precision.tolist(),
+            "recall": recall.tolist(),
+        }
+
+
+def merge_metrics(states: Iterable[ClassificationMetrics]) -> ClassificationMetrics:
+    """
+    Returns the merged state of the states of every shard, e.g. in a join step.
+    """
+    states = iter(states)
+    first = next(states)
+    merged = ClassificationMetrics(
+        first.num_classes, first.top_k, first.calibration_bins
+    ).merge(first)
+    for state in states:
+        merged.merge(state)
+    return merged
+
+
+def evaluate(
+    batches: Iterable,
+    predict: Callable[[Any], Any],
+    num_classes: int,
+    from_logits: bool = True,
+    top_k: Iterable[int] = (1, 5),
+    calibration_bins: int = 15,
+) -> ClassificationMetrics:
+    """
+    Arguments:
+    batches (Iterable): (inputs, labels) batches, e.g. from a DataLoader
+      or batched().
+    predict (Callable[[Any], Any]): Returns the scores of a batch of inputs.
+    num_classes, top_k, calibration_bins: See ClassificationMetrics.
+    from_logits (bool): See ClassificationMetrics.update().
+
+    Returns the metrics of predict() on every batch. Only one batch is
+    held in memory at a time.
+    """
+    metrics = ClassificationMetrics(num_classes, top_k, calibration_bins)
+    for inputs, labels in batches:
+        metrics.update(predict(inputs), labels, from_logits=from_logits)
+    return metrics
+
+
+def evaluate_parallel(
+    evaluate_shard: Callable[[int, int], ClassificationMetrics],
+    shards: int,
+    max_workers: int | None = None,
+) -> ClassificationMetrics:
+    """
+    Arguments:
+    evaluate_shard (Callable[[int, int], ClassificationMetrics]): Evaluates
+      one shard, given its index and the number of shards, e.g. by reading
+      a StreamingDataset with rank=index and world_size=shards. It must be
+      picklable, e.g. a module-level function.
+    shards (int): How many shards to split the evaluation into.
+    max_workers (int): How many processes to run. Defaults to the number
+      of CPUs.
+
+    Evaluates the shards in a pool of processes and returns the merged metrics.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return merge_metrics(
+            executor.map(evaluate_shard, range(shards), itertools.repeat(shards))
+        )
+
+
+def batched(samples: Iterable, batch_size: int) -> Iterator[tuple]:
+    """
+    Groups (inputs, label) samples, e.g. from a StreamingDataset, into
+    batches of stacked NumPy arrays.
+    """
+    iterator = iter(samples)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield tuple(np.stack(field) for field in zip(*batch))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exponentials = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+def _to_numpy(values) -> np.ndarray:
+    if hasattr(values, "detach"):
+        # A torch tensor, possibly on a GPU.
+        return values.detach().cpu().numpy()
+    return np.asarray(values)
@@ -0,0 +1,336 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Latency, byte and error metrics for storage operations.
+
+Pass an Instrumentation to CloudStorageAPIClient(instrumentation=...) and
+every operation is timed phase by phase:
+
+- "setup": creating the GCS client and looking up the bucket, once
+- "metadata": metadata requests, e.g. before a cached fetch
+- "transfer": moving the object's bytes
+- "local_write": work on the local copy after the transfer, e.g. decompressing
+
+Export what was recorded with .to_prometheus(), .summary(),
+.metaflow_card_components() or .log_to_wandb(), or receive every
+Measurement as it happens through a callback. Other measurements, e.g.
+TrainingProfiler's training steps, go to an Instrumentation of their own
+name, so they are exported apart from storage metrics.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, ContextManager, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    math.inf,
+)
+
+
+@dataclass
+class Measurement:
+    """
+    One timed phase of one operation.
+
+    - operation (str): e.g. "store" or "fetch"
+    - phase (str): e.g. "metadata" or "transfer"
+    - seconds (float): How long the phase took
+    - bytes (int): How many bytes it moved, if any
+    - error (str): The name of the exception it raised, if any
+    """
+
+    operation: str
+    phase: str
+    seconds: float = 0.0
+    bytes: int = 0
+    error: str | None = None
+
+
+@dataclass
+class _Series:
+    counts: list[int]
+    count: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    errors: dict[str, int] = field(default_factory=dict)
+
+
+class Instrumentation:
+    """
+    Collects Measurements into per-operation, per-phase latency histograms
+    and byte and error counters.
+
+    Arguments:
+
+    - buckets (Iterable[float]): Upper bounds of the latency histogram
+      buckets, in seconds; the last should be math.inf
+    - callbacks (Iterable[Callable[[Measurement], None]]): Called with every
+      Measurement as it is recorded, e.g. to forward it to another metrics
+      system. A callback that raises is logged and otherwise ignored.
+    - name (str): What is measured. The metrics are exported under it: the
+      Prometheus namespace is "mozmlops_<name>", the Weights & Biases keys
+      start with "<name>/" and the Metaflow card is titled after it.
+    - labels (tuple[str, str]): The Prometheus labels, and card headers,
+      of a Measurement's operation and phase
+
+    The instance can be shared between threads and between clients.
+    """
+
+    def __init__(
+        self,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        callbacks: Iterable[Callable[[Measurement], None]] = (),
+        name: str = "storage",
+        labels: tuple[str, str] = ("operation", "phase"),
+    ):
+        self.buckets = tuple(buckets)
+        self.callbacks = list(callbacks)
+        self.name = name
+        self.labels = labels
+        self._series: dict[tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[Measurement], None]):
+        self.callbacks.append(callback)
+
+    @contextmanager
+    def measure(self, operation: str, phase: str) -> Iterator[Measurement]:
+        """
+        Times the with block as one phase of an operation. Set .bytes on the
+        Measurement it yields to record how many bytes the phase moved.
+        An exception raised in the block is recorded and re-raised.
+        """
+        measurement = Measurement(operation, phase)
+        start = time.perf_counter()
+        try:
+            yield measurement
+        except BaseException as e:
+            measurement.error = type(e).__name__
+            raise
+        finally:
+            measurement.seconds = time.perf_counter() - start
+            self.record(measurement)
+
+    def record(self, measurement: Measurement):
+        key = (measurement.operation, measurement.phase)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(counts=[0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if measurement.seconds <= bound:
+                    series.counts[i] += 1
+                    break
+            series.count += 1
+            series.seconds += measurement.seconds
+            series.bytes += measurement.bytes
+            if measurement.error is not None:
+                series.errors[measurement.error] = (
+                    series.errors.get(measurement.error, 0) + 1
+                )
+
+        for callback in self.callbacks:
+            try:
+                callback(measurement)
+            except Exception as e:
+                logger.warning(f"An instrumentation callback failed: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def summary(self) -> dict[str, float]:
+        """
+        Returns flat "operation/phase/statistic" metrics: count, errors,
+        seconds (in total), p50_seconds, p95_seconds, bytes and
+        throughput (bytes per second spent in the phase).
+        """
+        metrics = {}
+        for (operation, phase), series in self._snapshot().items():
+            name = f"{operation}/{phase}"
+            metrics[f"{name}/count"] = series.count
+            metrics[f"{name}/errors"] = sum(series.errors.values())
+            metrics[f"{name}/seconds"] = series.seconds
+            metrics[f"{name}/p50_seconds"] = self._quantile(series, 0.5)
+            metrics[f"{name}/p95_seconds"] = self._quantile(series, 0.95)
+            metrics[f"{name}/bytes"] = series.bytes
+            metrics[f"{name}/throughput"] = (
+                series.bytes / series.seconds if series.seconds else 0.0
+            )
+        return metrics
+
+    def to_prometheus(self, namespace: str | None = None) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format,
+        e.g. to serve from a /metrics endpoint. The namespace defaults
+        to "mozmlops_<name>".
+        """
+        if namespace is None:
+            namespace = f"mozmlops_{self.name}"
+        lines = [
+            f"# HELP {namespace}_seconds Time spent per operation and phase.",
+            f"# TYPE {namespace}_seconds histogram",
+        ]
+        snapshot = self._snapshot()
+        for (operation, phase), series in snapshot.items():
+            labels = self._labels(operation, phase)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(
+                    f'{namespace}_seconds_bucket{{{labels},le="{le}"}} {cumulative}'
+                )
+            if self.buckets[-1] != math.inf:
+                lines.append(
+                    f'{namespace}_seconds_bucket{{{labels},le="+Inf"}} {series.count}'
+                )
+            lines.append(f"{namespace}_seconds_sum{{{labels}}} {series.seconds}")
+            lines.append(f"{namespace}_seconds_count{{{labels}}} {series.count}")
+
+        lines += [
+            f"# HELP {namespace}_bytes_total Bytes moved per operation and phase.",
+            f"# TYPE {namespace}_bytes_total counter",
+        ]
+        for (operation, phase), series in snapshot.items():
+            labels = self._labels(operation, phase)
+            lines.append(f"{namespace}_bytes_total{{{labels}}} {series.bytes}")
+
+        lines += [
+            f"# HELP {namespace}_errors_total Failures per operation, phase and error.",
+            f"# TYPE {namespace}_errors_total counter",
+        ]
+        for (operation, phase), series in snapshot.items():
+            for error, count in sorted(series.errors.items()):
+                labels = self._labels(operation, phase, error=error)
+                lines.append(f"{namespace}_errors_total{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def metaflow_card_components(self) -> list:
+        """
+        Returns Metaflow card components that show the metrics as a table:
+
+            current.card.extend(instrumentation.metaflow_card_components())
+        """
+        from metaflow.cards import Markdown, Table
+
+        rows = [
+            [
+                operation,
+                phase,
+                series.count,
+                sum(series.errors.values()),
+                f"{self._quantile(series, 0.5) * 1000:.1f}",
+                f"{self._quantile(series, 0.95) * 1000:.1f}",
+                f"{series.bytes / 1e6:.1f}",
+                f"{series.bytes / series.seconds / 1e6 if series.seconds else 0:.1f}",
+            ]
+            for (operation, phase), series in self._snapshot().items()
+        ]
+        headers = [
+            *(label.capitalize() for label in self.labels),
+            "Count",
+            "Errors",
+            "p50 (ms)",
+            "p95 (ms)",
+            "MB",
+            "MB/s",
+        ]
+        return [
+            Markdown(f"# {self.name.capitalize()}"),
+            Table(data=rows, headers=headers),
+        ]
+
+    def log_to_wandb(self, run=None, step: int | None = None):
+        """
+        Logs .summary() to Weights & Biases, under "<name>/",
+        to `run` or else to the current run.
+        """
+        if run is None:
+            import wandb
+
+            run = wandb
+        metrics = {
+            f"{self.name}/{name}": value for name, value in self.summary().items()
+        }
+        run.log(metrics, step=step)
+
+    def _labels(self, operation: str, phase: str, **labels: str) -> str:
+        operation_label, phase_label = self.labels
+        return _labels(**{operation_label: operation, phase_label: phase}, **labels)
+
+    def _snapshot(self) -> dict[tuple[str, str], _Series]:
+        with self._lock:
+            return {
+                key: _Series(
+                    counts=list(series.counts),
+                    count=series.count,
+                    seconds=series.seconds,
+                    bytes=series.bytes,
+                    errors=dict(series.errors),
+                )
+                for key, series in sorted(self._series.items())
+            }
+
+    def _quantile(self, series: _Series, q: float) -> float:
+        """
+        Estimates a latency quantile by interpolating within its histogram
+        bucket, as Prometheus' histogram_quantile() does.
+        """
+        if not series.count:
+            return 0.0
+        rank = q * series.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series.counts):
+            if count and cumulative + count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+
+def measure(
+    instrumentation: Instrumentation | None, operation: str, phase: str
+) -> ContextManager[Measurement]:
+    """
+    Like Instrumentation.measure(), but does nothing if instrumentation is None.
+    """
+    if instrumentation is None:
+        return nullcontext(Measurement(operation, phase))
+    return instrumentation.measure(operation, phase)
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
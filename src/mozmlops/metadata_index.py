@@ -0,0 +1,273 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+A local SQLite index of object metadata, so that questions like
+"what is the latest checkpoint of this run?" or "which runs does this
+flow have?" are answered without scanning the bucket every time.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator
+
+from mozmlops.storage_backends import ObjectInfo, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    backend TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    crc32c TEXT,
+    updated REAL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (backend, path)
+);
+CREATE INDEX IF NOT EXISTS objects_by_updated ON objects (backend, updated);
+CREATE TABLE IF NOT EXISTS refreshes (
+    backend TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (backend, prefix)
+);
+"""
+
+
+@dataclass
+class RefreshResult:
+    """
+    How a refresh changed the index.
+
+    - added (int): Objects that were not indexed before
+    - updated (int): Indexed objects with a new generation
+    - removed (int): Indexed objects that no longer exist
+    - unchanged (int): Indexed objects with the same generation
+    - skipped (bool): Whether the refresh was skipped because the prefix
+      was refreshed recently enough
+    """
+
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    skipped: bool = False
+
+
+class MetadataIndex:
+    """
+    Keeps the path, size, generation, checksum, update time and metadata
+    of the objects in a storage backend in a local SQLite database.
+
+    Arguments:
+
+    - backend (StorageBackend): The backend to index, e.g. CloudStorageAPIClient().backend
+    - database (str): The SQLite file to keep the index in. One file can hold
+      the indexes of several backends. The default keeps it in memory.
+
+    Call .refresh(prefix) to bring part of the index up to date with one
+    listing of that prefix, then query it locally:
+
+        index = MetadataIndex(storage_client.backend, "index.sqlite")
+        index.refresh("my_flow/", max_age=300)
+        runs = index.children("my_flow/")
+        checkpoint = index.latest("my_flow/run-42/", pattern="*.ckpt")
+
+    The index is only as fresh as its last refresh of a prefix.
+    The instance can be shared between threads.
+    """
+
+    def __init__(self, backend: StorageBackend, database: str = ":memory:"):
+        self.backend = backend
+        self.database = database
+        self._connection = sqlite3.connect(database, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def refresh(self, prefix: str = "", max_age: float | None = None) -> RefreshResult:
+        """
+        Arguments:
+        prefix (str): The part of the bucket to bring up to date.
+        max_age (float): Skip the refresh if this prefix was refreshed
+          less than this many seconds ago.
+
+        Lists the objects under prefix once and applies the differences to
+        the index: new objects are added, objects with a new generation are
+        updated and objects that are gone are removed. Unchanged objects
+        are not written again.
+        """
+        result = RefreshResult()
+        if max_age is not None:
+            refreshed_at = self._refreshed_at(prefix)
+            if refreshed_at is not None and time.time() - refreshed_at < max_age:
+                result.skipped = True
+                return result
+
+        started_at = time.time()
+        indexed = {
+            path: generation
+            for path, generation in self._query(
+                "SELECT path, generation FROM objects WHERE backend = ? AND path >= ? "
+                "AND path < ?",
+                self.backend.name,
+                prefix,
+                _prefix_end(prefix),
+            )
+        }
+
+        rows = []
+        for info in self.backend.list_objects(prefix):
+            generation = indexed.pop(info.path, None)
+            if generation is None:
+                result.added += 1
+            elif generation != info.generation:
+                result.updated += 1
+            else:
+                result.unchanged += 1
+                continue
+            rows.append(self._row(info))
+        result.removed = len(indexed)
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._connection.executemany(
+                "DELETE FROM objects WHERE backend = ? AND path = ?",
+                [(self.backend.name, path) for path in indexed],
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?)",
+                (self.backend.name, prefix, started_at),
+            )
+
+        logger.info(
+            f"Refreshed the index of {self.backend.name}/{prefix}: {result.added} "
+            f"added, {result.updated} updated, {result.removed} removed"
+        )
+        return result
+
+    def get(self, path: str) -> ObjectInfo | None:
+        """
+        Returns the indexed metadata of one object, or None if it is not indexed.
+        """
+        rows = self._query(
+            "SELECT * FROM objects WHERE backend = ? AND path = ?",
+            self.backend.name,
+            path,
+        )
+        return self._info(rows[0]) if rows else None
+
+    def objects(
+        self, prefix: str = "", pattern: str | None = None
+    ) -> Iterator[ObjectInfo]:
+        """
+        Arguments:
+        prefix (str): Only list objects whose path starts with this.
+        pattern (str): Only list objects whose path matches this glob, e.g. "*.pth".
+
+        Yields the indexed objects under prefix, in path order.
+        """
+        for row in self._select(prefix, pattern, "ORDER BY path"):
+            yield self._info(row)
+
+    def latest(self, prefix: str = "", pattern: str | None = None) -> ObjectInfo | None:
+        """
+        Arguments:
+        prefix (str): Only consider objects whose path starts with this.
+        pattern (str): Only consider objects whose path matches this glob.
+
+        Returns the most recently updated indexed object under prefix,
+        e.g. the latest checkpoint of a run, or None if there is none.
+        """
+        rows = self._select(prefix, pattern, "ORDER BY updated DESC, path DESC LIMIT 1")
+        return self._info(rows[0]) if rows else None
+
+    def children(self, prefix: str = "", delimiter: str = "/") -> list[str]:
+        """
+        Returns the distinct subdirectories directly under prefix, each
+        ending in the delimiter, e.g. all the runs of a flow for
+        prefix="my_flow/".
+        """
+        start = len(prefix) + 1
+        rows = self._query(
+            "SELECT DISTINCT substr(path, 1, ? + instr(substr(path, ?), ?) - 1 "
+            "+ length(?)) FROM objects WHERE backend = ? AND path >= ? AND path < ? "
+            "AND instr(substr(path, ?), ?) > 0 ORDER BY 1",
+            len(prefix),
+            start,
+            delimiter,
+            delimiter,
+            self.backend.name,
+            prefix,
+            _prefix_end(prefix),
+            start,
+            delimiter,
+        )
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._connection.close()
+
+    def _refreshed_at(self, prefix: str) -> float | None:
+        rows = self._query(
+            "SELECT refreshed_at FROM refreshes WHERE backend = ? AND prefix = ?",
+            self.backend.name,
+            prefix,
+        )
+        return rows[0][0] if rows else None
+
+    def _select(self, prefix: str, pattern: str | None, order: str) -> list[tuple]:
+        sql = "SELECT * FROM objects WHERE backend = ? AND path >= ? AND path < ?"
+        parameters = [self.backend.name, prefix, _prefix_end(prefix)]
+        if pattern is not None:
+            sql += " AND path GLOB ?"
+            parameters.append(pattern)
+        return self._query(f"{sql} {order}", *parameters)
+
+    def _query(self, sql: str, *parameters) -> list[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _row(self, info: ObjectInfo) -> tuple:
+        return (
+            self.backend.name,
+            info.path,
+            info.size,
+            info.generation,
+            info.crc32c,
+            info.updated.timestamp() if info.updated else None,
+            json.dumps(info.metadata),
+        )
+
+    @staticmethod
+    def _info(row: tuple) -> ObjectInfo:
+        _, path, size, generation, crc32c, updated, metadata = row
+        return ObjectInfo(
+            path=path,
+            size=size,
+            generation=generation,
+            crc32c=crc32c,
+            updated=(
+                datetime.fromtimestamp(updated, timezone.utc)
+                if updated is not None
+                else None
+            ),
+            metadata=json.loads(metadata),
+        )
+
+
+def _prefix_end(prefix: str) -> str:
+    """
+    Returns a string that sorts after every path that starts with prefix,
+    so that prefix queries are range scans over the primary key.
+    """
+    return prefix + "\U0010ffff"
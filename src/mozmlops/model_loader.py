@@ -0,0 +1,348 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Loading stored models into serving replicas, e.g. Ray Serve deployments.
+
+Models are downloaded into an ArtifactCache that every replica on a node
+shares. When several replicas start at once, one of them downloads each
+file while the others wait for it, and replicas started later find the
+files already there. Replicas load the cached files in place, through
+hard links, so no file is copied, and with a load function that maps
+files into memory (e.g. safetensors) no weights are read before they are
+used.
+
+    loader = ModelLoader(storage_client, "/mnt/model-cache")
+    weights = loader.load("my_flow/run-42/model.safetensors", load_file).model
+    translator = loader.load(
+        "my_flow/run-42/t5-small/",
+        lambda directory: pipeline("translation_en_to_fr", model=directory),
+    ).model
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+from mozmlops import _streaming
+from mozmlops import compression as codecs
+from mozmlops.artifact_cache import DEFAULT_CACHE_MAX_BYTES, ArtifactCache
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.instrumentation import measure
+from mozmlops.storage_backends import ObjectInfo
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "mozmlops-models")
+
+
+@dataclass
+class LoadedModel:
+    """
+    A model and how it was loaded.
+
+    - model: What the load function returned
+    - path (str): The storage path of the model's file, or the prefix of its
+      directory of files
+    - local_path (str): Where that file or directory is on this node
+    - generations (dict[str, int]): The generation of each of the model's
+      files, by storage path
+    - cache_hit (bool): Whether the model was already cached on this node
+    - bytes (int): The size of the model's files
+    - fetch_seconds (float): Time spent getting the files onto this node
+    - load_seconds (float): Time spent in the load function
+    """
+
+    model: Any
+    path: str
+    local_path: str
+    generations: dict[str, int] = field(default_factory=dict)
+    cache_hit: bool = False
+    bytes: int = 0
+    fetch_seconds: float = 0.0
+    load_seconds: float = 0.0
+
+    @property
+    def seconds(self) -> float:
+        return self.fetch_seconds + self.load_seconds
+
+
+class ModelLoader:
+    """
+    Fetches models from storage into a cache shared by the processes on a
+    node, and loads them from there.
+
+    Arguments:
+
+    - storage_client (CloudStorageAPIClient): Where the models are stored
+    - cache_directory (str): The node's model cache; point every replica
+      on a node at the same directory
+    - max_bytes (int): The cache, and the models loaded from it, are kept
+      under this many bytes of disk by evicting the least recently loaded
+      models and files, though never the model just loaded. A process
+      that already loaded an evicted model can go on using it.
+    - max_workers (int): How many files of a model directory are
+      downloaded at the same time
+
+    Load times are logged, returned in LoadedModel and, if the client has
+    instrumentation, recorded under the "load_model" operation.
+
+    The instance can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        storage_client: CloudStorageAPIClient,
+        cache_directory: str = DEFAULT_MODEL_CACHE_DIRECTORY,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        max_workers: int = 8,
+    ):
+        self.storage_client = storage_client
+        self.cache = ArtifactCache(os.path.join(cache_directory, "files"), max_bytes)
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._root = Path(cache_directory)
+        self._models = Path(cache_directory) / "models"
+        self._models.mkdir(parents=True, exist_ok=True)
+
+    def load(
+        self,
+        path: str,
+        load: Callable[[str], Any] | None = None,
+        generation: int | None = None,
+    ) -> LoadedModel:
+        """
+        Arguments:
+        path (str): The storage path of the model's file or, ending in "/",
+          the prefix of its directory of files.
+        load (Callable[[str], Any]): Loads the model from the local path of
+          that file or directory. By default the path itself is returned.
+        generation (int): For a model stored in one file, the generation to
+          load. Raises FileNotFoundError if the file has been replaced since,
+          instead of silently loading a different model.
+
+        Fetches the model into the node's cache, if it is not there yet,
+        and loads it from there.
+        """
+        instrumentation = self.storage_client.instrumentation
+        with measure(instrumentation, "load_model", "fetch") as fetching:
+            start = time.perf_counter()
+            loaded = self.fetch(path, generation)
+            loaded.fetch_seconds = time.perf_counter() - start
+            fetching.bytes = 0 if loaded.cache_hit else loaded.bytes
+
+        if load is not None:
+            with measure(instrumentation, "load_model", "load") as loading:
+                start = time.perf_counter()
+                loaded.model = load(loaded.local_path)
+                loaded.load_seconds = time.perf_counter() - start
+                loading.bytes = loaded.bytes
+        else:
+            loaded.model = loaded.local_path
+
+        source = "from the node's cache" if loaded.cache_hit else "from storage"
+        logger.info(
+            f"Loaded {path} ({loaded.bytes / 1e6:.1f} MB) {source} in "
+            f"{loaded.seconds:.2f}s: {loaded.fetch_seconds:.2f}s fetching, "
+            f"{loaded.load_seconds:.2f}s loading"
+        )
+        return loaded
+
+    def fetch(self, path: str, generation: int | None = None) -> LoadedModel:
+        """
+        Like .load(), but only fetches the model into the node's cache.
+        Returns a LoadedModel without a model.
+        """
+        if path.endswith("/"):
+            if generation is not None:
+                raise ValueError("generation can only be given for a single file")
+            infos = [
+                info
+                for info in self.storage_client.list(path)
+                if not info.path.endswith("/")
+            ]
+            if not infos:
+                raise FileNotFoundError(f"There are no objects under {path}")
+        else:
+            info = self.storage_client.backend.stat(path)
+            if info is None:
+                raise FileNotFoundError(f"There is no object at {path}")
+            if generation is not None and info.generation != generation:
+                raise FileNotFoundError(
+                    f"Generation {generation} of {path} has been replaced by "
+                    f"generation {info.generation}"
+                )
+            infos = [info]
+
+        directory = self._models / self._key(infos)
+        loaded = LoadedModel(
+            model=None,
+            path=path,
+            local_path=str(
+                directory if path.endswith("/") else directory / Path(path).name
+            ),
+            generations={info.path: info.generation for info in infos},
+            cache_hit=True,
+            bytes=sum(info.size for info in infos),
+        )
+        if self._mark_loaded(directory):
+            return loaded
+
+        # Replicas starting together build the model's directory once, and
+        # each of its files is downloaded once, see ArtifactCache.fetch().
+        with self.cache.lock(f"model-{directory.name}"):
+            if self._mark_loaded(directory):
+                return loaded
+
+            partial = self._models / f".{directory.name}.{os.getpid()}.partial"
+            shutil.rmtree(partial, ignore_errors=True)
+
+            def fetch_one(info: ObjectInfo) -> bool:
+                relative = (
+                    info.path[len(path) :] if path.endswith("/") else Path(path).name
+                )
+                local_path = partial / relative
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                return self.cache.fetch(
+                    ArtifactCache.key(
+                        self.storage_client.backend.name,
+                        info.path,
+                        info.generation,
+                        f"{info.crc32c}:decompressed",
+                    ),
+                    lambda download_path: self._download(info, download_path),
+                    str(local_path),
+                    link=True,
+                )
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    hits = list(executor.map(fetch_one, infos))
+                with self.cache.lock("evict-models"):
+                    os.replace(partial, directory)
+                    _touch(directory)
+            finally:
+                shutil.rmtree(partial, ignore_errors=True)
+
+        loaded.cache_hit = all(hits)
+        self._evict(keep=directory)
+        return loaded
+
+    def _mark_loaded(self, directory: Path) -> bool:
+        """
+        Touches a model's directory, see _touch(), under the lock that
+        eviction holds while it picks and removes models, so that a model
+        found here is not removed for having been loaded long ago.
+        """
+        with self.cache.lock("evict-models"):
+            return _touch(directory)
+
+    def _evict(self, keep: Path):
+        """
+        Removes the least recently loaded models, other than `keep`, and
+        then the cached files only they used, until the node's cache fits
+        in max_bytes. A model's files are hard links to cached files, so
+        neither takes up space while the other remains.
+        """
+        with self.cache.lock("evict-models"):
+            models = sorted(
+                (
+                    model
+                    for model in self._models.iterdir()
+                    if not model.name.startswith(".") and model != keep
+                ),
+                key=lambda model: model.stat().st_mtime,
+            )
+            for model in models:
+                if _disk_usage(self._root) <= self.max_bytes:
+                    break
+                # Files that other models share stay cached.
+                self.cache.discard(
+                    [path for path in _files(model) if os.stat(path).st_nlink <= 2]
+                )
+                shutil.rmtree(model, ignore_errors=True)
+                logger.info(f"Evicted the model {model.name} from the model cache")
+
+    def _download(self, info: ObjectInfo, local_path: str):
+        """
+        Downloads one version of a file, decompressed if it was stored
+        compressed, so that it can be loaded in place.
+        """
+        backend = self.storage_client.backend
+        codec_name = info.metadata.get(codecs.METADATA_KEY)
+        if codec_name is None:
+            backend.download(info.path, local_path, info)
+            return
+
+        compressed_path = f"{local_path}.compressed"
+        try:
+            backend.download(info.path, compressed_path, info)
+            codecs.decompress_file(
+                compressed_path, local_path, codecs.get_codec(codec_name)
+            )
+        finally:
+            if os.path.exists(compressed_path):
+                os.remove(compressed_path)
+
+    def _key(self, infos: list[ObjectInfo]) -> str:
+        """
+        Identifies a set of file versions, so that a model whose files
+        change is fetched into a new directory.
+        """
+        identity = hashlib.sha256(self.storage_client.backend.name.encode("utf-8"))
+        for info in sorted(infos, key=lambda info: info.path):
+            identity.update(f"\n{info.path}#{info.generation}:{info.crc32c}".encode())
+        return identity.hexdigest()
+
+
+def _touch(directory: Path) -> bool:
+    """
+    Marks a model's directory as just loaded, for eviction.
+    Returns whether it exists.
+    """
+    # The kernel's own clock for timestamps can be milliseconds coarse.
+    now = time.time_ns()
+    try:
+        os.utime(directory, ns=(now, now))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _files(directory: Path) -> list[str]:
+    return [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(directory)
+        for filename in filenames
+    ]
+
+
+def _disk_usage(directory: Path) -> int:
+    """
+    Returns the bytes of the files under `directory`, counting files hard
+    linked to one another once.
+    """
+    sizes = {}
+    for path in _files(directory):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        sizes[(stat.st_dev, stat.st_ino)] = stat.st_size
+    return sum(sizes.values())
+
+
+def map_file(local_path: str) -> memoryview:
+    """
+    A load function for ModelLoader.load() that maps a file into memory
+    read-only and returns it as a memoryview, without reading or copying it.
+    """
+    return _streaming.map_file(local_path)
@@ -0,0 +1,339 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Caching inference responses, so that repeated requests skip the model.
+
+A ResponseCache keys responses on the normalized request and the model
+version, so a new model never serves its predecessor's answers. It holds
+a bounded number of responses in memory, evicting the least recently
+used and dropping those older than a TTL, and can sit in front of a
+shared tier, e.g. Redis, that every replica of a deployment reads from.
+Responses go to the shared tier as JSON, never pickled, so a replica
+cannot be made to run code by what another process wrote there.
+
+In front of an AdaptiveBatcher, cache hits return without entering the
+batch queue:
+
+    translation = await cache.get_or_compute(text, batcher.submit)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+import unicodedata
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Protocol
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SharedTier(Protocol):
+    """
+    A cache shared between replicas. Values are JSON-encoded responses.
+    """
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl_s: float | None): ...
+
+
+class RedisTier:
+    """
+    A SharedTier in Redis.
+
+    Arguments:
+
+    - client: A redis.Redis client, or anything with the same get() and set()
+    - prefix (str): Prepended to every key, to share a Redis database
+      with other data
+    """
+
+    def __init__(self, client, prefix: str = "mozmlops:responses:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl_s: float | None):
+        expiry = max(1, round(ttl_s)) if ttl_s is not None else None
+        self.client.set(self.prefix + key, value, ex=expiry)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    expires_at: float
+
+
+@dataclass
+class _InFlight:
+    task: asyncio.Task
+    waiters: int = 0
+    cancelled: bool = False
+
+
+def normalize_text(text: str) -> str:
+    """
+    The default request normalization: Unicode NFC, with surrounding
+    whitespace stripped and inner runs of whitespace collapsed. Case is
+    kept, since it can change a model's response.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class ResponseCache:
+    """
+    An LRU cache of responses with a TTL, optionally backed by a shared tier.
+
+    Arguments:
+
+    - model_version (str): Part of every key, e.g. the model's storage path
+      and generation, so responses of different models never mix
+    - max_entries (int): The most responses to keep in memory
+    - max_bytes (int): The most memory, approximately, to keep responses in
+    - ttl_s (float): Responses older than this many seconds are dropped.
+      None keeps them until they are evicted.
+    - normalize (Callable[[Any], Any]): Maps a request to what it is keyed
+      on, so that requests differing only in, e.g., whitespace share a
+      response. The result must be JSON-encodable. Defaults to normalize_text()
+      for strings and to the request itself otherwise.
+    - shared (SharedTier): A tier shared between replicas, e.g. a RedisTier,
+      consulted on a miss in memory and filled with every new response.
+      Only responses that JSON can encode are shared, and they come back
+      as JSON decodes them, e.g. tuples as lists. Errors reaching it are
+      logged and treated as misses. get_or_compute() calls it on a worker
+      thread, so a slow tier does not hold up the event loop.
+
+    .metrics() reports hits, misses, requests that waited for an identical
+    one being computed ("coalesced") and the hit rate.
+    The instance can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        model_version: str = "",
+        max_entries: int = 10_000,
+        max_bytes: int | None = None,
+        ttl_s: float | None = None,
+        normalize: Callable[[Any], Any] | None = None,
+        shared: SharedTier | None = None,
+    ):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.normalize = normalize
+        self.shared = shared
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, _InFlight] = {}
+
+    def key(self, request) -> str:
+        """
+        Returns the cache key of a request.
+        """
+        if self.normalize is not None:
+            normalized = self.normalize(request)
+        elif isinstance(request, str):
+            normalized = normalize_text(request)
+        else:
+            normalized = request
+        identity = json.dumps(
+            [self.model_version, normalized], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def get(self, request, default=None):
+        """
+        Returns the cached response to a request, or default.
+        """
+        value = self._get(self.key(request))
+        return default if value is _MISSING else value
+
+    def put(self, request, response):
+        """
+        Caches the response to a request, in memory and in the shared tier.
+        """
+        key = self.key(request)
+        self._put(key, response)
+        if self.shared is not None:
+            self._set_shared(key, response)
+
+    async def get_or_compute(
+        self, request, compute: Callable[[Any], Awaitable[Any]]
+    ) -> Any:
+        """
+        Returns the cached response to a request, or else awaits
+        compute(request) and caches its result. Identical requests that
+        arrive while one is being computed wait for that result rather than
+        computing it again. Cancelling one of them leaves the computation
+        running for the others; it is only cancelled once none is waiting.
+        """
+        key = self.key(request)
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+
+        flight = self._in_flight.get(key)
+        if flight is None or flight.cancelled:
+            # A cancelled computation is on its way out; start over rather
+            # than wait for its CancelledError
+            flight = _InFlight(
+                asyncio.ensure_future(self._compute(key, request, compute))
+            )
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(
+                lambda _, flight=flight: self._land(key, flight)
+            )
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.cancelled = True
+                flight.task.cancel()
+
+    def _land(self, key: str, flight: _InFlight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    async def _compute(self, key: str, request, compute) -> Any:
+        if self.shared is not None:
+            value = await asyncio.to_thread(self._get_shared, key)
+            if value is not _MISSING:
+                return value
+        with self._lock:
+            self.misses += 1
+
+        value = await compute(request)
+        self._put(key, value)
+        if self.shared is not None:
+            await asyncio.to_thread(self._set_shared, key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.shared_hits + self.misses + self.coalesced
+        return (self.hits + self.shared_hits) / requests if requests else 0.0
+
+    def metrics(self) -> dict[str, float]:
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hit_rate,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _get(self, key: str):
+        value = self._get_local(key)
+        if value is _MISSING and self.shared is not None:
+            value = self._get_shared(key)
+        if value is _MISSING:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def _get_local(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def _get_shared(self, key: str):
+        try:
+            shared = self.shared.get(key)
+            if shared is None:
+                return _MISSING
+            value = json.loads(shared)
+        except Exception as e:
+            logger.warning(f"The shared response cache failed: {e}")
+            return _MISSING
+        self._put(key, value)
+        with self._lock:
+            self.shared_hits += 1
+        return value
+
+    def _put(self, key: str, value):
+        size = _size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = (
+            time.monotonic() + self.ttl_s if self.ttl_s is not None else float("inf")
+        )
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _set_shared(self, key: str, value):
+        try:
+            self.shared.set(key, json.dumps(value).encode("utf-8"), self.ttl_s)
+        except Exception as e:
+            logger.warning(f"The shared response cache failed: {e}")
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def _size(value) -> int:
+    """
+    Estimates the memory a response takes.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return sys.getsizeof(value)
@@ -0,0 +1,193 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Retrying transient storage failures, and counting what the retries cost.
+
+GCSBackend retries every transfer according to a RetryPolicy. Interrupted
+resumable uploads continue from the last offset GCS confirmed, and
+interrupted downloads continue from the last byte written, so a dropped
+connection late in a large transfer only costs the bytes that were in flight.
+
+Retries, resent bytes and wall time are added up in TransferStats.
+Transfers count towards every TransferStats being tracked, see tracking().
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, TypeVar
+
+from mozmlops._lazy import LazyModule
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+google_auth_exceptions = LazyModule("google.auth.exceptions")
+requests = LazyModule("requests")
+
+# HTTP status codes that GCS documents as worth retrying.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Exponential backoff with jitter.
+
+    Arguments:
+
+    - max_attempts (int): How many times an operation is tried in total
+    - initial_delay (float): The longest wait, in seconds, before the first retry
+    - max_delay (float): The longest wait, in seconds, before any retry
+    - multiplier (float): How much the longest wait grows after each retry
+    - jitter (bool): Wait a random time between zero and the longest wait
+      ("full jitter"), so that many clients failing at once do not retry
+      in lockstep. If False, always wait the longest wait.
+    """
+
+    max_attempts: int = 6
+    initial_delay: float = 1.0
+    max_delay: float = 32.0
+    multiplier: float = 2.0
+    jitter: bool = True
+
+    def delay(self, retry_number: int) -> float:
+        """
+        Returns how many seconds to wait before the given retry, counting from 1.
+        """
+        longest = min(
+            self.max_delay, self.initial_delay * self.multiplier ** (retry_number - 1)
+        )
+        return random.uniform(0, longest) if self.jitter else longest
+
+    def run(self, operation: Callable[[], T], description: str) -> T:
+        """
+        Calls `operation` until it succeeds, it raises an error that is not
+        transient (see is_transient()), or max_attempts run out.
+        Each retry is counted in the TransferStats being tracked.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return operation()
+            except Exception as e:
+                if attempt == self.max_attempts or not is_transient(e):
+                    raise
+                delay = self.delay(attempt)
+                logger.warning(
+                    f"{description} failed ({e}); retry {attempt} of "
+                    f"{self.max_attempts - 1} in {delay:.2f}s"
+                )
+                record(retries=1)
+                time.sleep(delay)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Returns whether an error is likely to go away on its own: throttling,
+    server errors, timeouts and dropped connections.
+    """
+    if isinstance(
+        error,
+        (
+            ConnectionError,
+            TimeoutError,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    ):
+        return True
+
+    # google.api_core exceptions carry the status in .code, and
+    # google.resumable_media exceptions carry the HTTP response.
+    status = getattr(error, "code", None)
+    response = getattr(error, "response", None)
+    if not isinstance(status, int) and response is not None:
+        status = getattr(response, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+
+    try:
+        return isinstance(error, google_auth_exceptions.TransportError)
+    except ImportError:
+        return False
+
+
+@dataclass
+class TransferStats:
+    """
+    Counters for one transfer, or added up over many.
+
+    - transfers (int): How many transfers were tracked
+    - retries (int): How many times a failed request was retried
+    - bytes_resent (int): How many bytes had to be sent or received again
+    - seconds (float): Wall time spent in the tracked transfers, added up
+    """
+
+    transfers: int = 0
+    retries: int = 0
+    bytes_resent: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    def add(self, transfers=0, retries=0, bytes_resent=0, seconds=0.0):
+        with self._lock:
+            self.transfers += transfers
+            self.retries += retries
+            self.bytes_resent += bytes_resent
+            self.seconds += seconds
+
+
+_tracked: contextvars.ContextVar[tuple[TransferStats, ...]] = contextvars.ContextVar(
+    "mozmlops_tracked_transfer_stats", default=()
+)
+
+
+@contextmanager
+def tracking(stats: TransferStats) -> Iterator[TransferStats]:
+    """
+    Counts the transfers made inside the with block, in this thread, towards
+    `stats`, as well as towards any TransferStats tracked further out.
+    Work handed to other threads is only counted if it runs in a copy of
+    this thread's context, see contextvars.copy_context().
+    """
+    active = _tracked.get()
+    if any(tracked is stats for tracked in active):
+        # Already counted by an enclosing transfer.
+        yield stats
+        return
+
+    token = _tracked.set(active + (stats,))
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        _tracked.reset(token)
+        stats.add(transfers=1, seconds=time.perf_counter() - start)
+
+
+def propagating(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wraps `function` so that, wherever it is called, e.g. on a thread pool,
+    it runs in a copy of the current context, and its transfers count
+    towards the TransferStats being tracked here.
+    """
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(function, *args)
+
+
+def record(retries: int = 0, bytes_resent: int = 0):
+    """
+    Adds to every TransferStats being tracked.
+    """
+    for stats in _tracked.get():
+        stats.add(retries=retries, bytes_resent=bytes_resent)
@@ -0,0 +1,986 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Storage backends for CloudStorageAPIClient.
+
+A backend implements a handful of primitive object operations;
+CloudStorageAPIClient builds its public store/fetch API on top of them.
+Besides Google Cloud Storage there are a local filesystem backend and an
+in-memory backend, for offline development, unit tests and benchmarks:
+
+    CloudStorageAPIClient(backend=LocalFilesystemBackend("/tmp/artifacts"))
+
+Objects can carry a small dictionary of string metadata.
+
+Every backend refuses to overwrite an existing object unless told which
+generation of it to replace, raising ObjectAlreadyExistsError, and raises
+a FileNotFoundError (for GCS, google.api_core.exceptions.NotFound) for a
+missing object.
+"""
+
+import functools
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from mozmlops._lazy import LazyModule
+from mozmlops._streaming import (
+    DEFAULT_CHUNK_SIZE,
+    BufferWriter,
+    bytes_crc32c,
+    chunk_stream,
+    encode_crc32c,
+    file_crc32c,
+    google_crc32c,
+    iter_file_range,
+    read_fully,
+)
+from mozmlops.instrumentation import Instrumentation, measure
+from mozmlops.retry import RetryPolicy, propagating, record
+
+logger = logging.getLogger(__name__)
+
+api_core_exceptions = LazyModule("google.api_core.exceptions")
+google_exceptions = LazyModule("google.cloud.exceptions")
+requests_adapters = LazyModule("requests.adapters")
+storage = LazyModule("google.cloud.storage")
+
+# GCS can compose at most 32 objects in one request.
+MAX_COMPOSE_PARTS = 32
+
+# Uploads of at most this many bytes go to GCS in a single request;
+# larger ones, and those of unknown size, use a resumable upload.
+MAX_SINGLE_REQUEST_UPLOAD_SIZE = 8 * 1024 * 1024
+
+
+class ObjectAlreadyExistsError(Exception):
+    """
+    Raised when storing an object at a path that is already taken,
+    or, when replacing an object, if it changed in the meantime.
+    """
+
+
+@dataclass
+class ObjectInfo:
+    """
+    Metadata about one stored object.
+
+    - path (str): The object's path within the backend
+    - size (int): Its size in bytes
+    - generation (int): Changes whenever the object is replaced
+    - crc32c (str): The base64-encoded CRC32C checksum, as GCS reports it
+    - updated (datetime): When the object was last written
+    - metadata (dict): Custom key/value metadata stored with the object
+    """
+
+    path: str
+    size: int
+    generation: int
+    crc32c: str | None = None
+    updated: datetime | None = None
+    metadata: dict = field(default_factory=dict)
+
+
+class StorageBackend(ABC):
+    """
+    The primitive operations CloudStorageAPIClient needs from a storage system.
+    """
+
+    # Identifies the backend and location, e.g. "gs://bucket", in cache keys and logs.
+    name: str
+
+    @abstractmethod
+    def upload(
+        self,
+        stream: BinaryIO,
+        path: str,
+        size: int | None = None,
+        chunk_size: int | None = None,
+        metadata: dict | None = None,
+        if_generation_match: int = 0,
+    ):
+        """
+        Stores the contents of `stream` at `path`, reading at most chunk_size
+        bytes at a time where the backend allows it. `size` is the number of
+        bytes in the stream, if known. `metadata` is stored with the object.
+
+        By default (if_generation_match=0) there must not be an object at
+        `path` yet. Pass an existing object's generation to replace it.
+        Raises ObjectAlreadyExistsError if that precondition does not hold.
+        """
+
+    def upload_file(
+        self,
+        local_path: str,
+        path: str,
+        chunk_size: int | None = None,
+        metadata: dict | None = None,
+        if_generation_match: int = 0,
+    ):
+        """
+        Stores a local file at `path`. See .upload().
+        """
+        with open(local_path, "rb") as f:
+            self.upload(
+                f,
+                path,
+                size=os.path.getsize(local_path),
+                chunk_size=chunk_size,
+                metadata=metadata,
+                if_generation_match=if_generation_match,
+            )
+
+    @abstractmethod
+    def download(self, path: str, local_path: str, info: ObjectInfo | None = None):
+        """
+        Writes the object at `path` to `local_path`. If `info` is given,
+        downloads exactly that version of the object.
+        """
+
+    @abstractmethod
+    def read_range_into(
+        self, path: str, start: int, buffer, generation: int | None = None
+    ) -> int:
+        """
+        Reads bytes of the object at `path`, beginning at offset `start`,
+        into `buffer` (any writable buffer, e.g. a bytearray or NumPy array)
+        until it is full or the object ends. If `generation` is given, reads
+        exactly that version of the object. Returns the number of bytes read.
+        """
+
+    @abstractmethod
+    def stat(self, path: str) -> ObjectInfo | None:
+        """
+        Returns the object's metadata, or None if there is no object at `path`.
+        """
+
+    @abstractmethod
+    def delete(self, path: str):
+        """
+        Removes the object at `path`.
+        """
+
+    @abstractmethod
+    def list_objects(
+        self,
+        prefix: str = "",
+        delimiter: str | None = None,
+        page_size: int | None = None,
+    ) -> Iterator[ObjectInfo | str]:
+        """
+        Yields the metadata of every object whose path starts with `prefix`,
+        fetching it a page of at most page_size entries at a time where the
+        backend pages at all.
+
+        With a delimiter, such as "/", objects whose path continues past
+        another delimiter are not yielded; instead the path up to and
+        including that delimiter, i.e. the "subdirectory", is yielded once,
+        as a str.
+        """
+
+
+class GCSBackend(StorageBackend):
+    """
+    Stores objects in a Google Cloud Storage bucket.
+
+    Arguments:
+
+    - project_name (str): The GCS Project name
+    - bucket_name (str): The GCS Bucket name
+    - max_pool_size (int): The maximum number of pooled HTTP connections to GCS
+    - chunk_size (int): How many bytes streaming uploads send per request;
+      must be a multiple of 256 KiB
+    - parallel_upload_threshold (int): Files of at least this many bytes are
+      uploaded as parallel parts composed on the server.
+      None (the default) turns this off.
+    - parallel_download_threshold (int): Objects of at least this many bytes
+      are downloaded as parallel byte ranges.
+      None (the default) turns this off.
+    - parallel_parts (int): How many parts large transfers are split into
+    - retry (RetryPolicy): How transfers that fail transiently are retried;
+      see mozmlops.retry
+    - instrumentation (Instrumentation): Records how long setting up the
+      client takes, as the "setup" phase of the "client" operation
+
+    Uploads of more than MAX_SINGLE_REQUEST_UPLOAD_SIZE bytes use a resumable
+    upload session: after a failure, only the bytes GCS has not confirmed yet
+    are sent again. Interrupted downloads continue from the last byte written.
+
+    The underlying google.cloud.storage client and bucket handle are created
+    the first time they are needed and then reused by every call on this
+    instance, so credentials are discovered, the bucket is looked up and the
+    HTTP connection pool is set up only once. The instance can be shared
+    between threads.
+    """
+
+    def __init__(
+        self,
+        project_name: str,
+        bucket_name: str,
+        max_pool_size: int = 10,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        parallel_upload_threshold: int | None = None,
+        parallel_download_threshold: int | None = None,
+        parallel_parts: int = 8,
+        retry: RetryPolicy | None = None,
+        instrumentation: Instrumentation | None = None,
+    ):
+        self.project_name = project_name
+        self.bucket_name = bucket_name
+        self.name = f"gs://{bucket_name}"
+        self.max_pool_size = max_pool_size
+        self.chunk_size = chunk_size
+        self.parallel_upload_threshold = parallel_upload_threshold
+        self.parallel_download_threshold = parallel_download_threshold
+        self.parallel_parts = min(parallel_parts, MAX_COMPOSE_PARTS)
+        self.retry = retry or RetryPolicy()
+        self.instrumentation = instrumentation
+
+        self._bucket = None
+        self._bucket_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        """
+        The bucket handle, created along with the client on first use.
+        """
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    with measure(self.instrumentation, "client", "setup"):
+                        self._bucket = self._connect()
+        return self._bucket
+
+    def _connect(self):
+        """
+        Creates the google.cloud.storage client and returns the bucket handle.
+        """
+        client = storage.Client(project=self.project_name)
+
+        # The default requests adapter keeps at most 10 connections
+        # per host, which throttles concurrent transfers.
+        adapter = requests_adapters.HTTPAdapter(
+            pool_connections=self.max_pool_size,
+            pool_maxsize=self.max_pool_size,
+        )
+        client._http.mount("https://", adapter)
+        client._http.mount("http://", adapter)
+
+        # Raises an exception if the bucket name cannot be found
+        return client.get_bucket(self.bucket_name)
+
+    def upload(
+        self,
+        stream,
+        path,
+        size=None,
+        chunk_size=None,
+        metadata=None,
+        if_generation_match=0,
+    ):
+        blob = self.bucket.blob(path)
+        blob.metadata = metadata
+        if size is not None and size <= MAX_SINGLE_REQUEST_UPLOAD_SIZE:
+            self._upload_single_request(
+                blob, read_fully(stream, size), if_generation_match
+            )
+        else:
+            self._upload_resumable(
+                blob, stream, size, chunk_size or self.chunk_size, if_generation_match
+            )
+
+    def upload_file(
+        self,
+        local_path,
+        path,
+        chunk_size=None,
+        metadata=None,
+        if_generation_match=0,
+    ):
+        chunk_size = chunk_size or self.chunk_size
+        size = os.path.getsize(local_path)
+        if (
+            self.parallel_upload_threshold is not None
+            and size >= self.parallel_upload_threshold
+            # An empty file has no parts to upload.
+            and size > 0
+        ):
+            return self._upload_composite(
+                local_path, path, size, chunk_size, metadata, if_generation_match
+            )
+
+        with open(local_path, "rb") as f:
+            self.upload(f, path, size, chunk_size, metadata, if_generation_match)
+
+    def download(self, path, local_path, info=None):
+        if info is None and self.parallel_download_threshold is not None:
+            # This costs a metadata request, so only do it when it can pay off.
+            info = self.stat(path)
+
+        if (
+            info is not None
+            and self.parallel_download_threshold is not None
+            and info.size >= self.parallel_download_threshold
+            and info.size > 0
+        ):
+            return self._download_sliced(info, local_path)
+
+        blob = self.bucket.blob(path, generation=info.generation if info else None)
+        try:
+            with open(local_path, "wb") as f:
+                resumed = self._download_to_file(blob, f)
+            if resumed:
+                # Without a generation to pin, a resumed download could
+                # stitch two versions together; the checksum tells.
+                info = info or self.stat(path)
+                if info is None or info.crc32c != file_crc32c(local_path):
+                    raise Exception(
+                        f"The download of {path} to {local_path} is corrupt."
+                    )
+        except BaseException:
+            os.remove(local_path)
+            raise
+
+    def read_range_into(self, path, start, buffer, generation=None):
+        writer = BufferWriter(buffer)
+        if writer.capacity:
+            blob = self.bucket.blob(path, generation=generation)
+            self._download_to_file(blob, writer, start, start + writer.capacity - 1)
+        return writer.written
+
+    def stat(self, path):
+        blob = self.bucket.get_blob(path)
+        return self._info(blob) if blob is not None else None
+
+    def delete(self, path):
+        self.bucket.blob(path).delete()
+
+    def list_objects(self, prefix="", delimiter=None, page_size=None):
+        blobs = self.bucket.list_blobs(
+            prefix=prefix, delimiter=delimiter, page_size=page_size
+        )
+        # Pages are only requested as the previous one runs out.
+        for page in blobs.pages:
+            for blob in page:
+                yield self._info(blob)
+            yield from sorted(page.prefixes)
+
+    @staticmethod
+    def _info(blob) -> ObjectInfo:
+        return ObjectInfo(
+            path=blob.name,
+            size=blob.size,
+            generation=blob.generation,
+            crc32c=blob.crc32c,
+            updated=blob.updated,
+            metadata=blob.metadata or {},
+        )
+
+    def _upload(
+        self, upload: Callable[..., object], path: str, if_generation_match: int = 0
+    ):
+        """
+        Runs `upload`, which performs the actual transfer and accepts
+        google.cloud.storage's upload keyword arguments, and turns
+        GCS's "precondition failed" into a clear error.
+        Transient failures are left to the caller to retry.
+        """
+        # Google recommends setting `if_generation_match=0` if the
+        # object is expected to be new. We don't expect collisions,
+        # so setting this to 0 seems good.
+        try:
+            return upload(if_generation_match=if_generation_match)
+        except google_exceptions.GoogleCloudError as e:
+            if e.code == 412:
+                raise _already_exists(f"{self.name}/{path}").with_traceback(
+                    e.__traceback__
+                )
+            raise e
+
+    def _upload_single_request(self, blob, data: bytes, if_generation_match: int):
+        """
+        Uploads `data` in one request, sending all of it again on a retry.
+        """
+        attempts = 0
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1:
+                record(bytes_resent=len(data))
+            try:
+                self._upload(
+                    lambda **kwargs: blob.upload_from_file(
+                        io.BytesIO(data), size=len(data), retry=None, **kwargs
+                    ),
+                    blob.name,
+                    if_generation_match,
+                )
+            except ObjectAlreadyExistsError:
+                # An earlier attempt may have stored the object and then
+                # lost the response.
+                info = self.stat(blob.name) if attempts > 1 else None
+                if info is None or info.crc32c != bytes_crc32c(data):
+                    raise
+
+        self.retry.run(attempt, f"Upload of {blob.name}")
+
+    def _upload_resumable(
+        self,
+        blob,
+        stream: BinaryIO,
+        size: int | None,
+        chunk_size: int,
+        if_generation_match: int,
+    ):
+        """
+        Uploads a stream through a resumable upload session, one chunk of
+        chunk_size bytes at a time. Holds at most two chunks in memory:
+        the one being sent, in case part of it has to be sent again,
+        and the next, to know whether the current one is the last.
+        """
+        url = self.retry.run(
+            lambda: self._upload(
+                lambda **kwargs: blob.create_resumable_upload_session(
+                    size=size, retry=None, **kwargs
+                ),
+                blob.name,
+                if_generation_match,
+            ),
+            f"Starting the upload of {blob.name}",
+        )
+
+        checksum = google_crc32c.Checksum()
+        start = 0
+        chunk = read_fully(stream, chunk_size)
+        while True:
+            following = (
+                read_fully(stream, chunk_size) if len(chunk) == chunk_size else b""
+            )
+            total = size if size is not None or following else start + len(chunk)
+            checksum.update(chunk)
+            resource = self._upload_chunk(url, blob.name, chunk, start, total)
+            if resource is not None:
+                break
+            start += len(chunk)
+            chunk = following
+
+        if resource.get("crc32c") != encode_crc32c(checksum):
+            self.delete(blob.name)
+            raise Exception(
+                f"The uploaded object at {blob.name} does not match what was sent; "
+                "it has been removed."
+            )
+
+    def _upload_chunk(
+        self, url: str, path: str, chunk: bytes, start: int, total: int | None
+    ) -> dict | None:
+        """
+        Sends one chunk of a resumable upload that begins at byte `start`.
+        After a failure, asks GCS how much of it arrived and sends the rest.
+        Returns the object's resource once the upload is complete, else None.
+        """
+        transport = self.bucket.client._http
+        end = start + len(chunk)
+        failed_before = False
+
+        def attempt():
+            nonlocal failed_before
+            offset = start
+            if failed_before:
+                committed, resource = self._upload_status(
+                    transport.put(
+                        url, headers={"Content-Range": _content_range(end, end, total)}
+                    ),
+                    path,
+                )
+                if resource is not None:
+                    return resource
+                offset = max(start, committed)
+                record(bytes_resent=end - offset)
+            failed_before = True
+
+            while True:
+                committed, resource = self._upload_status(
+                    transport.put(
+                        url,
+                        data=chunk if offset == start else chunk[offset - start :],
+                        headers={"Content-Range": _content_range(offset, end, total)},
+                    ),
+                    path,
+                )
+                if resource is not None or committed >= end:
+                    return resource
+                # GCS kept only part of the chunk.
+                offset = committed
+
+        return self.retry.run(attempt, f"Upload of {path}")
+
+    def _upload_status(self, response, path: str) -> tuple[int, dict | None]:
+        """
+        Interprets a resumable upload response. Returns how many bytes GCS
+        has, and the object's resource if the upload is complete.
+        """
+        if response.status_code in (200, 201):
+            return 0, response.json()
+        if response.status_code == 308:
+            # "Range: bytes=0-N" means GCS has bytes 0 to N.
+            received = response.headers.get("Range")
+            return int(received.rpartition("-")[2]) + 1 if received else 0, None
+        if response.status_code == 412:
+            raise _already_exists(f"{self.name}/{path}")
+        raise api_core_exceptions.from_http_response(response)
+
+    def _download_to_file(self, blob, f, start: int = 0, end: int | None = None):
+        """
+        Downloads bytes `start` to `end` (inclusive; by default, to the end)
+        of a blob into `f` at its current position. After a failure, carries
+        on from the last byte written. Returns whether it had to.
+        """
+        origin = f.tell()
+        resumed = False
+
+        def attempt():
+            nonlocal resumed
+            written = f.tell() - origin
+            if end is not None and start + written > end:
+                return
+            resumed = resumed or written > 0
+            whole = start == 0 and end is None and not resumed
+            blob.download_to_file(
+                f,
+                # Asking for the whole object without a range also works
+                # for an empty one, which has no byte 0 to ask for.
+                start=None if whole else start + written,
+                end=end,
+                # GCS only reports checksums of whole objects.
+                checksum="crc32c" if whole else None,
+                retry=None,
+            )
+
+        self.retry.run(attempt, f"Download of {blob.name}")
+        return resumed
+
+    def _upload_composite(
+        self,
+        local_path: str,
+        path: str,
+        size: int,
+        chunk_size: int,
+        metadata: dict | None,
+        if_generation_match: int,
+    ):
+        """
+        Uploads a file as parallel_parts temporary objects, composes them
+        into `path`, checks the composed object's CRC32C against the
+        local file and removes the temporary objects.
+        """
+        bucket = self.bucket
+        part_size = -(-size // self.parallel_parts)
+        token = uuid.uuid4().hex
+        parts = [
+            (f"{path}.part-{token}-{i}", start, min(part_size, size - start))
+            for i, start in enumerate(range(0, size, part_size))
+        ]
+
+        def upload_part(part):
+            name, start, length = part
+            chunks = iter_file_range(local_path, start, length, chunk_size)
+            with chunk_stream(chunks, chunk_size) as f:
+                self.upload(f, name, size=length, chunk_size=chunk_size)
+            return bucket.blob(name)
+
+        destination = bucket.blob(path)
+        destination.metadata = metadata
+        try:
+            with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+                sources = list(executor.map(propagating(upload_part), parts))
+            self._compose(destination, sources, local_path, if_generation_match)
+        finally:
+            for name, _, _ in parts:
+                try:
+                    bucket.blob(name).delete()
+                except Exception:
+                    logger.warning(f"Could not remove temporary part {name}")
+
+        if destination.crc32c != file_crc32c(local_path):
+            destination.delete()
+            raise Exception(
+                f"The composed object at {path} does not match {local_path}; it has been removed."
+            )
+
+    def _compose(
+        self, destination, sources: list, local_path: str, if_generation_match: int
+    ):
+        """
+        Composes `sources` into `destination`, retrying transient failures.
+        """
+        attempts = 0
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            try:
+                self._upload(
+                    lambda **kwargs: destination.compose(sources, retry=None, **kwargs),
+                    destination.name,
+                    if_generation_match,
+                )
+            except ObjectAlreadyExistsError:
+                # An earlier attempt may have composed the object and then
+                # lost the response.
+                info = self.stat(destination.name) if attempts > 1 else None
+                if info is None or info.crc32c != file_crc32c(local_path):
+                    raise
+                destination.reload()
+
+        self.retry.run(attempt, f"Composing {destination.name}")
+
+    def _download_sliced(self, info: ObjectInfo, local_path: str):
+        """
+        Downloads one generation of an object as parallel byte ranges
+        into a preallocated file and checks the result's CRC32C.
+        """
+        # Pin the generation so every slice reads the same version of the object.
+        pinned = self.bucket.blob(info.path, generation=info.generation)
+        slice_size = -(-info.size // self.parallel_parts)
+
+        with open(local_path, "wb") as f:
+            f.truncate(info.size)
+
+        def download_slice(start):
+            end = min(start + slice_size, info.size) - 1
+            with open(local_path, "r+b") as f:
+                f.seek(start)
+                self._download_to_file(pinned, f, start, end)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel_parts) as executor:
+                slices = range(0, info.size, slice_size)
+                list(executor.map(propagating(download_slice), slices))
+            if info.crc32c != file_crc32c(local_path):
+                raise Exception(
+                    f"The download of {info.path} to {local_path} is corrupt."
+                )
+        except Exception:
+            os.remove(local_path)
+            raise
+
+
+def _already_exists(location: str) -> ObjectAlreadyExistsError:
+    return ObjectAlreadyExistsError(
+        f"The object you tried to upload is already at {location}. Currently, the .store() function's implementation dictates this behavior."
+    )
+
+
+def _content_range(start: int, end: int, total: int | None) -> str:
+    """
+    Returns the Content-Range header for sending bytes `start` up to `end`
+    of a resumable upload, or for asking how far it got if start == end.
+    """
+    size = "*" if total is None else total
+    if start == end:
+        return f"bytes */{size}"
+    return f"bytes {start}-{end - 1}/{size}"
+
+
+class LocalFilesystemBackend(StorageBackend):
+    """
+    Stores objects as files under a local directory.
+
+    Arguments:
+
+    - root (str): The directory that plays the part of the bucket
+
+    Object metadata and generations are kept in JSON files under
+    root/.mozmlops-metadata. Generations count up across root, so that
+    every upload gets a new one however coarse the file times are.
+    A file placed under root by other means has its modification time
+    as its generation.
+    """
+
+    METADATA_DIRECTORY = ".mozmlops-metadata"
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.name = f"file://{self.root}"
+
+    def upload(
+        self,
+        stream,
+        path,
+        size=None,
+        chunk_size=None,
+        metadata=None,
+        if_generation_match=0,
+    ):
+        target = self._resolve(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.parent / f".{target.name}.{uuid.uuid4().hex}.partial"
+        try:
+            with open(partial, "wb") as f:
+                shutil.copyfileobj(stream, f, chunk_size or DEFAULT_CHUNK_SIZE)
+            # The lock makes checking the generation and putting the object
+            # in place one step, for every thread and process writing here.
+            with self._lock():
+                current = self.stat(path, checksum=False)
+                if if_generation_match:
+                    if current is None or current.generation != if_generation_match:
+                        raise FileExistsError(path)
+                elif current is not None:
+                    raise FileExistsError(path)
+                # Write the metadata first, so that the object never
+                # appears without it.
+                self._write_metadata(path, metadata, self._next_generation())
+                if if_generation_match:
+                    os.replace(partial, target)
+                else:
+                    os.link(partial, target)
+        except FileExistsError as e:
+            raise _already_exists(f"{self.name}/{path}") from e
+        finally:
+            partial.unlink(missing_ok=True)
+
+    def download(self, path, local_path, info=None):
+        shutil.copyfile(self._existing(path), local_path)
+
+    def read_range_into(self, path, start, buffer, generation=None):
+        with open(self._existing(path), "rb") as f:
+            f.seek(start)
+            return f.readinto(memoryview(buffer).cast("B"))
+
+    def stat(self, path, checksum: bool = True):
+        """
+        See StorageBackend.stat(). Computing the CRC32C reads the whole file;
+        pass checksum=False to skip it.
+        """
+        target = self._resolve(path)
+        try:
+            stat = target.stat()
+        except FileNotFoundError:
+            return None
+        stored = self._read_metadata(path)
+        return ObjectInfo(
+            path=path,
+            size=stat.st_size,
+            generation=stored.get("generation", stat.st_mtime_ns),
+            crc32c=file_crc32c(str(target)) if checksum else None,
+            updated=datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            metadata=stored.get("metadata", {}),
+        )
+
+    def delete(self, path):
+        with self._lock():
+            self._existing(path).unlink()
+            self._metadata_path(path).unlink(missing_ok=True)
+
+    def list_objects(self, prefix="", delimiter=None, page_size=None):
+        """
+        See StorageBackend.list_objects(). The listed objects carry no
+        CRC32C, which would mean reading every file; stat() one for it.
+        """
+        stat = functools.partial(self.stat, checksum=False)
+        yield from _collapse(self._walk(prefix), prefix, delimiter, stat)
+
+    def _walk(self, prefix: str) -> Iterator[str]:
+        """
+        Yields the path of every stored object that starts with `prefix`.
+        """
+        # Only walk the directory that the prefix points into.
+        directory = self._resolve(prefix.rpartition("/")[0])
+        if not directory.is_dir():
+            return
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                path = Path(dirpath, filename).relative_to(self.root).as_posix()
+                if path.startswith(prefix):
+                    yield path
+
+    def _metadata_path(self, path: str) -> Path:
+        return self.root / self.METADATA_DIRECTORY / f"{path}.json"
+
+    def _write_metadata(self, path: str, metadata: dict | None, generation: int):
+        metadata_path = self._metadata_path(path)
+        metadata_path.parent.mkdir(parents=True, exist_ok=True)
+        metadata_path.write_text(
+            json.dumps({"generation": generation, "metadata": metadata or {}})
+        )
+
+    def _next_generation(self) -> int:
+        """
+        Returns a generation no object under root has had. Call with the
+        lock held.
+        """
+        counter_path = self.root / self.METADATA_DIRECTORY / ".generation"
+        try:
+            generation = int(counter_path.read_text()) + 1
+        except FileNotFoundError:
+            # Start above the file times that stand in for generations.
+            generation = time.time_ns()
+        counter_path.write_text(str(generation))
+        return generation
+
+    @contextmanager
+    def _lock(self):
+        """
+        Holds an exclusive lock, shared across processes, on writing to root.
+        """
+        import fcntl
+
+        lock_path = self.root / self.METADATA_DIRECTORY / ".lock"
+        lock_path.parent.mkdir(exist_ok=True)
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_metadata(self, path: str) -> dict:
+        """
+        Returns what _write_metadata() wrote for path: its "generation" and
+        "metadata", or {} if nothing was.
+        """
+        try:
+            return json.loads(self._metadata_path(path).read_text())
+        except FileNotFoundError:
+            return {}
+
+    def _resolve(self, path: str) -> Path:
+        target = (self.root / path).resolve()
+        if not target.is_relative_to(self.root):
+            raise ValueError(f"{path} is outside of {self.root}")
+        return target
+
+    def _existing(self, path: str) -> Path:
+        target = self._resolve(path)
+        if not target.is_file():
+            raise FileNotFoundError(f"No such object: {self.name}/{path}")
+        return target
+
+
+@dataclass
+class _MemoryObject:
+    data: bytes
+    info: ObjectInfo
+
+
+class InMemoryBackend(StorageBackend):
+    """
+    Keeps objects in a dictionary. Nothing outlives the instance;
+    this is meant for unit tests and benchmarks.
+    """
+
+    def __init__(self):
+        self.name = f"memory://{id(self):x}"
+        self._objects = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def upload(
+        self,
+        stream,
+        path,
+        size=None,
+        chunk_size=None,
+        metadata=None,
+        if_generation_match=0,
+    ):
+        with io.BytesIO() as buffer:
+            shutil.copyfileobj(stream, buffer, chunk_size or DEFAULT_CHUNK_SIZE)
+            data = buffer.getvalue()
+
+        with self._lock:
+            current = self._objects.get(path)
+            current_generation = current.info.generation if current else 0
+            if current_generation != if_generation_match:
+                raise _already_exists(f"{self.name}/{path}")
+            self._generation += 1
+            info = ObjectInfo(
+                path=path,
+                size=len(data),
+                generation=self._generation,
+                crc32c=bytes_crc32c(data),
+                updated=datetime.now(timezone.utc),
+                metadata=dict(metadata or {}),
+            )
+            self._objects[path] = _MemoryObject(data, info)
+
+    def download(self, path, local_path, info=None):
+        with open(local_path, "wb") as f:
+            f.write(self._existing(path).data)
+
+    def read_range_into(self, path, start, buffer, generation=None):
+        data = memoryview(self._existing(path).data)[start:]
+        buffer = memoryview(buffer).cast("B")
+        n = min(len(buffer), len(data))
+        buffer[:n] = data[:n]
+        return n
+
+    def stat(self, path):
+        with self._lock:
+            obj = self._objects.get(path)
+        return obj.info if obj is not None else None
+
+    def delete(self, path):
+        with self._lock:
+            if self._objects.pop(path, None) is None:
+                raise FileNotFoundError(f"No such object: {self.name}/{path}")
+
+    def list_objects(self, prefix="", delimiter=None, page_size=None):
+        with self._lock:
+            infos = {
+                path: obj.info
+                for path, obj in self._objects.items()
+                if path.startswith(prefix)
+            }
+        yield from _collapse(sorted(infos), prefix, delimiter, infos.get)
+
+    def _existing(self, path: str) -> _MemoryObject:
+        with self._lock:
+            obj = self._objects.get(path)
+        if obj is None:
+            raise FileNotFoundError(f"No such object: {self.name}/{path}")
+        return obj
+
+
+def _collapse(
+    paths: Iterable[str],
+    prefix: str,
+    delimiter: str | None,
+    stat: Callable[[str], ObjectInfo | None],
+) -> Iterator[ObjectInfo | str]:
+    """
+    Implements StorageBackend.list_objects() over a listing of object paths,
+    for backends that cannot group them by delimiter themselves.
+    """
+    seen = set()
+    for path in paths:
+        if delimiter and delimiter in path[len(prefix) :]:
+            rest = path[len(prefix) :]
+            subdirectory = prefix + rest[: rest.index(delimiter) + len(delimiter)]
+            if subdirectory not in seen:
+                seen.add(subdirectory)
+                yield subdirectory
+            continue
+        info = stat(path)
+        if info is not None:
+            yield info
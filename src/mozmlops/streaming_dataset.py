@@ -0,0 +1,361 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Datasets stored as shards and streamed into training.
+
+ShardWriter writes samples to storage as a series of shards of about the
+same size, plus an index. StreamingDataset reads them back as an
+iterable: shards are downloaded a few at a time in parallel, ahead of
+training, and read one sample at a time, so training starts as soon as
+the first shard arrives and memory stays flat however large the dataset.
+
+    with ShardWriter(storage_client, "cifar10/train") as writer:
+        for image, label in trainset:
+            writer.write((image, label))
+
+    dataset = StreamingDataset(storage_client, "cifar10/train", shuffle=True)
+    loader = DataLoader(as_torch_dataset(dataset), batch_size=64, num_workers=4)
+
+Each DataLoader worker, and each node given rank and world_size, reads
+a different subset of the shards.
+"""
+
+import json
+import os
+import pickle
+import random
+import shutil
+import struct
+import sys
+import tempfile
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Iterator
+
+from mozmlops._streaming import bytes_crc32c, file_crc32c
+from mozmlops.artifact_cache import DEFAULT_CACHE_MAX_BYTES, ArtifactCache
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+
+# Shards are cut once they hold at least this many bytes.
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+
+# Each sample in a shard is its serialized length, then its bytes.
+_LENGTH = struct.Struct("<Q")
+
+
+def _pickle(sample) -> bytes:
+    return pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class ShardWriter:
+    """
+    Writes samples to storage as shards, and an index of the shards.
+
+    Arguments:
+
+    - storage_client (CloudStorageAPIClient): Where the dataset is stored
+    - prefix (str): The storage path of the dataset
+    - shard_bytes (int): Start a new shard once one holds this many bytes
+    - serialize (Callable[[Any], bytes]): Turns a sample into bytes.
+      Defaults to pickle.
+
+    The dataset is only readable once .close() has stored the index.
+    """
+
+    def __init__(
+        self,
+        storage_client: CloudStorageAPIClient,
+        prefix: str,
+        shard_bytes: int = DEFAULT_SHARD_BYTES,
+        serialize: Callable[[Any], bytes] = _pickle,
+    ):
+        self.storage_client = storage_client
+        self.prefix = prefix.rstrip("/")
+        self.shard_bytes = shard_bytes
+        self.serialize = serialize
+        self.shards: list[dict] = []
+        self._buffer = bytearray()
+        self._samples = 0
+
+    def write(self, sample):
+        data = self.serialize(sample)
+        self._buffer += _LENGTH.pack(len(data))
+        self._buffer += data
+        self._samples += 1
+        if len(self._buffer) >= self.shard_bytes:
+            self._flush()
+
+    def close(self) -> dict:
+        """
+        Stores the last shard and the index, and returns the index.
+        """
+        if self._samples:
+            self._flush()
+        index = {
+            "version": FORMAT_VERSION,
+            "samples": sum(shard["samples"] for shard in self.shards),
+            "shards": self.shards,
+        }
+        self.storage_client.store(
+            json.dumps(index, indent=2).encode("utf-8"), f"{self.prefix}/{INDEX_NAME}"
+        )
+        return index
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+
+    def _flush(self):
+        path = f"{self.prefix}/shard-{len(self.shards):06d}.bin"
+        data = bytes(self._buffer)
+        self.storage_client.store(data, path)
+        self.shards.append(
+            {
+                "path": path,
+                "samples": self._samples,
+                "bytes": len(data),
+                "crc32c": bytes_crc32c(data),
+            }
+        )
+        self._buffer = bytearray()
+        self._samples = 0
+
+
+class StreamingDataset:
+    """
+    Streams the samples of a dataset written by ShardWriter.
+
+    Arguments:
+
+    - storage_client (CloudStorageAPIClient): Where the dataset is stored
+    - prefix (str): The storage path of the dataset
+    - shuffle (bool): Shuffle the order of the shards, and the samples
+      within a buffer of shuffle_buffer samples, differently every epoch
+    - shuffle_buffer (int): How many samples are held to shuffle
+    - seed (int): Seeds the shuffling; every node must use the same seed
+    - prefetch (int): How many shards are downloaded ahead of training
+    - cache_directory (str): Keep downloaded shards in an ArtifactCache
+      in this directory, shared by every process on the node, so later
+      epochs and runs read them locally. By default shards are deleted
+      once read.
+    - cache_max_bytes (int): The cache evicts least recently used shards
+      to stay under this many bytes
+    - rank (int): This node's rank, for distributed training. Defaults to
+      the RANK environment variable, or 0.
+    - world_size (int): How many nodes there are. Defaults to the
+      WORLD_SIZE environment variable, or 1.
+    - deserialize (Callable[[bytes], Any]): Turns bytes back into a sample.
+      Defaults to pickle.
+    - transform (Callable[[Any], Any]): Applied to every sample read
+
+    Shards are split between nodes and DataLoader workers, so with fewer
+    shards than nodes times workers, some read nothing. Call
+    .set_epoch() before each epoch to shuffle differently.
+    """
+
+    def __init__(
+        self,
+        storage_client: CloudStorageAPIClient,
+        prefix: str,
+        shuffle: bool = False,
+        shuffle_buffer: int = 10_000,
+        seed: int = 0,
+        prefetch: int = 4,
+        cache_directory: str | None = None,
+        cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        rank: int | None = None,
+        world_size: int | None = None,
+        deserialize: Callable[[bytes], Any] = pickle.loads,
+        transform: Callable[[Any], Any] | None = None,
+    ):
+        self.storage_client = storage_client
+        self.prefix = prefix.rstrip("/")
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.prefetch = prefetch
+        self.cache = (
+            ArtifactCache(cache_directory, cache_max_bytes)
+            if cache_directory is not None
+            else None
+        )
+        self.rank = int(os.environ.get("RANK", 0)) if rank is None else rank
+        self.world_size = (
+            int(os.environ.get("WORLD_SIZE", 1)) if world_size is None else world_size
+        )
+        self.deserialize = deserialize
+        self.transform = transform
+        self.epoch = 0
+        self._index: dict | None = None
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            with tempfile.TemporaryDirectory() as directory:
+                local_path = os.path.join(directory, INDEX_NAME)
+                self.storage_client.fetch(f"{self.prefix}/{INDEX_NAME}", local_path)
+                with open(local_path, "rb") as f:
+                    self._index = json.load(f)
+        return self._index
+
+    def __len__(self) -> int:
+        """
+        The number of samples in the whole dataset, across all nodes and workers.
+        """
+        return self.index["samples"]
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def shards(self, worker: int = 0, workers: int = 1) -> list[dict]:
+        """
+        Returns the shards that one DataLoader worker on this node reads this epoch.
+        """
+        shards = list(self.index["shards"])
+        if self.shuffle:
+            # Every node shuffles the same way, so that they split the same order.
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        reader = self.rank * workers + worker
+        return shards[reader :: self.world_size * workers]
+
+    def __iter__(self) -> Iterator:
+        worker, workers = _torch_worker()
+        samples = self._read(self.shards(worker, workers))
+        if self.shuffle:
+            samples = _shuffled(
+                samples,
+                self.shuffle_buffer,
+                random.Random(hash((self.seed, self.epoch, self.rank, worker))),
+            )
+        for sample in samples:
+            yield self.transform(sample) if self.transform is not None else sample
+
+    def _read(self, shards: list[dict]) -> Iterator:
+        directory = tempfile.mkdtemp(prefix="mozmlops-shards-")
+        executor = ThreadPoolExecutor(max_workers=max(self.prefetch, 1))
+        try:
+            pending = deque()
+            upcoming = iter(shards)
+            for shard in upcoming:
+                pending.append(executor.submit(self._download, shard, directory))
+                if len(pending) >= self.prefetch:
+                    break
+            while pending:
+                local_path = pending.popleft().result()
+                next_shard = next(upcoming, None)
+                if next_shard is not None:
+                    pending.append(
+                        executor.submit(self._download, next_shard, directory)
+                    )
+                try:
+                    with open(local_path, "rb") as f:
+                        yield from self._samples(f)
+                finally:
+                    os.remove(local_path)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _download(self, shard: dict, directory: str) -> str:
+        local_path = os.path.join(directory, os.path.basename(shard["path"]))
+        if self.cache is None:
+            self._fetch_shard(shard, local_path)
+            return local_path
+
+        # The index records each shard's checksum, which identifies its
+        # content, so cached shards need no metadata request.
+        key = ArtifactCache.key(
+            self.storage_client.backend.name, shard["path"], 0, shard["crc32c"]
+        )
+        self.cache.fetch(
+            key,
+            lambda path: self._fetch_shard(shard, path),
+            local_path,
+            link=True,
+        )
+        return local_path
+
+    def _fetch_shard(self, shard: dict, local_path: str):
+        """
+        Downloads a shard and checks it against the checksum in the index,
+        which also catches a shard replaced since the index was written.
+        """
+        self.storage_client.fetch(shard["path"], local_path)
+        if file_crc32c(local_path) != shard["crc32c"]:
+            os.remove(local_path)
+            raise Exception(
+                f"The shard {shard['path']} does not match the index of {self.prefix}."
+            )
+
+    def _samples(self, f: BinaryIO) -> Iterator:
+        while header := f.read(_LENGTH.size):
+            if len(header) < _LENGTH.size:
+                raise Exception(f"The shard {f.name} is truncated.")
+            (length,) = _LENGTH.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                raise Exception(f"The shard {f.name} is truncated.")
+            yield self.deserialize(data)
+
+
+def _shuffled(
+    samples: Iterator, buffer_size: int, generator: random.Random
+) -> Iterator:
+    """
+    Shuffles a stream of samples within a buffer: each sample read
+    replaces a random one from the buffer, which is yielded.
+    """
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        i = generator.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = sample
+    generator.shuffle(buffer)
+    yield from buffer
+
+
+def _torch_worker() -> tuple[int, int]:
+    """
+    Returns this DataLoader worker's id and the number of workers, or
+    (0, 1) outside of one. Does not import torch if it is not loaded.
+    """
+    if "torch" not in sys.modules:
+        return 0, 1
+    info = sys.modules["torch"].utils.data.get_worker_info()
+    return (info.id, info.num_workers) if info is not None else (0, 1)
+
+
+def as_torch_dataset(dataset: StreamingDataset):
+    """
+    Wraps a StreamingDataset in a torch.utils.data.IterableDataset, which
+    is what DataLoader needs to iterate rather than index it.
+    """
+    from torch.utils.data import IterableDataset
+
+    class TorchStreamingDataset(IterableDataset):
+        def __init__(self, dataset: StreamingDataset):
+            self.dataset = dataset
+
+        def __iter__(self):
+            return iter(self.dataset)
+
+        def __len__(self):
+            return len(self.dataset)
+
+        def set_epoch(self, epoch: int):
+            self.dataset.set_epoch(epoch)
+
+    return TorchStreamingDataset(dataset)
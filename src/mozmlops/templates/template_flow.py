@@ -90,6 +90,12 @@ class TemplateFlow(FlowSpec):
         # storage_client = CloudStorageAPIClient(
         #     project_name=GCS_PROJECT_NAME, bucket_name=GCS_BUCKET_NAME
         # )
+        # For local runs without GCS access, the same client can keep artifacts
+        # in a local directory instead:
+        # from mozmlops.storage_backends import LocalFilesystemBackend
+        # storage_client = CloudStorageAPIClient(
+        #     backend=LocalFilesystemBackend("./artifacts")
+        # )
 
         config_as_dict = json.loads(self.example_config)
         print(f"The config file says: {config_as_dict.get('example_key')}")
@@ -137,6 +143,21 @@ class TemplateFlow(FlowSpec):
         #     data=observed_values_for_storage, storage_path=observed_path
         # )
 
+        # Example: How you'd checkpoint a long training loop without pausing it
+        # to upload, and resume it from the newest checkpoint if the step is
+        # retried. Check out help(CheckpointManager) for more details.
+        # from mozmlops.checkpointing import CheckpointManager
+        # checkpoints = CheckpointManager(
+        #     storage_client,
+        #     os.path.join(current.flow_name, current.run_id, "checkpoints"),
+        #     every_steps=500,
+        # )
+        # restored = checkpoints.restore()
+        # for step in range(restored.step + 1 if restored else 0, total_steps):
+        #     ...  # train one step
+        #     checkpoints.step(step, model)
+        # checkpoints.close()
+
         # Example: How you'd fetch a checkpoint from the cloud
         # storage_client.fetch(
         #     remote_path=prediction_path, local_path="y_predictions.txt"
@@ -27,6 +27,20 @@ class Translator:
         # Load model
         self.model = pipeline("translation_en_to_fr", model="t5-small")
 
+        # To serve a model your flow stored with CloudStorageAPIClient, load it
+        # through a ModelLoader. Replicas on the same node then share one
+        # download of it. Check out help(ModelLoader) for more details.
+        # from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+        # from mozmlops.model_loader import ModelLoader
+        # storage_client = CloudStorageAPIClient(
+        #     project_name="some-project-name", bucket_name="some-bucket-name"
+        # )
+        # loaded = ModelLoader(storage_client).load(
+        #     "my_flow/run-42/t5-small/",
+        #     lambda directory: pipeline("translation_en_to_fr", model=directory),
+        # )
+        # self.model = loaded.model
+
     @app.post("/")
     def translate(self, translate_request: TranslateRequest) -> str:
         # Run inference
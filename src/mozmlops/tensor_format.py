@@ -0,0 +1,220 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+A file format for model weights that loads without copying or unpickling.
+
+A tensor file is a JSON header, describing each tensor's dtype, shape and
+offset, followed by the tensors' raw bytes, each aligned to ALIGNMENT
+bytes:
+
+    MAGIC | header length (uint64, little-endian) | header | padding
+    | tensor | padding | tensor | ...
+
+Writing streams each tensor's memory straight to storage. Reading maps
+the file into memory and returns arrays, or torch tensors, that are views
+of the mapping: nothing is read from disk until it is used, and the
+pages of a file are shared by every process that loads it.
+
+    store_tensors(storage_client, model.state_dict(), "my_flow/run-42/model.tensors")
+
+    model.load_state_dict(
+        ModelLoader(storage_client)
+        .load("my_flow/run-42/model.tensors", lambda path: load_tensors(path, "torch"))
+        .model
+    )
+"""
+
+import json
+import struct
+
+from typing import Any, BinaryIO, Iterator
+
+import numpy as np
+
+from mozmlops._streaming import map_file
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+
+MAGIC = b"MOZTNSR1"
+# Enough for any SIMD load, and a multiple of every dtype's size.
+ALIGNMENT = 64
+
+_HEADER_LENGTH = struct.Struct("<Q")
+_PREAMBLE = len(MAGIC) + _HEADER_LENGTH.size
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+def _as_array(tensor) -> tuple[np.ndarray, str]:
+    """
+    Returns a tensor's data as a contiguous little-endian NumPy array, without
+    copying it if it already is one, and the name of its dtype.
+    """
+    if type(tensor).__module__.split(".")[0] == "torch":
+        tensor = tensor.detach().cpu().contiguous()
+        dtype = str(tensor.dtype).removeprefix("torch.")
+        # NumPy has no bfloat16, so its bits are written as int16.
+        if dtype == "bfloat16":
+            import torch
+
+            return tensor.view(torch.int16).numpy(), dtype
+        return tensor.numpy(), dtype
+
+    array = np.asarray(tensor)
+    if array.dtype.hasobject:
+        raise ValueError(f"Cannot write tensors of dtype {array.dtype}")
+    array = np.asarray(array, dtype=array.dtype.newbyteorder("<"), order="C")
+    return array, array.dtype.name
+
+
+def tensor_chunks(
+    tensors: dict[str, Any], metadata: dict[str, str] | None = None
+) -> Iterator[memoryview]:
+    """
+    Arguments:
+    tensors (dict[str, Any]): NumPy arrays or torch tensors by name, e.g. a
+      model's state_dict().
+    metadata (dict[str, str]): Stored in the header, e.g. the model's version.
+
+    Yields a tensor file piece by piece. The tensors' data are yielded as
+    views of their memory, not copies.
+    """
+    arrays = {name: _as_array(tensor) for name, tensor in tensors.items()}
+
+    # Offsets are from the start of the file, so they depend on the length of
+    # the header that holds them: lay the tensors out until that settles.
+    start = 0
+    while True:
+        entries = {}
+        offset = start
+        for name, (array, dtype) in arrays.items():
+            entries[name] = {
+                "dtype": dtype,
+                "shape": list(array.shape),
+                "offset": offset,
+                "bytes": array.nbytes,
+            }
+            offset += array.nbytes + _padding(array.nbytes)
+        header = json.dumps(
+            {"metadata": metadata or {}, "tensors": entries}, separators=(",", ":")
+        ).encode("utf-8")
+        # Pad the header with spaces, so that the tensors start aligned.
+        header += b" " * _padding(_PREAMBLE + len(header))
+        if _PREAMBLE + len(header) == start:
+            break
+        start = _PREAMBLE + len(header)
+
+    yield memoryview(MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+    for array, _ in arrays.values():
+        if array.nbytes:
+            yield memoryview(array.reshape(-1).view(np.uint8))
+        if _padding(array.nbytes):
+            yield memoryview(bytes(_padding(array.nbytes)))
+
+
+def write_tensors(
+    tensors: dict[str, Any], f: BinaryIO, metadata: dict[str, str] | None = None
+) -> int:
+    """
+    Writes a tensor file to a binary file-like object. Returns its size.
+    """
+    return sum(f.write(chunk) for chunk in tensor_chunks(tensors, metadata))
+
+
+def store_tensors(
+    storage_client: CloudStorageAPIClient,
+    tensors: dict[str, Any],
+    storage_path: str,
+    metadata: dict[str, str] | None = None,
+) -> str:
+    """
+    Streams a tensor file to storage, holding at most one of the client's
+    chunks in memory besides the tensors themselves.
+    """
+    return storage_client.store_chunks(tensor_chunks(tensors, metadata), storage_path)
+
+
+class TensorFile:
+    """
+    A tensor file, mapped into memory.
+
+    Arguments:
+
+    - local_path (str): The file
+
+    The mapping is copy-on-write: arrays are writable, and writing to them
+    copies only the pages written, leaving the file unchanged.
+    Raises ValueError if the file is not a tensor file.
+    """
+
+    def __init__(self, local_path: str):
+        self.local_path = local_path
+        with open(local_path, "rb") as f:
+            preamble = f.read(_PREAMBLE)
+            if len(preamble) < _PREAMBLE or preamble[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{local_path} is not a tensor file")
+            (length,) = _HEADER_LENGTH.unpack(preamble[len(MAGIC) :])
+            header = json.loads(f.read(length))
+        self._mmap = map_file(local_path, copy=True)
+
+        self.metadata: dict[str, str] = header["metadata"]
+        self.entries: dict[str, dict] = header["tensors"]
+        for name, entry in self.entries.items():
+            if entry["offset"] + entry["bytes"] > len(self._mmap):
+                raise ValueError(f"{local_path} is truncated: {name} is incomplete")
+
+    def keys(self) -> list[str]:
+        return list(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        Returns a tensor as a NumPy array viewing the mapped file. bfloat16
+        tensors, which NumPy lacks, are returned as their bits, in int16.
+        """
+        entry = self.entries[name]
+        dtype = np.dtype(
+            "<i2" if entry["dtype"] == "bfloat16" else entry["dtype"]
+        ).newbyteorder("<")
+        count = entry["bytes"] // dtype.itemsize
+        array = np.frombuffer(self._mmap, dtype, count=count, offset=entry["offset"])
+        return array.reshape(entry["shape"])
+
+    def numpy(self) -> dict[str, np.ndarray]:
+        return {name: self[name] for name in self.entries}
+
+    def torch(self) -> dict:
+        """
+        Returns every tensor as a torch tensor viewing the mapped file.
+        """
+        import torch
+
+        tensors = {}
+        for name, entry in self.entries.items():
+            tensor = torch.from_numpy(self[name])
+            if entry["dtype"] == "bfloat16":
+                tensor = tensor.view(torch.bfloat16)
+            tensors[name] = tensor
+        return tensors
+
+
+def load_tensors(local_path: str, framework: str = "numpy") -> dict:
+    """
+    Arguments:
+    local_path (str): A tensor file.
+    framework (str): "numpy" for NumPy arrays, or "torch" for torch tensors.
+
+    Returns a tensor file's tensors by name, as views of the mapped file.
+    Use it as the load function of ModelLoader.load(), or after .fetch().
+    """
+    if framework not in ("numpy", "torch"):
+        raise ValueError(f"Unknown framework {framework!r}; use 'numpy' or 'torch'")
+    tensors = TensorFile(local_path)
+    return tensors.torch() if framework == "torch" else tensors.numpy()
@@ -0,0 +1,480 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+Profiling the input pipeline of training loops, and tuning DataLoaders.
+
+A TrainingProfiler splits the time of each training step between waiting
+for the next batch and the phases the loop marks, e.g. copying the batch
+to the device, the forward and backward passes and the optimizer step,
+and reports samples per second and which phase bounds the step:
+
+    profiler = TrainingProfiler(sync=torch.cuda.synchronize)
+    for inputs, labels in profiler.batches(trainloader):
+        with profiler.phase("to_device"):
+            inputs, labels = inputs.to(device), labels.to(device)
+        with profiler.phase("forward_backward"):
+            loss = criterion(model(inputs), labels)
+            loss.backward()
+        with profiler.phase("optimizer"):
+            optimizer.step()
+            optimizer.zero_grad()
+    current.card.extend(profiler.metaflow_card_components())
+
+tune_dataloader() trains briefly with different DataLoader settings and
+suggests the fastest one whose step time is steady.
+"""
+
+import logging
+import math
+import statistics
+import time
+
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+from mozmlops.instrumentation import Instrumentation, Measurement
+
+logger = logging.getLogger(__name__)
+
+DATA_PHASE = "data"
+STEP_PHASE = "step"
+# The part of a step that no phase accounts for.
+OTHER_PHASE = "other"
+
+# Histogram bucket upper bounds for training phases, in seconds: finer
+# than the storage defaults where steps usually fall.
+STEP_BUCKETS = (
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+    10.0,
+    30.0,
+    math.inf,
+)
+
+
+@dataclass
+class ProfileReport:
+    """
+    Where the time of the profiled training steps went.
+
+    - steps (int): Steps profiled, after the warmup
+    - samples (int): Samples in those steps
+    - seconds (float): Time those steps took
+    - phase_seconds (dict[str, float]): Time spent in each phase: "data"
+      waiting for batches, "other" outside any marked phase, and the
+      phases the loop marked
+    - p50_step_seconds (float): The median step time
+    - p95_step_seconds (float): The 95th percentile step time
+    """
+
+    steps: int = 0
+    samples: int = 0
+    seconds: float = 0.0
+    phase_seconds: dict[str, float] = field(default_factory=dict)
+    p50_step_seconds: float = 0.0
+    p95_step_seconds: float = 0.0
+
+    @property
+    def samples_per_second(self) -> float:
+        return self.samples / self.seconds if self.seconds else 0.0
+
+    @property
+    def steps_per_second(self) -> float:
+        return self.steps / self.seconds if self.seconds else 0.0
+
+    @property
+    def fractions(self) -> dict[str, float]:
+        """
+        The fraction of the step time spent in each phase.
+        """
+        return {
+            phase: seconds / self.seconds if self.seconds else 0.0
+            for phase, seconds in self.phase_seconds.items()
+        }
+
+    @property
+    def bottleneck(self) -> str | None:
+        """
+        The phase that takes the most time, or None before any step.
+        """
+        if not self.phase_seconds:
+            return None
+        return max(self.phase_seconds, key=self.phase_seconds.get)
+
+
+class TrainingProfiler:
+    """
+    Times the steps of a training loop, phase by phase.
+
+    Arguments:
+
+    - sync (Callable[[], None]): Waits for the device to finish its queued
+      work, e.g. torch.cuda.synchronize. Called as each phase starts and
+      ends; without it, work a GPU runs asynchronously is counted in
+      whichever phase next waits for it.
+    - warmup_steps (int): Steps to leave out at the start, while e.g.
+      DataLoader workers start and kernels are compiled
+    - instrumentation (Instrumentation): Where phases are recorded, e.g.
+      to also export them with .to_prometheus() or .log_to_wandb().
+      Defaults to one named "training", with STEP_BUCKETS and "loop" and
+      "phase" labels, exported as e.g. mozmlops_training_seconds.
+    - operation (str): The loop phases are recorded under
+
+    A step runs from asking for a batch to asking for the next one.
+    """
+
+    def __init__(
+        self,
+        sync: Callable[[], None] | None = None,
+        warmup_steps: int = 5,
+        instrumentation: Instrumentation | None = None,
+        operation: str = "train",
+    ):
+        self.sync = sync
+        self.warmup_steps = warmup_steps
+        self.instrumentation = instrumentation or Instrumentation(
+            buckets=STEP_BUCKETS, name="training", labels=("loop", "phase")
+        )
+        self.operation = operation
+        self.steps = 0
+        self.samples = 0
+        # The time of every recorded step, for exact percentiles
+        self.step_seconds = array("d")
+        self._seen = 0
+        self._step_phases: dict[str, float] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self._seen > self.warmup_steps
+
+    def batches(self, loader: Iterable) -> Iterator:
+        """
+        Yields the batches of `loader`, timing the wait for each as the
+        "data" phase and the whole step until the next one is asked for.
+        """
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self._seen += 1
+            self._step_phases = {DATA_PHASE: time.perf_counter() - start}
+            try:
+                yield batch
+            finally:
+                self._end_step(start, batch)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times the with block as a phase of the current step. A phase used
+        more than once in a step is added up.
+        """
+        if self.sync is not None:
+            self.sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync is not None:
+                self.sync()
+            self._step_phases[name] = (
+                self._step_phases.get(name, 0.0) + time.perf_counter() - start
+            )
+
+    def report(self) -> ProfileReport:
+        summary = self.instrumentation.summary()
+        prefix = f"{self.operation}/"
+        phase_seconds = {
+            name[len(prefix) : -len("/seconds")]: seconds
+            for name, seconds in summary.items()
+            if name.startswith(prefix)
+            and name.endswith("/seconds")
+            and name != f"{prefix}{STEP_PHASE}/seconds"
+        }
+        step = f"{prefix}{STEP_PHASE}"
+        return ProfileReport(
+            steps=self.steps,
+            samples=self.samples,
+            seconds=summary.get(f"{step}/seconds", 0.0),
+            phase_seconds=phase_seconds,
+            p50_step_seconds=_percentile(self.step_seconds, 0.5),
+            p95_step_seconds=_percentile(self.step_seconds, 0.95),
+        )
+
+    def metaflow_card_components(self) -> list:
+        """
+        Returns Metaflow card components that show the report as a table:
+
+            current.card.extend(profiler.metaflow_card_components())
+        """
+        from metaflow.cards import Markdown, Table
+
+        report = self.report()
+        rows = [
+            [phase, f"{seconds:.2f}", f"{report.fractions[phase]:.0%}"]
+            for phase, seconds in sorted(
+                report.phase_seconds.items(), key=lambda item: -item[1]
+            )
+        ]
+        return [
+            Markdown("# Training steps"),
+            Markdown(
+                f"{report.steps} steps, {report.samples_per_second:.1f} samples/s, "
+                f"p50 {report.p50_step_seconds * 1000:.1f} ms and "
+                f"p95 {report.p95_step_seconds * 1000:.1f} ms per step. "
+                f"Bound by **{report.bottleneck}**."
+            ),
+            Table(data=rows, headers=["Phase", "Seconds", "Share of step time"]),
+        ]
+
+    def _end_step(self, start: float, batch):
+        seconds = time.perf_counter() - start
+        if not self.recording:
+            return
+        other = seconds - sum(self._step_phases.values())
+        phases = {**self._step_phases, OTHER_PHASE: max(other, 0.0)}
+        for name, phase_seconds in phases.items():
+            self.instrumentation.record(
+                Measurement(self.operation, name, seconds=phase_seconds)
+            )
+        self.instrumentation.record(
+            Measurement(self.operation, STEP_PHASE, seconds=seconds)
+        )
+        self.step_seconds.append(seconds)
+        self.steps += 1
+        self.samples += count_samples(batch)
+
+
+def _percentile(values, q: float) -> float:
+    """
+    Interpolates the q quantile of values, or returns 0 if there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = q * (len(ordered) - 1)
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def count_samples(batch) -> int:
+    """
+    Returns the number of samples in a batch: the length of the batch,
+    or of its first item if it is a tuple, list or dict of batched
+    fields, e.g. (inputs, labels).
+    """
+    if isinstance(batch, dict) and batch:
+        batch = next(iter(batch.values()))
+    elif (
+        isinstance(batch, (tuple, list))
+        and batch
+        and hasattr(batch[0], "__len__")
+        and not isinstance(batch[0], (str, bytes))
+    ):
+        batch = batch[0]
+    shape = getattr(batch, "shape", None)
+    if shape:
+        return int(shape[0])
+    return len(batch) if hasattr(batch, "__len__") else 1
+
+
+@dataclass
+class TuningTrial:
+    """
+    Training briefly with one set of DataLoader settings.
+
+    - settings (dict[str, Any]): The DataLoader arguments tried
+    - report (ProfileReport): How the steps went
+    - step_seconds_cv (float): How much the step time varied: its
+      standard deviation over its mean
+    - error (str): Why the trial failed, if it did
+    """
+
+    settings: dict[str, Any]
+    report: ProfileReport | None = None
+    step_seconds_cv: float = 0.0
+    error: str | None = None
+
+    @property
+    def samples_per_second(self) -> float:
+        return self.report.samples_per_second if self.report is not None else 0.0
+
+
+@dataclass
+class TuningResult:
+    """
+    - best (dict[str, Any]): The suggested DataLoader settings
+    - trials (list[TuningTrial]): Every trial, in the order they ran
+    """
+
+    best: dict[str, Any]
+    trials: list[TuningTrial]
+
+    def metaflow_card_components(self) -> list:
+        """
+        Returns Metaflow card components that show the trials as a table.
+        """
+        from metaflow.cards import Markdown, Table
+
+        rows = [
+            [
+                ", ".join(f"{name}={value}" for name, value in trial.settings.items()),
+                f"{trial.samples_per_second:.1f}",
+                f"{trial.report.fractions.get(DATA_PHASE, 0):.0%}"
+                if trial.report is not None
+                else "",
+                f"{trial.step_seconds_cv:.2f}",
+                trial.error or "",
+            ]
+            for trial in self.trials
+        ]
+        best = ", ".join(f"{name}={value}" for name, value in self.best.items())
+        return [
+            Markdown("# DataLoader tuning"),
+            Markdown(f"Suggested settings: **{best}**"),
+            Table(
+                data=rows,
+                headers=[
+                    "Settings",
+                    "Samples/s",
+                    "Waiting for data",
+                    "Step time CV",
+                    "Error",
+                ],
+            ),
+        ]
+
+
+def tune_dataloader(
+    dataset,
+    train_step: Callable[[Any], None],
+    num_workers: Iterable[int] = (0, 2, 4, 8),
+    batch_size: Iterable[int] = (32,),
+    pin_memory: Iterable[bool] = (False, True),
+    prefetch_factor: Iterable[int] = (2, 4),
+    steps: int = 20,
+    warmup_steps: int = 3,
+    max_step_seconds_cv: float = 0.5,
+    make_loader: Callable[..., Iterable] | None = None,
+    sync: Callable[[], None] | None = None,
+) -> TuningResult:
+    """
+    Arguments:
+    dataset: The dataset to load.
+    train_step (Callable[[Any], None]): Runs one training step on a batch.
+      Use a copy of the model if the tuning steps should not train it.
+    num_workers, batch_size, pin_memory, prefetch_factor (Iterable): The
+      values of each DataLoader argument to try. The first of each is the
+      starting point. batch_size changes the optimization as well as the
+      speed, so by default only one is tried.
+    steps (int): Steps to time per trial, after warmup_steps.
+    max_step_seconds_cv (float): Settings whose step time varies more than
+      this, e.g. because workers cannot keep up and training stalls
+      periodically, are only suggested if no settings are steadier.
+    make_loader (Callable[..., Iterable]): Makes a loader from the dataset
+      and the settings as keyword arguments. Defaults to torch's DataLoader.
+    sync (Callable[[], None]): See TrainingProfiler.
+
+    Tries each value of one argument at a time, keeping the best value of
+    each before moving on to the next, rather than every combination.
+    Returns the trials and the fastest steady settings.
+    """
+    if make_loader is None:
+        from torch.utils.data import DataLoader
+
+        make_loader = DataLoader
+
+    candidates = {
+        "num_workers": list(num_workers),
+        "prefetch_factor": list(prefetch_factor),
+        "pin_memory": list(pin_memory),
+        "batch_size": list(batch_size),
+    }
+    best = {name: values[0] for name, values in candidates.items()}
+    trials: dict[tuple, TuningTrial] = {}
+
+    def run(settings: dict) -> TuningTrial:
+        if settings["num_workers"] == 0:
+            # Only worker processes prefetch.
+            settings = {**settings, "prefetch_factor": None}
+        key = tuple(sorted(settings.items()))
+        if key not in trials:
+            trials[key] = _trial(
+                dataset, train_step, settings, make_loader, steps, warmup_steps, sync
+            )
+        return trials[key]
+
+    def score(trial: TuningTrial) -> tuple:
+        steady = trial.step_seconds_cv <= max_step_seconds_cv
+        return (trial.error is None, steady, trial.samples_per_second)
+
+    for name, values in candidates.items():
+        tried = [run({**best, name: value}) for value in values]
+        best = dict(max(tried, key=score).settings)
+
+    if best["prefetch_factor"] is None:
+        del best["prefetch_factor"]
+    logger.info(f"Suggested DataLoader settings: {best}")
+    return TuningResult(best=best, trials=list(trials.values()))
+
+
+def _trial(
+    dataset,
+    train_step: Callable[[Any], None],
+    settings: dict,
+    make_loader: Callable[..., Iterable],
+    steps: int,
+    warmup_steps: int,
+    sync: Callable[[], None] | None,
+) -> TuningTrial:
+    profiler = TrainingProfiler(sync=sync, warmup_steps=warmup_steps)
+    trial = TuningTrial(settings=settings)
+    batches = None
+    try:
+        loader = make_loader(
+            dataset,
+            **{name: value for name, value in settings.items() if value is not None},
+        )
+        batches = profiler.batches(loader)
+        for batch in batches:
+            with profiler.phase("train"):
+                train_step(batch)
+            if profiler.steps + 1 >= steps and profiler.recording:
+                break
+    except Exception as e:
+        logger.warning(f"DataLoader settings {settings} failed: {e}")
+        trial.error = f"{type(e).__name__}: {e}"
+        return trial
+    finally:
+        # Stops the loader's workers, whether or not the trial failed.
+        if batches is not None:
+            batches.close()
+
+    trial.report = profiler.report()
+    step_seconds = profiler.step_seconds
+    if len(step_seconds) > 1 and statistics.mean(step_seconds):
+        trial.step_seconds_cv = statistics.stdev(step_seconds) / statistics.mean(
+            step_seconds
+        )
+    logger.info(
+        f"DataLoader settings {settings}: "
+        f"{trial.samples_per_second:.1f} samples/s, step time CV {trial.step_seconds_cv:.2f}"
+    )
+    return trial
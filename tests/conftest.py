@@ -0,0 +1,19 @@
+import pytest
+
+from fake_gcs_server import FakeGCSServer
+
+FAKE_PROJECT_NAME = "fake-project"
+FAKE_BUCKET_NAME = "fake-bucket"
+
+
+@pytest.fixture
+def fake_gcs(monkeypatch):
+    """
+    Starts a local fake GCS server with an empty bucket named FAKE_BUCKET_NAME
+    and points google-cloud-storage at it for the duration of the test.
+    """
+    server = FakeGCSServer().start()
+    server.create_bucket(FAKE_BUCKET_NAME)
+    monkeypatch.setenv("STORAGE_EMULATOR_HOST", server.url)
+    yield server
+    server.stop()
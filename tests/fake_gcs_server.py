@@ -0,0 +1,464 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+"""
+A small, in-process stand-in for the Google Cloud Storage JSON API.
+
+It implements just enough of the API for google-cloud-storage to talk to it
+through the STORAGE_EMULATOR_HOST environment variable: bucket lookups,
+multipart and resumable uploads, (ranged) downloads, object metadata,
+deletion, listing and compose.
+
+It is meant for tests and benchmarks that should not need live GCS.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import uuid
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import google_crc32c
+
+
+def _b64(digest: bytes) -> str:
+    return base64.b64encode(digest).decode("ascii")
+
+
+class FakeObject:
+    def __init__(
+        self, bucket, name, data, generation, metadata=None, content_type=None
+    ):
+        self.bucket = bucket
+        self.name = name
+        self.data = bytes(data)
+        self.generation = generation
+        self.metadata = metadata or {}
+        self.content_type = content_type or "application/octet-stream"
+        self.updated = datetime.now(timezone.utc)
+        self.crc32c = _b64(google_crc32c.Checksum(self.data).digest())
+        self.md5 = _b64(hashlib.md5(self.data).digest())
+
+    def resource(self) -> dict:
+        resource = {
+            "kind": "storage#object",
+            "id": f"{self.bucket}/{self.name}/{self.generation}",
+            "name": self.name,
+            "bucket": self.bucket,
+            "generation": str(self.generation),
+            "metageneration": "1",
+            "contentType": self.content_type,
+            "size": str(len(self.data)),
+            "crc32c": self.crc32c,
+            "md5Hash": self.md5,
+            "updated": self.updated.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "timeCreated": self.updated.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }
+        if self.metadata:
+            resource["metadata"] = self.metadata
+        return resource
+
+
+class FakeGCSServer:
+    """
+    Serves a fake GCS API on localhost.
+
+    Usage:
+
+        server = FakeGCSServer()
+        server.start()
+        server.create_bucket("some-bucket")
+        os.environ["STORAGE_EMULATOR_HOST"] = server.url
+        ...
+        server.stop()
+
+    Every request is recorded in `server.requests` as a (method, path) tuple,
+    which lets tests count round trips.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.buckets = {}
+        self.requests = []
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self._generation = 0
+        self._failures = []
+        self._interruptions = []
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def create_bucket(self, name: str):
+        with self.lock:
+            self.buckets.setdefault(name, {})
+
+    def put_object(self, bucket, name, data, metadata=None, content_type=None):
+        with self.lock:
+            return self._put(bucket, name, data, metadata, content_type)
+
+    def get_object(self, bucket, name):
+        with self.lock:
+            return self.buckets[bucket].get(name)
+
+    def fail_next(
+        self,
+        count: int = 1,
+        status: int = 503,
+        method: str = None,
+        path_suffix: str = "",
+    ):
+        """
+        Makes the next `count` requests (optionally only those with a given
+        HTTP method, or whose path ends with `path_suffix`) fail with
+        `status`. Useful for exercising retries.
+        """
+        with self.lock:
+            self._failures.extend([(status, method, path_suffix)] * count)
+
+    def interrupt_next(self, method: str, after_bytes: int):
+        """
+        Makes the next resumable upload chunk (method="PUT") keep only its
+        first `after_bytes` bytes and then fail with a 503, or the next
+        download (method="GET") drop the connection after `after_bytes` bytes.
+        """
+        with self.lock:
+            self._interruptions.append((method, after_bytes))
+
+    def count_requests(self, method: str = None, path_prefix: str = "") -> int:
+        return sum(
+            1
+            for m, p in self.requests
+            if (method is None or m == method) and p.startswith(path_prefix)
+        )
+
+    def _put(self, bucket, name, data, metadata=None, content_type=None):
+        self._generation += 1
+        obj = FakeObject(bucket, name, data, self._generation, metadata, content_type)
+        self.buckets[bucket][name] = obj
+        return obj
+
+    def _pop_failure(self, method, path):
+        with self.lock:
+            for i, (status, fail_method, suffix) in enumerate(self._failures):
+                if (fail_method is None or fail_method == method) and path.endswith(
+                    suffix
+                ):
+                    del self._failures[i]
+                    return status
+        return None
+
+    def _pop_interruption(self, method):
+        with self.lock:
+            for i, (interrupt_method, after_bytes) in enumerate(self._interruptions):
+                if interrupt_method == method:
+                    del self._interruptions[i]
+                    return after_bytes
+        return None
+
+
+def _make_handler(server: FakeGCSServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, Nagle's
+        # algorithm holds the body back for tens of milliseconds.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        # Plumbing
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send(self, status, body=b"", headers=None):
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode("utf-8")
+                headers = {"Content-Type": "application/json", **(headers or {})}
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._send(
+                status,
+                {
+                    "error": {
+                        "code": status,
+                        "message": message,
+                        "errors": [{"message": message, "reason": str(status)}],
+                    }
+                },
+            )
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            server.requests.append((method, parsed.path))
+            body = self._body()
+
+            failure = server._pop_failure(method, parsed.path)
+            if failure is not None:
+                return self._error(failure, "Injected failure")
+
+            parts = parsed.path.split("/")
+            try:
+                if parsed.path.startswith("/upload/storage/v1/b/"):
+                    return self._upload(method, unquote(parts[5]), query, body)
+                if parsed.path.startswith("/download/storage/v1/b/"):
+                    bucket, name = unquote(parts[5]), unquote("/".join(parts[7:]))
+                    return self._download(bucket, name, query)
+                if parsed.path.startswith("/storage/v1/b/"):
+                    return self._json_api(method, parts[4:], query, body)
+            except KeyError as e:
+                return self._error(404, f"No such object: {e}")
+            return self._error(404, f"Not found: {parsed.path}")
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        # Helpers
+
+        def _bucket(self, name):
+            if name not in server.buckets:
+                raise KeyError(name)
+            return server.buckets[name]
+
+        def _precondition_ok(self, bucket, name, query):
+            if "ifGenerationMatch" not in query:
+                return True
+            expected = int(query["ifGenerationMatch"])
+            existing = self._bucket(bucket).get(name)
+            if expected == 0:
+                return existing is None
+            return existing is not None and existing.generation == expected
+
+        def _store(self, bucket, name, data, resource, query):
+            with server.lock:
+                if not self._precondition_ok(bucket, name, query):
+                    return None
+                return server._put(
+                    bucket,
+                    name,
+                    data,
+                    resource.get("metadata"),
+                    resource.get("contentType"),
+                )
+
+        # JSON API
+
+        def _json_api(self, method, parts, query, body):
+            bucket = unquote(parts[0])
+            objects = self._bucket(bucket)
+            if len(parts) == 1:
+                return self._send(200, {"kind": "storage#bucket", "name": bucket})
+
+            if len(parts) == 2 and method == "GET":
+                return self._list(objects, query)
+
+            name = unquote("/".join(parts[2:]))
+            if name.endswith("/compose") and method == "POST":
+                return self._compose(bucket, name[: -len("/compose")], query, body)
+
+            obj = objects.get(name)
+            if obj is None:
+                return self._error(404, f"No such object: {bucket}/{name}")
+            if method == "GET":
+                return self._send(200, obj.resource())
+            if method == "DELETE":
+                with server.lock:
+                    objects.pop(name, None)
+                return self._send(204)
+            return self._error(405, "Method not allowed")
+
+        def _list(self, objects, query):
+            prefix = query.get("prefix", "")
+            delimiter = query.get("delimiter")
+            max_results = int(query.get("maxResults", 1000))
+            start = query.get("pageToken", "")
+
+            with server.lock:
+                names = sorted(n for n in objects if n.startswith(prefix) and n > start)
+            items, prefixes = [], set()
+            last = None
+            for name in names:
+                if len(items) + len(prefixes) >= max_results:
+                    break
+                last = name
+                rest = name[len(prefix) :]
+                if delimiter and delimiter in rest:
+                    prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+                    continue
+                items.append(objects[name].resource())
+
+            response = {"kind": "storage#objects", "items": items}
+            if prefixes:
+                response["prefixes"] = sorted(prefixes)
+            if last is not None and last != names[-1]:
+                response["nextPageToken"] = last
+            return self._send(200, response)
+
+        def _compose(self, bucket, name, query, body):
+            request = json.loads(body or b"{}")
+            objects = self._bucket(bucket)
+            data = b"".join(
+                objects[source["name"]].data for source in request["sourceObjects"]
+            )
+            obj = self._store(bucket, name, data, request.get("destination", {}), query)
+            if obj is None:
+                return self._error(412, "Precondition Failed")
+            return self._send(200, obj.resource())
+
+        # Media API
+
+        def _upload(self, method, bucket, query, body):
+            self._bucket(bucket)
+            upload_type = query.get("uploadType")
+            if method == "POST" and upload_type == "multipart":
+                resource, data = self._parse_multipart(body)
+                obj = self._store(bucket, resource["name"], data, resource, query)
+                if obj is None:
+                    return self._error(412, "Precondition Failed")
+                return self._send(200, obj.resource())
+
+            if method == "POST" and upload_type == "resumable":
+                resource = json.loads(body or b"{}")
+                if "name" in query:
+                    resource["name"] = query["name"]
+                with server.lock:
+                    if not self._precondition_ok(bucket, resource["name"], query):
+                        return self._error(412, "Precondition Failed")
+                upload_id = uuid.uuid4().hex
+                server.uploads[upload_id] = {
+                    "bucket": bucket,
+                    "resource": resource,
+                    "query": query,
+                    "data": bytearray(),
+                }
+                location = (
+                    f"{server.url}/upload/storage/v1/b/{quote(bucket, safe='')}/o"
+                    f"?uploadType=resumable&upload_id={upload_id}"
+                )
+                return self._send(200, headers={"Location": location})
+
+            if method == "PUT" and "upload_id" in query:
+                return self._resumable_chunk(query["upload_id"], body)
+            return self._error(400, "Unsupported upload")
+
+        def _resumable_chunk(self, upload_id, body):
+            upload = server.uploads.get(upload_id)
+            if upload is None:
+                return self._error(404, "No such upload")
+
+            content_range = self.headers.get("Content-Range", "bytes */*")
+            span, _, total = content_range[len("bytes ") :].partition("/")
+            if span != "*":
+                start = int(span.split("-")[0])
+                if start != len(upload["data"]):
+                    del upload["data"][start:]
+                after_bytes = server._pop_interruption("PUT")
+                if after_bytes is not None:
+                    upload["data"].extend(body[:after_bytes])
+                    return self._error(503, "Injected interruption")
+                upload["data"].extend(body)
+
+            received = len(upload["data"])
+            if total != "*" and int(total) == received:
+                del server.uploads[upload_id]
+                resource = upload["resource"]
+                obj = self._store(
+                    upload["bucket"],
+                    resource["name"],
+                    upload["data"],
+                    resource,
+                    upload["query"],
+                )
+                if obj is None:
+                    return self._error(412, "Precondition Failed")
+                return self._send(200, obj.resource())
+
+            headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+            return self._send(308, headers=headers)
+
+        def _parse_multipart(self, body):
+            content_type = self.headers["Content-Type"]
+            boundary = content_type.split("boundary=")[1].strip('"').encode("utf-8")
+            sections = body.split(b"--" + boundary)[1:-1]
+            payloads = [s.split(b"\r\n\r\n", 1)[1][: -len(b"\r\n")] for s in sections]
+            return json.loads(payloads[0]), payloads[1]
+
+        def _download(self, bucket, name, query):
+            obj = self._bucket(bucket).get(name)
+            if obj is None:
+                return self._error(404, f"No such object: {bucket}/{name}")
+            if "generation" in query and int(query["generation"]) != obj.generation:
+                return self._error(404, f"No such object: {bucket}/{name}")
+
+            headers = {
+                "Content-Type": obj.content_type,
+                "x-goog-generation": str(obj.generation),
+                "x-goog-stored-content-length": str(len(obj.data)),
+            }
+            range_header = self.headers.get("Range")
+            if not range_header:
+                headers["x-goog-hash"] = f"crc32c={obj.crc32c},md5={obj.md5}"
+                return self._send_interruptibly(200, obj.data, headers)
+
+            first, _, last = range_header[len("bytes=") :].partition("-")
+            size = len(obj.data)
+            if first == "":
+                start, end = max(size - int(last), 0), size - 1
+            else:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                return self._error(416, "Requested range not satisfiable")
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return self._send_interruptibly(206, obj.data[start : end + 1], headers)
+
+        def _send_interruptibly(self, status, body, headers):
+            after_bytes = server._pop_interruption("GET")
+            if after_bytes is None:
+                return self._send(status, body, headers)
+            # Promise the whole body, send part of it and hang up.
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:after_bytes])
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
@@ -0,0 +1,65 @@
+import os
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.artifact_cache import ArtifactCache
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+
+
+def test_fetch__with_cache__downloads_each_version_once(fake_gcs, tmp_path):
+    """
+    Tests that a cached fetch only downloads an object again once it has changed.
+    """
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME, cache=cache
+    )
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "model.pth", b"version 1")
+
+    storage_client.fetch("model.pth", f"{tmp_path}/replica_1/model.pth")
+    storage_client.fetch("model.pth", f"{tmp_path}/replica_2/model.pth")
+
+    assert (tmp_path / "replica_2" / "model.pth").read_bytes() == b"version 1"
+    assert fake_gcs.count_requests("GET", "/download/") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "model.pth", b"version 2")
+    storage_client.fetch("model.pth", f"{tmp_path}/replica_3/model.pth")
+
+    assert (tmp_path / "replica_3" / "model.pth").read_bytes() == b"version 2"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_fetch__cache_over_budget__evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=10)
+
+    def download(content):
+        return lambda path: open(path, "wb").write(content)
+
+    cache.fetch("old", download(b"12345"), str(tmp_path / "old"))
+    cache.fetch("recent", download(b"12345"), str(tmp_path / "recent"))
+    cache.fetch("old", download(b"unused"), str(tmp_path / "old"))
+    cache.fetch("new", download(b"12345"), str(tmp_path / "new"))
+
+    assert cache.size == 10
+    assert cache.stats == {"hits": 1, "misses": 3, "bytes": 10}
+    assert not cache.fetch("recent", download(b"12345"), str(tmp_path / "recent"))
+
+
+def test_evict__entries_removed_meanwhile__are_skipped_with_their_locks(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=5)
+
+    def download(path):
+        open(path, "wb").write(b"12345")
+
+    cache.fetch("first", download, str(tmp_path / "first"))
+    cache.fetch("second", download, str(tmp_path / "second"), link=True)
+    entries = cache._entries
+    # As if another process discarded an entry after it was listed.
+    cache._entries = lambda: [*entries(), cache.directory / "objects" / "gone"]
+
+    cache.evict()
+    cache.discard([str(tmp_path / "second")])
+
+    assert cache.size == 0
+    assert sorted(os.listdir(tmp_path / "cache" / "locks")) == ["evict"]
@@ -0,0 +1,48 @@
+import asyncio
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.async_cloud_storage_api_client import AsyncCloudStorageAPIClient
+
+
+def test_async_store_fetch__does_not_block_the_event_loop(fake_gcs, tmp_path):
+    """
+    Tests the async client end to end against the fake GCS server,
+    and that the event loop keeps running while transfers are in flight.
+    """
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        async with AsyncCloudStorageAPIClient(
+            project_name=FAKE_PROJECT_NAME,
+            bucket_name=FAKE_BUCKET_NAME,
+            max_concurrency=4,
+        ) as storage_client:
+            ticking = asyncio.create_task(ticker())
+
+            await storage_client.store(b"Grace Hopper", "hopper.txt")
+            report = await storage_client.store_many(
+                [(f"part {i}".encode(), f"part_{i}.txt") for i in range(10)]
+            )
+            await storage_client.fetch("hopper.txt", f"{tmp_path}/hopper.txt")
+            fetched = await storage_client.fetch_many(
+                [(f"part_{i}.txt", f"{tmp_path}/part_{i}.txt") for i in range(10)]
+            )
+
+            ticking.cancel()
+        return ticks, report, fetched
+
+    ticks, report, fetched = asyncio.run(scenario())
+
+    assert ticks > 0
+    assert not report.failed and not fetched.failed
+    assert fetched.bytes_transferred == report.bytes_transferred
+    assert (tmp_path / "hopper.txt").read_bytes() == b"Grace Hopper"
+    assert (tmp_path / "part_9.txt").read_bytes() == b"part 9"
@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+
+from mozmlops.batching import (
+    AdaptiveBatchController,
+    AdaptiveBatcher,
+    bucket_by_length,
+    handle_bucketed,
+)
+
+
+def _observe_steady_traffic(
+    controller, batches, rate, queue_depth, seconds_per_request
+):
+    now = 0.0
+    for _ in range(batches):
+        size = controller.batch_size
+        controller.observe(
+            batch_size=size,
+            inference_seconds=0.002 + seconds_per_request * size,
+            latencies=[0.01] * size,
+            queue_depth=queue_depth,
+            now=now,
+        )
+        now += size / rate
+
+
+def test_controller__requests_queueing_up__grows_batches_within_budget():
+    controller = AdaptiveBatchController(target_p99_s=0.2, max_batch_size=256)
+
+    _observe_steady_traffic(
+        controller, batches=20, rate=5000, queue_depth=500, seconds_per_request=0.004
+    )
+
+    # Half of the 200ms target fits (0.1 - 0.002) / 0.004 = 24 requests.
+    assert controller.batch_size == 24
+    assert controller.predicted_inference_seconds(24) <= 0.1
+    assert controller.decisions[-1].reason == "requests queueing up"
+
+
+def test_controller__p99_over_target__backs_off():
+    controller = AdaptiveBatchController(
+        target_p99_s=0.05, initial_batch_size=32, max_batch_size=64
+    )
+    controller.wait_timeout_s = 0.04
+
+    controller.observe(
+        batch_size=32, inference_seconds=0.03, latencies=[0.08] * 32, queue_depth=0
+    )
+
+    assert controller.batch_size == 24
+    assert controller.wait_timeout_s == pytest.approx(0.02)
+    assert controller.decisions[-1].reason == "p99 latency over target"
+
+
+def test_controller__after_a_burst__batch_size_recovers():
+    controller = AdaptiveBatchController(
+        target_p99_s=0.05, initial_batch_size=32, max_batch_size=64, window_s=2.0
+    )
+    for i in range(10):
+        controller.observe(
+            batch_size=controller.batch_size,
+            inference_seconds=0.03,
+            latencies=[0.2] * 100,
+            queue_depth=0,
+            now=i * 0.1,
+        )
+    assert controller.batch_size == 1
+
+    now = 1.0
+    while now < 5.0:
+        size = controller.batch_size
+        controller.observe(
+            batch_size=size,
+            inference_seconds=0.002 + 0.0005 * size,
+            latencies=[0.01] * size,
+            queue_depth=100,
+            now=now,
+        )
+        now += 0.05
+
+    assert controller.p99_seconds == 0.01
+    assert controller.batch_size >= 32
+    assert controller.decisions[-1].reason == "requests queueing up"
+
+
+def test_controller__wait__only_when_requests_are_expected_to_arrive():
+    busy = AdaptiveBatchController(target_p99_s=0.2, initial_batch_size=16)
+    quiet = AdaptiveBatchController(target_p99_s=0.2, initial_batch_size=16)
+
+    _observe_steady_traffic(
+        busy, batches=10, rate=1000, queue_depth=0, seconds_per_request=0.001
+    )
+    _observe_steady_traffic(
+        quiet, batches=10, rate=2, queue_depth=0, seconds_per_request=0.001
+    )
+
+    # 15 more requests take 15ms to arrive at 1000 requests per second.
+    assert busy.wait_timeout_s == pytest.approx(0.015)
+    assert quiet.wait_timeout_s == 0.0
+    assert set(busy.metrics()) >= {"batch_size", "wait_timeout_s", "p99_seconds"}
+
+
+def test_controller__apply__sets_ray_serve_batch_parameters():
+    class BatchHandler:
+        def set_max_batch_size(self, size):
+            self.max_batch_size = size
+
+        def set_batch_wait_timeout_s(self, timeout):
+            self.batch_wait_timeout_s = timeout
+
+    handler = BatchHandler()
+
+    AdaptiveBatchController(target_p99_s=0.1, initial_batch_size=8).apply(handler)
+
+    assert (handler.max_batch_size, handler.batch_wait_timeout_s) == (8, 0.0)
+
+
+def test_batcher__concurrent_requests__are_batched_in_order():
+    batches = []
+
+    async def double(requests):
+        batches.append(list(requests))
+        await asyncio.sleep(0.01)
+        return [request * 2 for request in requests]
+
+    async def main():
+        controller = AdaptiveBatchController(target_p99_s=1.0, initial_batch_size=4)
+        controller.wait_timeout_s = 0.05
+        batcher = AdaptiveBatcher(double, controller)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    assert asyncio.run(main()) == [i * 2 for i in range(10)]
+    assert batches[0] == [0, 1, 2, 3]
+    assert sum(len(batch) for batch in batches) == 10
+
+
+def test_batcher__failing_batch__fails_each_request():
+    def fail(requests):
+        raise RuntimeError("out of memory")
+
+    async def main():
+        batcher = AdaptiveBatcher(fail)
+        return await asyncio.gather(
+            batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_bucket_by_length__groups_similar_lengths_within_budgets():
+    lengths = [50, 3, 4, 48, 5, 100]
+
+    assert bucket_by_length(lengths, max_batch_size=3) == [[1, 2, 4], [3, 0, 5]]
+    # Padded to 50 tokens, the second pair already takes 100 tokens.
+    assert bucket_by_length(lengths, max_batch_size=8, max_batch_tokens=100) == [
+        [1, 2, 4],
+        [3, 0],
+        [5],
+    ]
+
+
+def test_handle_bucketed__returns_results_in_request_order():
+    batches = []
+
+    def shout(texts):
+        batches.append(texts)
+        return [text.upper() for text in texts]
+
+    texts = ["a long sentence", "hi", "another long one", "yo"]
+
+    results = handle_bucketed(shout, texts, len, max_batch_size=2)
+
+    assert results == [text.upper() for text in texts]
+    assert batches == [["hi", "yo"], ["a long sentence", "another long one"]]
+
+
+def test_batcher__with_length__batches_the_oldest_with_similar_requests():
+    batches = []
+
+    async def record(requests):
+        batches.append(sorted(requests))
+        return requests
+
+    async def main():
+        controller = AdaptiveBatchController(
+            target_p99_s=1.0, initial_batch_size=2, max_batch_size=2
+        )
+        controller.wait_timeout_s = 0.05
+        batcher = AdaptiveBatcher(record, controller, length=len)
+        texts = ["short", "x" * 40, "tiny", "y" * 41, "small"]
+        return texts, await asyncio.gather(*(batcher.submit(t) for t in texts))
+
+    texts, results = asyncio.run(main())
+
+    assert results == texts
+    assert batches[0] == ["short", "small"]
+    assert batches[1] == ["x" * 40, "y" * 41]
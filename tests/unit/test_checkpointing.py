@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from mozmlops.checkpointing import CheckpointManager
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend
+
+
+@pytest.fixture
+def storage_client():
+    return CloudStorageAPIClient(backend=InMemoryBackend())
+
+
+def test_step__keeps_the_last_checkpoints_and_restores_the_newest(storage_client):
+    state = {"weights": [0]}
+
+    with CheckpointManager(storage_client, "run-1", every_steps=2, keep=2) as manager:
+        for step in range(10):
+            state["weights"].append(step)
+            manager.step(step, state)
+            manager.wait()
+
+    assert [c.step for c in manager.checkpoints()] == [7, 9]
+    assert manager.stats.saved == 5
+
+    resumed = CheckpointManager(storage_client, "run-1", every_steps=2)
+    restored = resumed.restore()
+
+    assert restored.step == 9
+    assert restored.state == {"weights": [0, *range(10)]}
+    assert not resumed.step(10, state)
+    assert resumed.step(11, state)
+    resumed.close()
+
+
+def test_step__previous_checkpoint_in_flight__defers_without_blocking(
+    storage_client,
+):
+    release = threading.Event()
+
+    def slow_serialize(state, f):
+        release.wait()
+        f.write(repr(state).encode())
+
+    manager = CheckpointManager(
+        storage_client, "run-1", every_steps=1, serialize=slow_serialize
+    )
+
+    assert manager.step(0, {"step": 0})
+    assert not manager.step(1, {"step": 1})
+    assert manager.stats.deferred == 1
+
+    release.set()
+    manager.wait()
+    assert manager.step(2, {"step": 2})
+    manager.close()
+    assert [c.step for c in manager.checkpoints()] == [0, 2]
+
+
+def test_step__snapshot__is_taken_before_training_continues(storage_client):
+    release = threading.Event()
+
+    def slow_serialize(state, f):
+        release.wait()
+        f.write(repr(state).encode())
+
+    manager = CheckpointManager(
+        storage_client, "run-1", every_steps=1, serialize=slow_serialize
+    )
+    state = {"weights": [1]}
+    manager.step(0, state)
+    state["weights"].append(2)
+    release.set()
+    manager.close()
+
+    stored = storage_client.read_range("run-1/step-000000000000.ckpt", 0, 100)
+    assert stored == b"{'weights': [1]}"
+
+
+def test_wait__failed_checkpoint__raises(storage_client):
+    def failing_serialize(state, f):
+        raise OSError("disk full")
+
+    manager = CheckpointManager(
+        storage_client, "run-1", every_steps=1, serialize=failing_serialize
+    )
+    manager.step(0, {})
+
+    with pytest.raises(OSError, match="disk full"):
+        manager.wait()
+    assert manager.stats.failed == 1
+    manager.close()
@@ -0,0 +1,195 @@
+import io
+
+from unittest import mock
+
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+
+
+def test_store_fetch__reuses_one_client_and_bucket_lookup(fake_gcs, tmp_path):
+    """
+    Tests that repeated operations on one CloudStorageAPIClient
+    build the google.cloud.storage client and look up the bucket only once.
+    """
+    from google.cloud import storage
+
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME
+    )
+
+    with mock.patch.object(storage, "Client", wraps=storage.Client) as client_class:
+        for i in range(3):
+            storage_client.store(data=b"Ada Lovelace", storage_path=f"ada_{i}.txt")
+        storage_client.fetch(
+            remote_path="ada_0.txt", local_path=f"{tmp_path}/nested/ada_0.txt"
+        )
+
+    assert client_class.call_count == 1
+    assert fake_gcs.count_requests("GET", f"/storage/v1/b/{FAKE_BUCKET_NAME}") == 1
+    assert (tmp_path / "nested" / "ada_0.txt").read_bytes() == b"Ada Lovelace"
+
+
+def test_init__does_not_touch_the_network():
+    """
+    Tests that constructing the client is cheap: nothing is created until the first call.
+    """
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME, max_pool_size=32
+    )
+
+    assert storage_client.backend.max_pool_size == 32
+    assert storage_client.backend._bucket is None
+
+
+def test_store_many_fetch_many__reports_per_item_results(fake_gcs, tmp_path):
+    """
+    Tests that bulk operations move every object and report failures per item
+    instead of aborting the whole batch.
+    """
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME
+    )
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "shard_3.bin", b"already here")
+
+    report = storage_client.store_many(
+        [(f"shard {i}".encode(), f"shard_{i}.bin") for i in range(5)], max_workers=3
+    )
+
+    assert [r.path for r in report.results] == [f"shard_{i}.bin" for i in range(5)]
+    assert [r.path for r in report.failed] == ["shard_3.bin"]
+    assert report.bytes_transferred == 4 * len(b"shard 0")
+    assert report.throughput > 0
+
+    report = storage_client.fetch_many(
+        [(f"shard_{i}.bin", f"{tmp_path}/shard_{i}.bin") for i in range(5)]
+    )
+
+    assert not report.failed
+    assert (tmp_path / "shard_4.bin").read_bytes() == b"shard 4"
+    assert (tmp_path / "shard_3.bin").read_bytes() == b"already here"
+
+
+def test_store_file_stream_chunks__upload_in_resumable_chunks(fake_gcs, tmp_path):
+    """
+    Tests that the streaming variants of .store() upload the full content
+    in several resumable chunks rather than one request.
+    """
+    chunk_size = 256 * 1024
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME,
+        bucket_name=FAKE_BUCKET_NAME,
+        chunk_size=chunk_size,
+    )
+    data = bytes(range(256)) * (3 * chunk_size // 256) + b"tail"
+    local_file = tmp_path / "weights.bin"
+    local_file.write_bytes(data)
+
+    storage_client.store_chunks(
+        (data[i : i + 1000] for i in range(0, len(data), 1000)), "from_chunks.bin"
+    )
+    with open(local_file, "rb") as f:
+        storage_client.store_stream(f, "from_stream.bin")
+    storage_client.store_file(str(local_file), "from_file.bin", chunk_size=chunk_size)
+
+    for name in ["from_chunks.bin", "from_stream.bin", "from_file.bin"]:
+        assert fake_gcs.get_object(FAKE_BUCKET_NAME, name).data == data
+    # Each stream takes 4 chunks. google-cloud-storage sends files
+    # of up to 8 MiB in a single request, so from_file.bin adds none.
+    assert fake_gcs.count_requests("PUT") == 2 * 4
+
+
+def test_store_stream__short_reads__upload_everything(fake_gcs):
+    """
+    Tests that a raw stream returning less than was asked for, as sockets
+    and pipes do, is not taken to have ended.
+    """
+
+    class ShortReads(io.RawIOBase):
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return self.data.readinto(memoryview(buffer)[:1000])
+
+    chunk_size = 256 * 1024
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME,
+        bucket_name=FAKE_BUCKET_NAME,
+        chunk_size=chunk_size,
+    )
+    data = bytes(range(256)) * (3 * chunk_size // 256)
+
+    storage_client.store_stream(ShortReads(data), "short_reads.bin")
+
+    assert fake_gcs.get_object(FAKE_BUCKET_NAME, "short_reads.bin").data == data
+
+
+def test_store_chunks__existing_path__throws_clear_exception(fake_gcs):
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME
+    )
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "taken.bin", b"first")
+
+    with pytest.raises(
+        Exception, match=f"already at gs://{FAKE_BUCKET_NAME}/taken.bin"
+    ):
+        storage_client.store_chunks([b"second"], "taken.bin")
+
+
+def test_store_file_fetch__large_objects_are_split_into_parallel_parts(
+    fake_gcs, tmp_path
+):
+    """
+    Tests that files over the thresholds are uploaded as composed parts
+    and downloaded as byte ranges, and arrive intact.
+    """
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME,
+        bucket_name=FAKE_BUCKET_NAME,
+        parallel_upload_threshold=1000,
+        parallel_download_threshold=1000,
+        parallel_parts=4,
+    )
+    data = bytes(range(256)) * 40 + b"odd"
+    local_file = tmp_path / "weights.bin"
+    local_file.write_bytes(data)
+
+    storage_client.store_file(str(local_file), "weights.bin")
+
+    assert fake_gcs.get_object(FAKE_BUCKET_NAME, "weights.bin").data == data
+    assert list(fake_gcs.buckets[FAKE_BUCKET_NAME]) == ["weights.bin"]
+    assert fake_gcs.count_requests("POST", "/upload/") == 4
+
+    storage_client.fetch("weights.bin", f"{tmp_path}/fetched.bin")
+
+    assert (tmp_path / "fetched.bin").read_bytes() == data
+    assert fake_gcs.count_requests("GET", "/download/") == 4
+
+
+def test_store_file_fetch__parallel_transfers__retry_compose_and_handle_empty_files(
+    fake_gcs, tmp_path
+):
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME,
+        bucket_name=FAKE_BUCKET_NAME,
+        parallel_upload_threshold=0,
+        parallel_download_threshold=0,
+        parallel_parts=4,
+    )
+    (tmp_path / "empty.bin").write_bytes(b"")
+    (tmp_path / "weights.bin").write_bytes(b"weights" * 100)
+    fake_gcs.fail_next(method="POST", path_suffix="/compose")
+
+    storage_client.store_file(str(tmp_path / "empty.bin"), "empty.bin")
+    storage_client.store_file(str(tmp_path / "weights.bin"), "weights.bin")
+    storage_client.fetch("empty.bin", f"{tmp_path}/fetched/empty.bin")
+
+    assert fake_gcs.get_object(FAKE_BUCKET_NAME, "weights.bin").data == b"weights" * 100
+    assert fake_gcs.count_requests("POST", "/storage/v1/b/") == 2
+    assert (tmp_path / "fetched" / "empty.bin").read_bytes() == b""
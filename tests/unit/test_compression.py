@@ -0,0 +1,98 @@
+import gzip
+import os
+import tracemalloc
+
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.compression import (
+    METADATA_KEY,
+    Codec,
+    available_codecs,
+    compress_chunks,
+    decompress_file,
+    get_codec,
+)
+from mozmlops.storage_backends import InMemoryBackend
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_store_fetch__compressed__round_trips_transparently(codec, fake_gcs, tmp_path):
+    """
+    Tests that compressed objects are smaller on the server, record their codec
+    in metadata, and come back decompressed from .fetch().
+    """
+    storage_client = CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME,
+        bucket_name=FAKE_BUCKET_NAME,
+        compression=codec,
+        chunk_size=256 * 1024,
+    )
+    data = b"0123456789" * 100_000
+    (tmp_path / "predictions.txt").write_bytes(data)
+
+    storage_client.store(data=data, storage_path="from_bytes.txt")
+    storage_client.store_file(str(tmp_path / "predictions.txt"), "from_file.txt")
+
+    for name in ["from_bytes.txt", "from_file.txt"]:
+        stored = fake_gcs.get_object(FAKE_BUCKET_NAME, name)
+        assert len(stored.data) < len(data) / 10
+        assert stored.metadata == {METADATA_KEY: codec}
+
+        storage_client.fetch(name, f"{tmp_path}/fetched/{name}")
+        assert (tmp_path / "fetched" / name).read_bytes() == data
+
+
+def test_fetch__data_that_only_looks_compressed__is_left_alone(tmp_path):
+    """
+    Tests that an object that happens to be gzip data, but was stored without
+    compression, is fetched as is.
+    """
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    data = gzip.compress(b"already a gzip file")
+
+    storage_client.store(data=data, storage_path="archive.gz")
+    storage_client.fetch("archive.gz", f"{tmp_path}/archive.gz")
+
+    assert (tmp_path / "archive.gz").read_bytes() == data
+
+
+def test_init__unknown_codec__fails_early():
+    with pytest.raises(ValueError, match="Unknown compression"):
+        CloudStorageAPIClient(backend=InMemoryBackend(), compression="zip")
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_decompress_file__expanding_data__stays_in_bounded_memory(codec, tmp_path):
+    data = b"\0" * 64_000_000
+    compressed = b"".join(compress_chunks([data], get_codec(codec)))
+    (tmp_path / "zeros.compressed").write_bytes(compressed)
+    del data
+
+    tracemalloc.start()
+    try:
+        decompress_file(
+            str(tmp_path / "zeros.compressed"),
+            str(tmp_path / "zeros"),
+            get_codec(codec),
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert os.path.getsize(tmp_path / "zeros") == 64_000_000
+    assert peak < 8_000_000
+
+
+def test_codec__missing_methods__cannot_be_instantiated():
+    class Incomplete(Codec):
+        name = "incomplete"
+        magic = b"??"
+
+        def compressor(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,70 @@
+import pytest
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend, ObjectAlreadyExistsError
+
+
+class CountingBackend(InMemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.uploads = 0
+
+    def upload(self, *args, **kwargs):
+        self.uploads += 1
+        return super().upload(*args, **kwargs)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_store__skip_if_identical__uploads_only_changed_content(compression):
+    backend = CountingBackend()
+    storage_client = CloudStorageAPIClient(backend=backend, compression=compression)
+
+    storage_client.store(b"weights v1", "model.pth", skip_if_identical=True)
+    storage_client.store(b"weights v1", "model.pth", skip_if_identical=True)
+
+    assert backend.uploads == 1
+    with pytest.raises(ObjectAlreadyExistsError):
+        storage_client.store(b"weights v2", "model.pth", skip_if_identical=True)
+
+
+def test_store_file__skip_if_identical__recognizes_objects_stored_without_it(tmp_path):
+    backend = CountingBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    (tmp_path / "model.pth").write_bytes(b"weights")
+
+    storage_client.store(b"weights", "model.pth")
+    storage_client.store_file(
+        str(tmp_path / "model.pth"), "model.pth", skip_if_identical=True
+    )
+
+    assert backend.uploads == 1
+
+
+def test_store_content_addressed__rerun_uploads_only_new_content(tmp_path):
+    backend = CountingBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    for name, content in [("a.bin", b"same"), ("b.bin", b"same"), ("c.bin", b"c")]:
+        (tmp_path / name).write_bytes(content)
+    files = {name: str(tmp_path / name) for name in ["a.bin", "b.bin", "c.bin"]}
+
+    manifest = storage_client.store_content_addressed(
+        files, "flow/cas", manifest_path="flow/run-1/manifest.json"
+    )
+
+    assert manifest["files"]["a.bin"]["path"] == manifest["files"]["b.bin"]["path"]
+    assert backend.uploads == 3  # two distinct contents and the manifest
+
+    (tmp_path / "c.bin").write_bytes(b"c changed")
+    storage_client.store_content_addressed(
+        files, "flow/cas", manifest_path="flow/run-2/manifest.json"
+    )
+
+    assert backend.uploads == 5  # one changed content and the new manifest
+
+    report = storage_client.fetch_manifest(
+        "flow/run-2/manifest.json", str(tmp_path / "restored")
+    )
+
+    assert not report.failed
+    assert (tmp_path / "restored" / "b.bin").read_bytes() == b"same"
+    assert (tmp_path / "restored" / "c.bin").read_bytes() == b"c changed"
@@ -0,0 +1,113 @@
+import io
+import os
+
+import pytest
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    directory = tmp_path / "checkpoint"
+    (directory / "shards").mkdir(parents=True)
+    (directory / "config.json").write_bytes(b'{"layers": 12}')
+    (directory / "shards" / "0.bin").write_bytes(b"0" * 1000)
+    (directory / "shards" / "1.bin").write_bytes(b"1" * 1000)
+    return directory
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_upload_dir__transfers_only_differences(checkpoint, compression):
+    backend = InMemoryBackend()
+    storage_client = CloudStorageAPIClient(backend=backend, compression=compression)
+
+    first = storage_client.upload_dir(str(checkpoint), "runs/7")
+    (checkpoint / "shards" / "1.bin").write_bytes(b"2" * 1000)
+    (checkpoint / "shards" / "2.bin").write_bytes(b"3" * 10)
+    second = storage_client.upload_dir(str(checkpoint), "runs/7")
+
+    assert sorted(first.to_transfer) == ["config.json", "shards/0.bin", "shards/1.bin"]
+    assert first.transfer.failed == []
+    assert sorted(second.to_transfer) == ["shards/1.bin", "shards/2.bin"]
+    assert sorted(second.unchanged) == ["config.json", "shards/0.bin"]
+    assert second.bytes_to_transfer == 1010
+    assert second.transfer.failed == []
+
+
+def test_upload_dir__dry_run_and_delete(checkpoint):
+    backend = InMemoryBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    storage_client.store(b"stale", "runs/7/old.bin")
+
+    dry_run = storage_client.upload_dir(
+        str(checkpoint), "runs/7/", delete=True, dry_run=True
+    )
+
+    assert dry_run.bytes_to_transfer == 2014
+    assert dry_run.to_delete == ["old.bin"]
+    assert dry_run.transfer is None
+    assert [info.path for info in backend.list_objects()] == ["runs/7/old.bin"]
+
+    storage_client.upload_dir(str(checkpoint), "runs/7", delete=True)
+
+    assert [info.path for info in backend.list_objects()] == [
+        "runs/7/config.json",
+        "runs/7/shards/0.bin",
+        "runs/7/shards/1.bin",
+    ]
+
+
+@pytest.mark.parametrize("checksum", [True, False])
+def test_download_dir__mirrors_and_then_skips(checkpoint, tmp_path, checksum):
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    storage_client.upload_dir(str(checkpoint), "runs/7")
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "extra.txt").write_bytes(b"extra")
+
+    first = storage_client.download_dir(
+        "runs/7", str(mirror), delete=True, checksum=checksum
+    )
+    second = storage_client.download_dir("runs/7", str(mirror), checksum=checksum)
+
+    assert len(first.to_transfer) == 3
+    assert first.to_delete == ["extra.txt"]
+    assert not (mirror / "extra.txt").exists()
+    assert (mirror / "shards" / "1.bin").read_bytes() == b"1" * 1000
+    assert second.to_transfer == []
+    assert len(second.unchanged) == 3
+
+
+def test_upload_dir__without_checksum__uses_size_and_mtime(checkpoint):
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    storage_client.upload_dir(str(checkpoint), "runs/7", checksum=False)
+
+    config = checkpoint / "config.json"
+    config.write_bytes(b'{"layers": 24}')
+    # Same size, but modified after it was uploaded.
+    future = config.stat().st_mtime + 60
+    os.utime(config, (future, future))
+    report = storage_client.upload_dir(str(checkpoint), "runs/7", checksum=False)
+
+    assert report.to_transfer == ["config.json"]
+
+
+def test_download_dir__object_names_escaping_the_directory__are_refused(tmp_path):
+    backend = InMemoryBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    storage_client.store(b"fine", "runs/7/model.bin")
+    for name in ["runs/7/../escaped.bin", "runs/7//absolute.bin"]:
+        backend.upload(io.BytesIO(b"evil"), name)
+    mirror = tmp_path / "mirror"
+
+    report = storage_client.download_dir("runs/7", str(mirror))
+
+    assert (mirror / "model.bin").read_bytes() == b"fine"
+    assert [result.path for result in report.transfer.failed] == [
+        "runs/7/../escaped.bin"
+    ]
+    assert isinstance(report.transfer.failed[0].error, ValueError)
+    assert sorted(os.listdir(tmp_path)) == ["mirror"]
+    # A leading "/" stays under the directory.
+    assert (mirror / "absolute.bin").read_bytes() == b"evil"
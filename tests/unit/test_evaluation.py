@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from mozmlops.evaluation import (
+    ClassificationMetrics,
+    batched,
+    evaluate,
+    evaluate_parallel,
+    merge_metrics,
+)
+
+NUM_CLASSES = 5
+
+
+def _dataset(size: int = 1000, seed: int = 0):
+    generator = np.random.default_rng(seed)
+    logits = generator.normal(size=(size, NUM_CLASSES))
+    labels = generator.integers(0, NUM_CLASSES, size=size)
+    # Make the model right more often than chance.
+    logits[np.arange(size), labels] += generator.uniform(0, 2, size=size)
+    return logits, labels
+
+
+def _evaluate_shard(shard: int, shards: int) -> ClassificationMetrics:
+    logits, labels = _dataset()
+    samples = list(zip(logits, labels))[shard::shards]
+    return evaluate(batched(samples, 64), lambda inputs: inputs, NUM_CLASSES)
+
+
+def test_update__matches_a_direct_computation():
+    logits, labels = _dataset()
+    probabilities = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+    metrics = ClassificationMetrics(NUM_CLASSES, top_k=(1, 2), calibration_bins=10)
+    for start in range(0, len(labels), 128):
+        metrics.update(logits[start : start + 128], labels[start : start + 128])
+    result = metrics.result()
+
+    predictions = probabilities.argmax(axis=1)
+    top_2 = np.argsort(-probabilities, axis=1)[:, :2]
+    confidence = probabilities.max(axis=1)
+    bins = np.minimum((confidence * 10).astype(int), 9)
+    expected_ece = sum(
+        abs(
+            (predictions[bins == b] == labels[bins == b]).sum()
+            - confidence[bins == b].sum()
+        )
+        for b in range(10)
+    ) / len(labels)
+
+    assert result["count"] == 1000
+    assert result["accuracy"] == pytest.approx((predictions == labels).mean())
+    assert result["top_1_accuracy"] == pytest.approx(result["accuracy"])
+    assert result["top_2_accuracy"] == pytest.approx(
+        (top_2 == labels[:, None]).any(axis=1).mean()
+    )
+    assert result["expected_calibration_error"] == pytest.approx(expected_ece)
+    assert result["recall"][0] == pytest.approx((predictions[labels == 0] == 0).mean())
+    assert result["precision"][0] == pytest.approx(
+        (labels[predictions == 0] == 0).mean()
+    )
+
+
+def test_merge__shards_add_up_to_the_whole():
+    logits, labels = _dataset()
+    whole = evaluate([(logits, labels)], lambda inputs: inputs, NUM_CLASSES)
+
+    merged = merge_metrics(_evaluate_shard(shard, 4) for shard in range(4))
+    in_processes = evaluate_parallel(_evaluate_shard, shards=3, max_workers=2)
+
+    for metrics in (merged, in_processes):
+        np.testing.assert_array_equal(metrics.confusion, whole.confusion)
+        assert metrics.result() == pytest.approx(whole.result())
+
+
+def test_merge__different_settings__raises_value_error():
+    with pytest.raises(ValueError, match="different settings"):
+        ClassificationMetrics(NUM_CLASSES).merge(ClassificationMetrics(NUM_CLASSES + 1))
+    with pytest.raises(ValueError, match="shape"):
+        ClassificationMetrics(NUM_CLASSES).update(np.zeros((2, 3)), [0, 1])
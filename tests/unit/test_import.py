@@ -0,0 +1,75 @@
+import json
+import statistics
+import subprocess
+import sys
+
+# Cold import of the client, in seconds. It takes well under 0.1s on a
+# laptop; the budget leaves room for slow CI machines, not for the Google SDK.
+IMPORT_TIME_BUDGET = 0.5
+
+IMPORT_AND_REPORT = """
+import json, logging, sys, time
+start = time.perf_counter()
+import mozmlops.cloud_storage_api_client
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "seconds": seconds,
+    "modules": sorted(sys.modules),
+    "root_handlers": len(logging.getLogger().handlers),
+    "root_level": logging.getLogger().level,
+}))
+"""
+
+
+# Logs a message from every branch of an upload.
+USE_AND_REPORT = """
+import json, logging
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend
+client = CloudStorageAPIClient(backend=InMemoryBackend())
+client.store(b"weights", "model.pth", skip_if_identical=True)
+client.store(b"weights", "model.pth", skip_if_identical=True)
+print(json.dumps({"root_handlers": len(logging.getLogger().handlers)}))
+"""
+
+
+def _import_in_fresh_interpreter(script: str = IMPORT_AND_REPORT) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_import__does_not_configure_logging():
+    report = _import_in_fresh_interpreter()
+
+    assert report["root_handlers"] == 0
+    assert report["root_level"] == 30  # logging.WARNING, the default
+
+
+def test_client__logs_without_configuring_logging():
+    report = _import_in_fresh_interpreter(USE_AND_REPORT)
+
+    assert report["root_handlers"] == 0
+
+
+def test_import__does_not_import_heavy_dependencies():
+    report = _import_in_fresh_interpreter()
+
+    heavy = [
+        module
+        for module in report["modules"]
+        if module.split(".")[0] in ("google", "requests", "numpy", "metaflow", "wandb")
+    ]
+    assert heavy == []
+
+
+def test_import__stays_within_time_budget():
+    seconds = statistics.median(
+        _import_in_fresh_interpreter()["seconds"] for _ in range(3)
+    )
+
+    assert seconds < IMPORT_TIME_BUDGET
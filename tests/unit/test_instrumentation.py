@@ -0,0 +1,72 @@
+import pytest
+
+from google.api_core.exceptions import NotFound
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.instrumentation import Instrumentation, Measurement
+
+
+def test_client__records_phases_bytes_and_errors(fake_gcs, tmp_path):
+    measurements = []
+    instrumentation = Instrumentation(callbacks=[measurements.append])
+    storage_client = CloudStorageAPIClient(
+        FAKE_PROJECT_NAME,
+        FAKE_BUCKET_NAME,
+        compression="gzip",
+        instrumentation=instrumentation,
+    )
+
+    storage_client.store(b"weights" * 1000, "model.pth", skip_if_identical=True)
+    storage_client.fetch("model.pth", str(tmp_path / "model.pth"))
+    with pytest.raises(NotFound):
+        storage_client.fetch("missing.pth", str(tmp_path / "missing.pth"))
+
+    phases = {(m.operation, m.phase) for m in measurements}
+    assert phases == {
+        ("client", "setup"),
+        ("store", "checksum"),
+        ("store", "metadata"),
+        ("store", "transfer"),
+        ("fetch", "transfer"),
+        ("fetch", "metadata"),
+        ("fetch", "local_write"),
+    }
+    summary = instrumentation.summary()
+    assert summary["client/setup/count"] == 1
+    assert summary["fetch/transfer/count"] == 2
+    assert summary["fetch/transfer/errors"] == 1
+    assert summary["fetch/local_write/bytes"] == len(b"weights" * 1000)
+    # Compressed on the wire.
+    assert 0 < summary["store/transfer/bytes"] < len(b"weights" * 1000)
+
+
+def test_to_prometheus__exposes_histograms_and_counters():
+    instrumentation = Instrumentation(buckets=[0.1, 1.0, float("inf")])
+    instrumentation.record(Measurement("fetch", "transfer", seconds=0.05, bytes=10))
+    instrumentation.record(Measurement("fetch", "transfer", seconds=0.5, bytes=30))
+    instrumentation.record(
+        Measurement("fetch", "transfer", seconds=5.0, error="NotFound")
+    )
+
+    text = instrumentation.to_prometheus()
+
+    labels = 'operation="fetch",phase="transfer"'
+    assert f'mozmlops_storage_seconds_bucket{{{labels},le="0.1"}} 1' in text
+    assert f'mozmlops_storage_seconds_bucket{{{labels},le="1.0"}} 2' in text
+    assert f'mozmlops_storage_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"mozmlops_storage_seconds_count{{{labels}}} 3" in text
+    assert f"mozmlops_storage_bytes_total{{{labels}}} 40" in text
+    assert f'mozmlops_storage_errors_total{{{labels},error="NotFound"}} 1' in text
+
+
+def test_summary__estimates_quantiles_from_buckets():
+    instrumentation = Instrumentation(buckets=[1.0, 2.0, float("inf")])
+    for seconds in [0.5] * 50 + [1.5] * 50:
+        instrumentation.record(Measurement("store", "transfer", seconds=seconds))
+
+    summary = instrumentation.summary()
+
+    assert summary["store/transfer/p50_seconds"] == pytest.approx(1.0)
+    assert summary["store/transfer/p95_seconds"] == pytest.approx(1.9)
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.metadata_index import MetadataIndex
+from mozmlops.storage_backends import (
+    GCSBackend,
+    InMemoryBackend,
+    LocalFilesystemBackend,
+)
+
+PATHS = [
+    "flow/run-1/model.pth",
+    "flow/run-1/metrics.json",
+    "flow/run-2/model.pth",
+    "flow/README.md",
+    "other/model.pth",
+]
+
+
+@pytest.fixture(params=["gcs", "local", "memory"])
+def storage_client(request, tmp_path):
+    if request.param == "gcs":
+        request.getfixturevalue("fake_gcs")
+        backend = GCSBackend(FAKE_PROJECT_NAME, FAKE_BUCKET_NAME)
+    elif request.param == "local":
+        backend = LocalFilesystemBackend(str(tmp_path / "bucket"))
+    else:
+        backend = InMemoryBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    for path in PATHS:
+        storage_client.store(path.encode(), path)
+    return storage_client
+
+
+def test_list__with_delimiter__groups_subdirectories(storage_client):
+    entries = list(storage_client.list("flow/", delimiter="/"))
+
+    assert [e.path for e in entries if not isinstance(e, str)] == ["flow/README.md"]
+    assert sorted(e for e in entries if isinstance(e, str)) == [
+        "flow/run-1/",
+        "flow/run-2/",
+    ]
+    assert sorted(info.path for info in storage_client.list("flow/run-1/")) == [
+        "flow/run-1/metrics.json",
+        "flow/run-1/model.pth",
+    ]
+
+
+def test_list__pages_lazily(fake_gcs):
+    storage_client = CloudStorageAPIClient(FAKE_PROJECT_NAME, FAKE_BUCKET_NAME)
+    for path in PATHS:
+        storage_client.store(path.encode(), path)
+    before = fake_gcs.count_requests("GET", f"/storage/v1/b/{FAKE_BUCKET_NAME}/o")
+
+    entries = storage_client.list(page_size=2)
+    first = next(entries)
+    after_first = fake_gcs.count_requests("GET", f"/storage/v1/b/{FAKE_BUCKET_NAME}/o")
+    rest = list(entries)
+    after_all = fake_gcs.count_requests("GET", f"/storage/v1/b/{FAKE_BUCKET_NAME}/o")
+
+    assert sorted([first.path] + [info.path for info in rest]) == sorted(PATHS)
+    assert after_first - before == 1
+    assert after_all - before == 3
+
+
+def test_metadata_index__refreshes_incrementally(tmp_path):
+    backend = InMemoryBackend()
+    storage_client = CloudStorageAPIClient(backend=backend)
+    for path in PATHS:
+        storage_client.store(path.encode(), path)
+    index = MetadataIndex(backend, str(tmp_path / "index.sqlite"))
+
+    first = index.refresh("flow/")
+    storage_client.store(b"newer", "flow/run-2/model-2.pth")
+    storage_client._CloudStorageAPIClient__delete("flow/README.md")
+    second = index.refresh("flow/")
+
+    assert (first.added, first.unchanged) == (4, 0)
+    assert (second.added, second.removed, second.unchanged) == (1, 1, 3)
+    assert index.refresh("flow/", max_age=60).skipped
+    assert index.get("other/model.pth") is None
+    assert index.children("flow/") == ["flow/run-1/", "flow/run-2/"]
+    assert index.latest("flow/", pattern="*.pth").path == "flow/run-2/model-2.pth"
+    assert [info.path for info in index.objects("flow/run-1/")] == [
+        "flow/run-1/metrics.json",
+        "flow/run-1/model.pth",
+    ]
+
+    # The index persists across instances.
+    index.close()
+    reopened = MetadataIndex(backend, str(tmp_path / "index.sqlite"))
+    assert reopened.get("flow/run-2/model-2.pth").size == len(b"newer")
+    assert time.time() - reopened.get("flow/run-2/model.pth").updated.timestamp() < 60
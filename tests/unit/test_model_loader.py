@@ -0,0 +1,126 @@
+import io
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.instrumentation import Instrumentation
+from mozmlops.model_loader import ModelLoader, map_file
+from mozmlops.storage_backends import InMemoryBackend
+
+
+@pytest.fixture
+def storage_client(fake_gcs):
+    return CloudStorageAPIClient(FAKE_PROJECT_NAME, FAKE_BUCKET_NAME)
+
+
+def test_load__replicas_on_a_node__download_once(fake_gcs, storage_client, tmp_path):
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "run-1/model.bin", b"weights")
+    replicas = [ModelLoader(storage_client, str(tmp_path)) for _ in range(4)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        loaded = list(
+            executor.map(
+                lambda loader: loader.load("run-1/model.bin", map_file), replicas
+            )
+        )
+
+    assert [bytes(model.model) for model in loaded] == [b"weights"] * 4
+    assert fake_gcs.count_requests("GET", "/download/") == 1
+    assert sum(not model.cache_hit for model in loaded) == 1
+    assert os.path.basename(loaded[0].local_path) == "model.bin"
+
+
+def test_load__directory__keeps_its_layout(fake_gcs, storage_client, tmp_path):
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "run-1/t5/config.json", b"{}")
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "run-1/t5/weights/part-0", b"weights")
+    loader = ModelLoader(storage_client, str(tmp_path))
+
+    first = loader.load("run-1/t5/", lambda directory: sorted(os.listdir(directory)))
+    second = loader.load("run-1/t5/")
+
+    assert first.model == ["config.json", "weights"]
+    assert not first.cache_hit and second.cache_hit
+    assert second.model == first.local_path
+    with open(os.path.join(second.model, "weights", "part-0"), "rb") as f:
+        assert f.read() == b"weights"
+    assert first.bytes == 9
+    assert fake_gcs.count_requests("GET", "/download/") == 2
+
+
+def test_load__new_generation__is_fetched_and_pinned_generations_fail(tmp_path):
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    storage_client.store(b"version 1", "model.bin")
+    loader = ModelLoader(storage_client, str(tmp_path))
+    first = loader.load("model.bin", map_file)
+
+    info = storage_client.backend.stat("model.bin")
+    storage_client.backend.upload(
+        io.BytesIO(b"version 2"),
+        "model.bin",
+        if_generation_match=info.generation,
+    )
+    second = loader.load("model.bin", map_file)
+
+    assert bytes(first.model) == b"version 1"
+    assert bytes(second.model) == b"version 2"
+    assert not second.cache_hit
+    with pytest.raises(FileNotFoundError):
+        loader.load("model.bin", generation=info.generation)
+
+
+def test_load__compressed_model__is_cached_decompressed(tmp_path):
+    storage_client = CloudStorageAPIClient(
+        backend=InMemoryBackend(), compression="gzip"
+    )
+    storage_client.store(b"weights" * 100, "model.bin")
+
+    loaded = ModelLoader(storage_client, str(tmp_path)).load("model.bin", map_file)
+
+    assert bytes(loaded.model) == b"weights" * 100
+
+
+def test_load__with_instrumentation__records_fetch_and_load(tmp_path):
+    instrumentation = Instrumentation()
+    storage_client = CloudStorageAPIClient(
+        backend=InMemoryBackend(), instrumentation=instrumentation
+    )
+    storage_client.store(b"weights", "model.bin")
+
+    ModelLoader(storage_client, str(tmp_path)).load("model.bin", map_file)
+
+    summary = instrumentation.summary()
+    assert summary["load_model/fetch/count"] == 1
+    assert summary["load_model/fetch/bytes"] == 7
+    assert summary["load_model/load/count"] == 1
+
+
+def test_load__missing_model__raises(tmp_path):
+    loader = ModelLoader(
+        CloudStorageAPIClient(backend=InMemoryBackend()), str(tmp_path)
+    )
+
+    with pytest.raises(FileNotFoundError):
+        loader.load("missing.bin")
+    with pytest.raises(FileNotFoundError):
+        loader.load("missing/")
+
+
+def test_load__over_max_bytes__evicts_least_recently_loaded_models(tmp_path):
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    for name in "abc":
+        storage_client.store(name.encode() * 9, f"{name}/model.bin")
+    loader = ModelLoader(storage_client, str(tmp_path), max_bytes=20)
+
+    first = loader.load("a/model.bin")
+    second = loader.load("b/model.bin")
+    assert loader.load("a/model.bin").cache_hit
+    third = loader.load("c/model.bin")
+
+    assert os.path.exists(first.local_path) and os.path.exists(third.local_path)
+    assert not os.path.exists(second.local_path)
+    assert not loader.load("b/model.bin").cache_hit
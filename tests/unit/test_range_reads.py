@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+
+
+@pytest.fixture
+def storage_client(fake_gcs):
+    from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+    return CloudStorageAPIClient(
+        project_name=FAKE_PROJECT_NAME, bucket_name=FAKE_BUCKET_NAME
+    )
+
+
+def test_read_range__reads_only_the_requested_bytes(storage_client):
+    storage_client.store(data=bytes(range(100)), storage_path="table.bin")
+
+    assert storage_client.read_range("table.bin", 10, 5) == bytes(range(10, 15))
+    assert storage_client.read_range("table.bin", 95, 50) == bytes(range(95, 100))
+    assert storage_client.read_ranges("table.bin", [(90, 2), (0, 3)]) == [
+        bytes([90, 91]),
+        bytes([0, 1, 2]),
+    ]
+
+
+def test_read_range_into__fills_a_numpy_array(storage_client):
+    embeddings = np.arange(64, dtype=np.float32).reshape(16, 4)
+    storage_client.store(data=embeddings.tobytes(), storage_path="embeddings.bin")
+
+    row = np.empty(4, dtype=np.float32)
+    n = storage_client.read_range_into("embeddings.bin", 3 * row.nbytes, row)
+
+    assert n == row.nbytes
+    np.testing.assert_array_equal(row, embeddings[3])
+
+
+def test_fetch_mmap__returns_read_only_views(storage_client, tmp_path):
+    embeddings = np.arange(64, dtype=np.float32).reshape(16, 4)
+    storage_client.store(data=embeddings.tobytes(), storage_path="embeddings.bin")
+
+    view = storage_client.fetch_mmap("embeddings.bin", f"{tmp_path}/raw.bin")
+    array = storage_client.fetch_mmap(
+        "embeddings.bin", f"{tmp_path}/array.bin", dtype=np.float32, shape=(16, 4)
+    )
+
+    assert view.readonly and bytes(view) == embeddings.tobytes()
+    assert not array.flags.writeable
+    np.testing.assert_array_equal(array, embeddings)
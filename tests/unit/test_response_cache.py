@@ -0,0 +1,183 @@
+import asyncio
+import threading
+
+import pytest
+
+from mozmlops.response_cache import RedisTier, ResponseCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.threads.add(threading.get_ident())
+        self.values[key] = value
+
+
+def test_get__normalized_request__hits():
+    cache = ResponseCache(model_version="t5-small#1")
+    cache.put("Hello   world ", "Bonjour le monde")
+
+    assert cache.get(" Hello world") == "Bonjour le monde"
+    assert cache.get("hello world") is None
+    assert ResponseCache(model_version="t5-small#2").get("Hello world") is None
+    assert cache.metrics()["hit_rate"] == 0.5
+
+
+def test_put__over_limits__evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    assert cache.evictions == 1
+
+    small = ResponseCache(max_bytes=10)
+    small.put("a", "12345")
+    small.put("b", "123456")
+
+    assert (small.get("a"), small.get("b")) == (None, "123456")
+
+
+def test_get__expired_response__misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("mozmlops.response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(ttl_s=60)
+    cache.put("a", "1")
+
+    now[0] += 59
+    assert cache.get("a") == "1"
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+def test_get__shared_tier__serves_other_replicas():
+    redis = FakeRedis()
+    replica_1 = ResponseCache(shared=RedisTier(redis))
+    replica_2 = ResponseCache(shared=RedisTier(redis))
+
+    replica_1.put("a", {"translation": "1"})
+
+    assert replica_2.get("a") == {"translation": "1"}
+    assert replica_2.get("a") == {"translation": "1"}
+    assert (replica_2.shared_hits, replica_2.hits) == (1, 1)
+
+
+def test_get_or_compute__hits_and_identical_requests__skip_compute():
+    calls = []
+
+    async def translate(text):
+        calls.append(text)
+        await asyncio.sleep(0.01)
+        return text.upper()
+
+    cache = ResponseCache()
+
+    async def main():
+        concurrent = await asyncio.gather(
+            *(cache.get_or_compute(text, translate) for text in ["a", "a", "b"])
+        )
+        later = await cache.get_or_compute("a ", translate)
+        return concurrent, later
+
+    concurrent, later = asyncio.run(main())
+
+    assert concurrent == ["A", "A", "B"]
+    assert later == "A"
+    assert calls == ["a", "b"]
+    assert (cache.misses, cache.coalesced, cache.hits) == (2, 1, 1)
+
+
+def test_shared_tier__stores_json_and_ignores_what_it_cannot_decode():
+    redis = FakeRedis()
+    cache = ResponseCache(shared=RedisTier(redis))
+    cache.put("a", {"translation": "1"})
+    cache.put("b", object())
+
+    assert list(redis.values.values()) == [b'{"translation": "1"}']
+
+    redis.values["mozmlops:responses:" + cache.key("c")] = b"\x80\x04not json"
+    assert cache.get("c") is None
+
+
+def test_get_or_compute__shared_tier__runs_off_the_event_loop():
+    redis = FakeRedis()
+    ResponseCache(shared=RedisTier(redis)).put("a", "A")
+
+    async def translate(text):
+        return text.upper()
+
+    async def main():
+        cache = ResponseCache(shared=RedisTier(redis))
+        return [await cache.get_or_compute(text, translate) for text in "ab"]
+
+    redis.threads.clear()
+    assert asyncio.run(main()) == ["A", "B"]
+    assert redis.values["mozmlops:responses:" + ResponseCache().key("b")] == b'"B"'
+    assert threading.get_ident() not in redis.threads
+
+
+def test_get_or_compute__first_request_cancelled__others_still_get_the_result():
+    calls = []
+
+    async def translate(text):
+        calls.append(text)
+        await asyncio.sleep(0.02)
+        return text.upper()
+
+    async def main():
+        cache = ResponseCache()
+        first = asyncio.ensure_future(cache.get_or_compute("a", translate))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_compute("a", translate))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, cache.get("a")
+
+    assert asyncio.run(main()) == ("A", "A")
+    assert calls == ["a"]
+
+
+def test_get_or_compute__after_last_waiter_cancelled__computes_again():
+    calls = []
+
+    async def translate(text):
+        calls.append(text)
+        await asyncio.sleep(0.01)
+        return text.upper()
+
+    async def main():
+        cache = ResponseCache()
+        first = asyncio.ensure_future(cache.get_or_compute("a", translate))
+        await asyncio.sleep(0.001)
+        first.cancel()
+        # Arrives before the cancelled computation has finished unwinding
+        second = asyncio.ensure_future(cache.get_or_compute("a", translate))
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, cache.get("a")
+
+    assert asyncio.run(main()) == ("A", "A")
+    assert calls == ["a", "a"]
+
+
+def test_key__canonical_json__ignores_dict_order():
+    cache = ResponseCache(model_version="v1")
+
+    assert cache.key({"text": "a", "lang": "fr"}) == cache.key(
+        {"lang": "fr", "text": "a"}
+    )
+    assert cache.key({"text": "a"}) != ResponseCache(model_version="v2").key(
+        {"text": "a"}
+    )
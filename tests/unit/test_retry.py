@@ -0,0 +1,95 @@
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.retry import RetryPolicy
+
+FAST_RETRY = RetryPolicy(initial_delay=0.001, max_delay=0.01)
+CHUNK_SIZE = 256 * 1024
+
+
+@pytest.fixture
+def storage_client(fake_gcs):
+    return CloudStorageAPIClient(
+        FAKE_PROJECT_NAME, FAKE_BUCKET_NAME, chunk_size=CHUNK_SIZE, retry=FAST_RETRY
+    )
+
+
+def test_retry_policy__delay__grows_exponentially_up_to_a_cap():
+    policy = RetryPolicy(initial_delay=1, max_delay=4, jitter=False)
+    jittered = RetryPolicy(initial_delay=1, max_delay=4)
+
+    assert [policy.delay(n) for n in range(1, 6)] == [1, 2, 4, 4, 4]
+    assert all(0 <= jittered.delay(3) <= 4 for _ in range(100))
+
+
+def test_store__transient_errors__are_retried(fake_gcs, storage_client):
+    fake_gcs.fail_next(count=2, status=503, method="POST")
+
+    storage_client.store(b"weights", "model.pth")
+
+    assert fake_gcs.get_object(FAKE_BUCKET_NAME, "model.pth").data == b"weights"
+    assert storage_client.transfer_stats.retries == 2
+    assert storage_client.transfer_stats.bytes_resent == 2 * len(b"weights")
+
+
+def test_store__persistent_errors__give_up(fake_gcs):
+    storage_client = CloudStorageAPIClient(
+        FAKE_PROJECT_NAME,
+        FAKE_BUCKET_NAME,
+        retry=RetryPolicy(max_attempts=2, initial_delay=0.001),
+    )
+    fake_gcs.fail_next(count=2, status=429, method="POST")
+
+    with pytest.raises(Exception, match="429"):
+        storage_client.store(b"weights", "model.pth")
+    assert storage_client.transfer_stats.retries == 1
+
+
+def test_store_chunks__interrupted_upload__resumes_from_confirmed_offset(
+    fake_gcs, storage_client
+):
+    data = bytes(range(256)) * 4 * 1024  # four chunks
+    fake_gcs.interrupt_next("PUT", after_bytes=100_000)
+
+    storage_client.store_chunks(iter([data]), "model.pth")
+
+    assert fake_gcs.get_object(FAKE_BUCKET_NAME, "model.pth").data == data
+    assert storage_client.transfer_stats.retries == 1
+    # Only the part of the first chunk that GCS did not keep was sent again.
+    assert storage_client.transfer_stats.bytes_resent == CHUNK_SIZE - 100_000
+
+
+def test_fetch__dropped_connection__resumes_from_last_byte(
+    fake_gcs, storage_client, tmp_path
+):
+    data = bytes(range(256)) * 4 * 1024
+    fake_gcs.put_object(FAKE_BUCKET_NAME, "model.pth", data)
+    fake_gcs.interrupt_next("GET", after_bytes=300_000)
+
+    storage_client.fetch("model.pth", str(tmp_path / "model.pth"))
+
+    assert (tmp_path / "model.pth").read_bytes() == data
+    assert storage_client.transfer_stats.retries == 1
+    assert storage_client.transfer_stats.bytes_resent == 0
+
+
+def test_fetch__missing_object__fails_without_retrying(storage_client, tmp_path):
+    with pytest.raises(Exception, match="No such object"):
+        storage_client.fetch("missing.pth", str(tmp_path / "missing.pth"))
+
+    assert storage_client.transfer_stats.retries == 0
+    assert not (tmp_path / "missing.pth").exists()
+
+
+def test_store_many__reports_retries_per_object(fake_gcs, storage_client):
+    fake_gcs.fail_next(count=1, status=503, method="POST")
+
+    report = storage_client.store_many(
+        [(b"a", "a.bin"), (b"b", "b.bin")], max_workers=1
+    )
+
+    assert report.failed == []
+    assert [result.retries for result in report.results] == [1, 0]
+    assert report.retries == 1
@@ -0,0 +1,131 @@
+import io
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import FAKE_BUCKET_NAME, FAKE_PROJECT_NAME
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import (
+    GCSBackend,
+    InMemoryBackend,
+    LocalFilesystemBackend,
+    ObjectAlreadyExistsError,
+)
+
+
+@pytest.fixture(params=["gcs", "local", "memory"])
+def backend(request, tmp_path):
+    """
+    Each backend in turn, so that every test here checks that all of them
+    honor the same contract.
+    """
+    if request.param == "gcs":
+        request.getfixturevalue("fake_gcs")
+        return GCSBackend(FAKE_PROJECT_NAME, FAKE_BUCKET_NAME)
+    if request.param == "local":
+        return LocalFilesystemBackend(str(tmp_path / "bucket"))
+    return InMemoryBackend()
+
+
+def test_store_fetch__round_trip(backend, tmp_path):
+    storage_client = CloudStorageAPIClient(backend=backend, chunk_size=256 * 1024)
+    data = b"Katherine Johnson" * 100_000
+
+    storage_client.store(data=data, storage_path="a/b/johnson.txt")
+    storage_client.store_chunks(iter([data, data]), storage_path="a/b/twice.txt")
+    storage_client.fetch("a/b/johnson.txt", f"{tmp_path}/johnson.txt")
+    storage_client.fetch("a/b/twice.txt", f"{tmp_path}/twice.txt")
+
+    assert (tmp_path / "johnson.txt").read_bytes() == data
+    assert (tmp_path / "twice.txt").read_bytes() == data + data
+
+    info = backend.stat("a/b/johnson.txt")
+    assert info.size == len(data)
+    assert info.crc32c is not None
+    assert backend.stat("a/b/missing.txt") is None
+
+
+def test_store__existing_path__throws_already_exists(backend):
+    storage_client = CloudStorageAPIClient(backend=backend)
+    storage_client.store(data=b"first", storage_path="taken.txt")
+
+    with pytest.raises(ObjectAlreadyExistsError):
+        storage_client.store(data=b"second", storage_path="taken.txt")
+
+
+def test_fetch__after_delete__throws_not_found(backend, tmp_path):
+    storage_client = CloudStorageAPIClient(backend=backend)
+    storage_client.store(data=b"gone soon", storage_path="gone.txt")
+
+    storage_client._CloudStorageAPIClient__delete("gone.txt")
+
+    with pytest.raises(Exception, match="No such object"):
+        storage_client.fetch("gone.txt", f"{tmp_path}/gone.txt")
+
+
+def test_list_objects__lists_under_prefix(backend):
+    storage_client = CloudStorageAPIClient(backend=backend)
+    for path in ["run/b.txt", "run/sub/a.txt", "runs.txt"]:
+        storage_client.store(data=path.encode(), storage_path=path)
+
+    listed = list(backend.list_objects("run/"))
+
+    assert [info.path for info in listed] == ["run/b.txt", "run/sub/a.txt"]
+    assert listed[0].size == len(b"run/b.txt")
+
+
+def test_upload__if_generation_match__replaces_only_that_generation(backend):
+    backend.upload(io.BytesIO(b"v1"), "model.pth")
+    v1 = backend.stat("model.pth").generation
+
+    backend.upload(io.BytesIO(b"v2"), "model.pth", if_generation_match=v1)
+
+    assert backend.stat("model.pth").size == 2
+    with pytest.raises(ObjectAlreadyExistsError):
+        backend.upload(io.BytesIO(b"v3"), "model.pth", if_generation_match=v1)
+
+
+def test_local_upload__same_file_time__still_a_new_generation(tmp_path):
+    backend = LocalFilesystemBackend(str(tmp_path / "bucket"))
+    backend.upload(io.BytesIO(b"v1"), "model.pth", metadata={"version": "1"})
+    v1 = backend.stat("model.pth")
+    mtime_ns = (tmp_path / "bucket" / "model.pth").stat().st_mtime_ns
+
+    backend.upload(io.BytesIO(b"v2"), "model.pth", if_generation_match=v1.generation)
+    # As on a filesystem whose file times are too coarse to tell the two apart.
+    os.utime(tmp_path / "bucket" / "model.pth", ns=(mtime_ns, mtime_ns))
+    v2 = backend.stat("model.pth")
+
+    assert v2.generation > v1.generation
+    assert (v1.metadata, v2.metadata) == ({"version": "1"}, {})
+
+
+def test_local_upload__concurrent_replacements__only_one_wins(tmp_path):
+    backend = LocalFilesystemBackend(str(tmp_path / "bucket"))
+    backend.upload(io.BytesIO(b"v1"), "model.pth")
+    v1 = backend.stat("model.pth").generation
+
+    def replace(version):
+        try:
+            backend.upload(
+                io.BytesIO(version.encode()),
+                "model.pth",
+                metadata={"version": version},
+                if_generation_match=v1,
+            )
+        except ObjectAlreadyExistsError:
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        replaced = list(executor.map(replace, [f"v{i}" for i in range(2, 10)]))
+
+    assert replaced.count(True) == 1
+    winner = f"v{replaced.index(True) + 2}"
+    info = backend.stat("model.pth")
+    assert info.metadata == {"version": winner}
+    assert (tmp_path / "bucket" / "model.pth").read_bytes() == winner.encode()
+    assert [i.crc32c for i in backend.list_objects()] == [None]
@@ -0,0 +1,102 @@
+import io
+
+import pytest
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend
+from mozmlops.streaming_dataset import ShardWriter, StreamingDataset
+
+
+@pytest.fixture
+def storage_client():
+    client = CloudStorageAPIClient(backend=InMemoryBackend())
+    with ShardWriter(client, "dataset", shard_bytes=1024) as writer:
+        for i in range(500):
+            writer.write({"id": i, "features": [i] * 10})
+    return client
+
+
+def test_iter__reads_every_sample_in_order(storage_client):
+    dataset = StreamingDataset(storage_client, "dataset", prefetch=2)
+
+    assert len(dataset) == 500
+    assert len(dataset.index["shards"]) > 10
+    assert [sample["id"] for sample in dataset] == list(range(500))
+
+
+def test_iter__shuffle__differs_by_epoch_and_keeps_every_sample(storage_client):
+    dataset = StreamingDataset(
+        storage_client, "dataset", shuffle=True, shuffle_buffer=50
+    )
+
+    first = [sample["id"] for sample in dataset]
+    dataset.set_epoch(1)
+    second = [sample["id"] for sample in dataset]
+
+    assert sorted(first) == sorted(second) == list(range(500))
+    assert first != list(range(500))
+    assert first != second
+
+
+def test_shards__split_between_nodes_and_workers(storage_client):
+    read = []
+    for rank in range(2):
+        dataset = StreamingDataset(
+            storage_client, "dataset", shuffle=True, rank=rank, world_size=2
+        )
+        for worker in range(3):
+            read.extend(shard["path"] for shard in dataset.shards(worker, 3))
+
+    assert sorted(read) == sorted(shard["path"] for shard in dataset.index["shards"])
+
+
+def test_iter__cache_directory__later_epochs_read_locally(
+    storage_client, tmp_path, monkeypatch
+):
+    downloads = []
+    download = storage_client.backend.download
+    monkeypatch.setattr(
+        storage_client.backend,
+        "download",
+        lambda path, *args, **kwargs: (
+            downloads.append(path),
+            download(path, *args, **kwargs),
+        )[1],
+    )
+    dataset = StreamingDataset(storage_client, "dataset", cache_directory=tmp_path)
+    shards = len(dataset.index["shards"])
+
+    assert [sample["id"] for sample in dataset] == list(range(500))
+    assert [sample["id"] for sample in dataset] == list(range(500))
+    assert len(downloads) == shards + 1
+    assert dataset.cache.hits == shards
+
+
+def test_iter__stopped_early__cleans_up(storage_client, tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    samples = iter(StreamingDataset(storage_client, "dataset"))
+
+    assert next(samples)["id"] == 0
+    samples.close()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_iter__shard_changed_since_indexed__raises(storage_client, tmp_path):
+    dataset = StreamingDataset(storage_client, "dataset")
+    shard = dataset.index["shards"][1]
+    backend = storage_client.backend
+    backend.upload(
+        io.BytesIO(b"\0" * shard["bytes"]),
+        shard["path"],
+        if_generation_match=backend.stat(shard["path"]).generation,
+    )
+
+    with pytest.raises(Exception, match="does not match the index"):
+        list(dataset)
+
+    truncated = tmp_path / "truncated.bin"
+    storage_client.fetch(dataset.index["shards"][0]["path"], str(truncated))
+    truncated.write_bytes(truncated.read_bytes()[:-3])
+    with open(truncated, "rb") as f, pytest.raises(Exception, match="truncated"):
+        list(dataset._samples(f))
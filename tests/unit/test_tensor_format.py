@@ -0,0 +1,80 @@
+import io
+
+import numpy as np
+import pytest
+
+from mozmlops.cloud_storage_api_client import CloudStorageAPIClient
+from mozmlops.storage_backends import InMemoryBackend
+from mozmlops.tensor_format import (
+    ALIGNMENT,
+    TensorFile,
+    load_tensors,
+    store_tensors,
+    write_tensors,
+)
+
+
+@pytest.fixture
+def tensors():
+    return {
+        "weight": np.arange(15, dtype=np.float32).reshape(3, 5),
+        "bias": np.array([1.5, -2.0], dtype=">f8"),
+        "transposed": np.arange(6, dtype=np.int16).reshape(2, 3).T,
+        "mask": np.array([True, False, True]),
+        "step": np.int64(42),
+        "empty": np.zeros((0, 4), dtype=np.uint8),
+    }
+
+
+def test_load_tensors__round_trips_views_of_the_file(tensors, tmp_path):
+    local_path = tmp_path / "model.tensors"
+    with open(local_path, "wb") as f:
+        size = write_tensors(tensors, f, metadata={"version": "3"})
+
+    loaded = TensorFile(str(local_path))
+
+    assert size == local_path.stat().st_size
+    assert loaded.metadata == {"version": "3"}
+    assert loaded.keys() == list(tensors)
+    for name, tensor in tensors.items():
+        array = loaded[name]
+        np.testing.assert_array_equal(array, tensor)
+        assert array.shape == np.shape(tensor)
+        assert not array.flags.owndata
+        assert loaded.entries[name]["offset"] % ALIGNMENT == 0
+    assert loaded["bias"].dtype == np.dtype("<f8")
+
+
+def test_load_tensors__writes_are_copy_on_write(tensors, tmp_path):
+    local_path = tmp_path / "model.tensors"
+    with open(local_path, "wb") as f:
+        write_tensors(tensors, f)
+
+    loaded = load_tensors(str(local_path))
+    loaded["weight"][0, 0] = 100
+
+    assert load_tensors(str(local_path))["weight"][0, 0] == 0
+
+
+def test_store_tensors__streams_to_storage(tensors, tmp_path):
+    storage_client = CloudStorageAPIClient(backend=InMemoryBackend())
+    buffer = io.BytesIO()
+    write_tensors(tensors, buffer)
+
+    store_tensors(storage_client, tensors, "run/model.tensors")
+    local_path = storage_client.fetch("run/model.tensors", str(tmp_path / "model"))
+
+    assert open(local_path, "rb").read() == buffer.getvalue()
+    np.testing.assert_array_equal(load_tensors(local_path)["weight"], tensors["weight"])
+
+
+def test_tensor_file__invalid_input__raises_value_error(tmp_path):
+    not_tensors = tmp_path / "model.pkl"
+    not_tensors.write_bytes(b"\x80\x04 not a tensor file")
+
+    with pytest.raises(ValueError, match="not a tensor file"):
+        TensorFile(str(not_tensors))
+    with pytest.raises(ValueError, match="dtype object"):
+        write_tensors({"names": np.array(["a", None])}, io.BytesIO())
+    with pytest.raises(ValueError, match="Unknown framework"):
+        load_tensors(str(not_tensors), framework="jax")
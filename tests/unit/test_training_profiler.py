@@ -0,0 +1,123 @@
+import functools
+import statistics
+import time
+
+import pytest
+
+from mozmlops.training_profiler import TrainingProfiler, count_samples, tune_dataloader
+
+
+class SlowLoader:
+    """
+    Yields batches of `batch_size` numbers, taking `seconds / num_workers`
+    per batch, as if workers loaded them in parallel.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_size=4,
+        num_workers=0,
+        prefetch_factor=None,
+        pin_memory=False,
+        seconds=0.004,
+    ):
+        if batch_size > 16:
+            raise MemoryError("out of memory")
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.delay = seconds / max(num_workers, 1)
+
+    def __iter__(self):
+        for i in range(0, len(self.dataset), self.batch_size):
+            time.sleep(self.delay)
+            yield self.dataset[i : i + self.batch_size], [0] * self.batch_size
+
+
+def test_profiler__splits_step_time_between_phases():
+    profiler = TrainingProfiler(warmup_steps=2)
+
+    for inputs, labels in profiler.batches(SlowLoader(list(range(48)), seconds=0.01)):
+        with profiler.phase("forward_backward"):
+            time.sleep(0.002)
+    report = profiler.report()
+
+    assert report.steps == 10
+    assert report.samples == 40
+    assert set(report.phase_seconds) == {"data", "forward_backward", "other"}
+    assert report.bottleneck == "data"
+    assert report.fractions["data"] > 0.6
+    assert sum(report.phase_seconds.values()) == pytest.approx(report.seconds)
+    assert report.samples_per_second == pytest.approx(40 / report.seconds)
+    assert report.p50_step_seconds == pytest.approx(
+        statistics.median(profiler.step_seconds)
+    )
+    assert (
+        report.p50_step_seconds <= report.p95_step_seconds <= max(profiler.step_seconds)
+    )
+
+    metrics = profiler.instrumentation.to_prometheus()
+    assert 'mozmlops_training_seconds_count{loop="train",phase="step"} 10' in metrics
+    assert "storage" not in metrics
+
+
+def test_count_samples__finds_the_batch_dimension():
+    np = pytest.importorskip("numpy")
+
+    assert count_samples((np.zeros((8, 3)), np.zeros(8))) == 8
+    assert count_samples({"input_ids": [[1, 2], [3, 4], [5, 6]]}) == 3
+    assert count_samples(["a short text", "another"]) == 2
+    assert count_samples(np.float32(1.0)) == 1
+
+
+def test_tune_dataloader__suggests_the_fastest_settings_that_work():
+    # Steps of tens of milliseconds, so that scheduling jitter on a busy
+    # machine neither reverses the ranking nor makes a trial look unsteady.
+    result = tune_dataloader(
+        list(range(400)),
+        lambda batch: time.sleep(0.005),
+        num_workers=(0, 4),
+        batch_size=(4, 32),
+        pin_memory=(False,),
+        prefetch_factor=(2,),
+        steps=8,
+        warmup_steps=1,
+        make_loader=functools.partial(SlowLoader, seconds=0.06),
+    )
+
+    assert result.best == {
+        "num_workers": 4,
+        "prefetch_factor": 2,
+        "pin_memory": False,
+        "batch_size": 4,
+    }
+    failed = [trial for trial in result.trials if trial.error is not None]
+    assert [trial.settings["batch_size"] for trial in failed] == [32]
+    assert "MemoryError" in failed[0].error
+
+
+def test_tune_dataloader__failing_step__stops_the_loader():
+    closed = []
+
+    class Loader(SlowLoader):
+        def __iter__(self):
+            try:
+                yield from super().__iter__()
+            finally:
+                closed.append(True)
+
+    def train_step(batch):
+        raise RuntimeError("CUDA error")
+
+    result = tune_dataloader(
+        list(range(40)),
+        train_step,
+        num_workers=(0,),
+        batch_size=(4,),
+        pin_memory=(False,),
+        prefetch_factor=(2,),
+        make_loader=Loader,
+    )
+
+    assert "RuntimeError" in result.trials[0].error
+    assert closed == [True]